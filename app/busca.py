@@ -0,0 +1,107 @@
+"""
+Pesquisa de despesas por descrição e valor.
+
+A descrição é pesquisada pela coluna despesa_busca (minúsculas e sem acentos), que no
+PostgreSQL tem índice de trigramas. Valores em formato brasileiro viram faixas sobre a
+coluna valor. A coluna, os índices e o preenchimento das despesas antigas vêm da
+migração 0003.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import and_, bindparam, or_, select, update
+from app.consultas import normalizar_busca
+from app.models import Despesas
+
+NUMERO = r'\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?'
+FAIXA = re.compile(rf'^\s*(?:r\$)?\s*({NUMERO})\s*(?:-|a|ate|até|\.\.)\s*(?:r\$)?\s*({NUMERO})\s*$', re.IGNORECASE)
+VALOR = re.compile(rf'^(?:r\$)?({NUMERO})$', re.IGNORECASE)
+
+def converter_valor(numero: str):
+    """Converte '1.234,56', '85,9', '85.90' ou '120' em Decimal. Retorna (valor, tem_centavos)."""
+    if ',' in numero:
+        numero = numero.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'\d{1,3}(?:\.\d{3})+', numero):
+        numero = numero.replace('.', '')
+    try:
+        return Decimal(numero), '.' in numero
+    except InvalidOperation:
+        return None, False
+
+def interpretar_valor(termo: str):
+    """
+    Faixa [minimo, maximo) de valores pesquisada pelo termo, ou None se não for um valor.
+    '85,90' procura exatamente R$ 85,90; '85' procura de R$ 85,00 a R$ 85,99.
+    """
+    encontrado = VALOR.match(termo.strip())
+    if not encontrado:
+        return None
+
+    valor, tem_centavos = converter_valor(encontrado.group(1))
+    if valor is None:
+        return None
+    return valor, valor + (Decimal('0.01') if tem_centavos else Decimal(1))
+
+def interpretar_faixa(pesquisa: str):
+    """Faixa [minimo, maximo] informada como '50-100', '50 a 100' ou 'R$ 50..R$ 100'."""
+    encontrado = FAIXA.match(pesquisa)
+    if not encontrado:
+        return None
+
+    minimo, _ = converter_valor(encontrado.group(1))
+    maximo, _ = converter_valor(encontrado.group(2))
+    if minimo is None or maximo is None:
+        return None
+    return min(minimo, maximo), max(minimo, maximo)
+
+def filtro_pesquisa(pesquisa: str):
+    """Condição SQL da pesquisa: todas as palavras precisam aparecer na descrição ou, se forem valores, no valor."""
+    faixa = interpretar_faixa(pesquisa)
+    if faixa:
+        return and_(Despesas.valor >= faixa[0], Despesas.valor <= faixa[1])
+
+    condicoes = []
+    for palavra in normalizar_busca(pesquisa).split():
+        if palavra == 'r$':
+            continue
+
+        #Padrão completo em um único parâmetro para o planner usar o índice de trigramas
+        padrao = palavra.replace('/', '//').replace('%', '/%').replace('_', '/_')
+        condicao = Despesas.despesa_busca.like(f'%{padrao}%', escape='/')
+        faixa = interpretar_valor(palavra)
+        if faixa:
+            condicao = or_(condicao, and_(Despesas.valor >= faixa[0], Despesas.valor < faixa[1]))
+        condicoes.append(condicao)
+
+    return and_(*condicoes)
+
+def corresponde_pesquisa(pesquisa: str, descricao: str, valor):
+    """A mesma regra de filtro_pesquisa, aplicada em Python às ocorrências de recorrências."""
+    faixa = interpretar_faixa(pesquisa)
+    if faixa:
+        return faixa[0] <= valor <= faixa[1]
+
+    texto = normalizar_busca(descricao)
+    for palavra in normalizar_busca(pesquisa).split():
+        if palavra == 'r$' or palavra in texto:
+            continue
+        faixa = interpretar_valor(palavra)
+        if not faixa or not faixa[0] <= valor < faixa[1]:
+            return False
+
+    return True
+
+def preencher_busca(conexao, lote: int = 1000):
+    """Preenche despesa_busca das despesas antigas, em lotes."""
+    total = 0
+    while True:
+        despesas = conexao.execute(
+            select(Despesas.id_despesa, Despesas.despesa).filter(Despesas.despesa_busca == None).limit(lote)
+        ).all()
+        if not despesas:
+            return total
+
+        conexao.execute(
+            update(Despesas.__table__).where(Despesas.id_despesa == bindparam('b_id_despesa')).values(despesa_busca=bindparam('b_despesa_busca')),
+            [{'b_id_despesa': id_despesa, 'b_despesa_busca': normalizar_busca(despesa)} for id_despesa, despesa in despesas]
+        )
+        total += len(despesas)
@@ -0,0 +1,258 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import date
+from fastapi.encoders import jsonable_encoder
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+CACHE_TAMANHO = int(os.getenv("CACHE_TAMANHO", 10000))
+# Arquivo SQLite compartilhado entre os workers do gunicorn. Sem ele, cada processo tem o próprio cache.
+CACHE_COMPARTILHADO = os.getenv("CACHE_COMPARTILHADO")
+
+class CacheMemoria:
+    """
+    Cache LRU com expiração por tempo, local ao processo. Com mais de um worker, um
+    contador incrementado em um processo não é visto pelos outros: use CACHE_COMPARTILHADO.
+    Os contadores ficam em um LRU próprio, do mesmo tamanho máximo. Um contador descartado
+    volta com o maior valor já descartado, então nunca retorna a uma versão que já foi invalidada.
+    """
+
+    def __init__(self, tamanho_maximo: int, ttl: int):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.itens = OrderedDict()
+        self.contadores = OrderedDict()
+        self.contador_minimo = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def get(self, chave: str):
+        item = self.itens.get(chave)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self.itens[chave]
+            self.falhas += 1
+            return None
+
+        self.itens.move_to_end(chave)
+        self.acertos += 1
+        return item[1]
+
+    def set(self, chave: str, valor, ttl: int = None):
+        self.itens[chave] = (time.monotonic() + (ttl or self.ttl), valor)
+        self.itens.move_to_end(chave)
+        while len(self.itens) > self.tamanho_maximo:
+            self.itens.popitem(last=False)
+            self.remocoes += 1
+
+    def delete(self, chave: str):
+        self.itens.pop(chave, None)
+
+    def contador(self, chave: str):
+        if chave not in self.contadores:
+            return self.contador_minimo
+        self.contadores.move_to_end(chave)
+        return self.contadores[chave]
+
+    def incr(self, chave: str):
+        self.contadores[chave] = self.contadores.get(chave, self.contador_minimo) + 1
+        self.contadores.move_to_end(chave)
+        while len(self.contadores) > self.tamanho_maximo:
+            _, valor = self.contadores.popitem(last=False)
+            self.contador_minimo = max(self.contador_minimo, valor)
+        return self.contadores[chave]
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'tamanho': len(self.itens),
+            'capacidade': self.tamanho_maximo,
+            'contadores': len(self.contadores),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'remocoes': self.remocoes,
+            'taxa_acerto': self.acertos / total if total else 0,
+        }
+
+class CacheSQLite:
+    """
+    Cache em um arquivo SQLite local, compartilhado por todos os processos do host.
+    Os valores são gravados em JSON. Quando passa do tamanho máximo, saem primeiro
+    as entradas mais próximas de expirar.
+    """
+
+    LIMPEZA_A_CADA = 100
+
+    def __init__(self, caminho: str, tamanho_maximo: int, ttl: int):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        self.escritas = 0
+        self._conexao = None
+        self._pid = None
+
+    @property
+    def conexao(self):
+        #Cada processo abre a própria conexão, mesmo que o objeto tenha sido criado antes do fork
+        if self._pid != os.getpid():
+            self._conexao = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conexao.execute('PRAGMA journal_mode=WAL')
+            self._conexao.execute('PRAGMA synchronous=NORMAL')
+            self._conexao.execute('CREATE TABLE IF NOT EXISTS itens (chave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL NOT NULL)')
+            self._conexao.execute('CREATE INDEX IF NOT EXISTS itens_expira ON itens (expira)')
+            self._conexao.execute('CREATE TABLE IF NOT EXISTS contadores (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL)')
+            self._pid = os.getpid()
+        return self._conexao
+
+    def get(self, chave: str):
+        item = self.conexao.execute('SELECT valor FROM itens WHERE chave = ? AND expira >= ?', (chave, time.time())).fetchone()
+        if item is None:
+            self.falhas += 1
+            return None
+
+        self.acertos += 1
+        return json.loads(item[0])
+
+    def set(self, chave: str, valor, ttl: int = None):
+        self.conexao.execute(
+            'INSERT OR REPLACE INTO itens (chave, valor, expira) VALUES (?, ?, ?)',
+            (chave, json.dumps(valor), time.time() + (ttl or self.ttl))
+        )
+        self.escritas += 1
+        if self.escritas % self.LIMPEZA_A_CADA == 0:
+            self.limpar()
+
+    def delete(self, chave: str):
+        self.conexao.execute('DELETE FROM itens WHERE chave = ?', (chave,))
+
+    def limpar(self):
+        self.conexao.execute('DELETE FROM itens WHERE expira < ?', (time.time(),))
+        excedente = self.conexao.execute('SELECT COUNT(*) FROM itens').fetchone()[0] - self.tamanho_maximo
+        if excedente > 0:
+            self.conexao.execute('DELETE FROM itens WHERE chave IN (SELECT chave FROM itens ORDER BY expira LIMIT ?)', (excedente,))
+            self.remocoes += excedente
+
+    def contador(self, chave: str):
+        item = self.conexao.execute('SELECT valor FROM contadores WHERE chave = ?', (chave,)).fetchone()
+        return item[0] if item else 0
+
+    def incr(self, chave: str):
+        self.conexao.execute(
+            'INSERT INTO contadores (chave, valor) VALUES (?, 1) ON CONFLICT (chave) DO UPDATE SET valor = valor + 1',
+            (chave,)
+        )
+        return self.contador(chave)
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'tamanho': self.conexao.execute('SELECT COUNT(*) FROM itens').fetchone()[0],
+            'capacidade': self.tamanho_maximo,
+            'processo': os.getpid(),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'remocoes': self.remocoes,
+            'taxa_acerto': self.acertos / total if total else 0,
+        }
+
+def criar_cache(tamanho_maximo: int = CACHE_TAMANHO, ttl: int = CACHE_TTL):
+    if CACHE_COMPARTILHADO:
+        return CacheSQLite(CACHE_COMPARTILHADO, tamanho_maximo, ttl)
+    return CacheMemoria(tamanho_maximo, ttl)
+
+cache_respostas = criar_cache()
+
+def versao_usuario(id_usuario: int):
+    return cache_respostas.contador(f'versao:{id_usuario}')
+
+def invalidar_usuario(id_usuario: int):
+    """
+    Descarta as respostas em cache do usuário. As chaves incluem uma versão por usuário,
+    então basta incrementá-la; as entradas antigas deixam de ser lidas e saem pelo LRU/TTL.
+    """
+    cache_respostas.incr(f'versao:{id_usuario}')
+
+def chave_usuario(funcao, kwargs):
+    """Chave de uma chamada de rota: rota, usuário, versão do cache do usuário, dia atual e parâmetros."""
+    id_usuario = kwargs['usuario']['id_usuario']
+    parametros = sorted((nome, valor) for nome, valor in kwargs.items() if nome not in ('usuario', 'db'))
+    return f'{funcao.__module__}.{funcao.__name__}:{id_usuario}:{versao_usuario(id_usuario)}:{date.today()}:{parametros}'
+
+def cache_usuario(funcao):
+    """
+    Guarda a resposta da rota por usuário, rota, parâmetros e dia atual.
+    A rota precisa receber o usuário autenticado no parâmetro `usuario`.
+    """
+    @functools.wraps(funcao)
+    async def wrapper(*args, **kwargs):
+        chave = chave_usuario(funcao, kwargs)
+
+        resposta = cache_respostas.get(chave)
+        if resposta is None:
+            resposta = jsonable_encoder(await funcao(*args, **kwargs))
+            cache_respostas.set(chave, resposta)
+
+        return resposta
+
+    return wrapper
+
+em_andamento = {}
+estatisticas_agrupamento = {'executadas': 0, 'agrupadas': 0}
+
+class ExecucaoCancelada(Exception):
+    """Avisa quem esperava uma execução agrupada que ela foi cancelada e precisa ser refeita."""
+
+def agrupar_requisicoes(funcao):
+    """
+    Chamadas idênticas e simultâneas da rota para o mesmo usuário esperam a execução
+    que já está em andamento e recebem a mesma resposta, em vez de repetir as consultas.
+    A rota precisa receber o usuário autenticado no parâmetro `usuario`.
+    Se a execução em andamento for cancelada (o cliente dela desconectou), quem esperava
+    executa a rota de novo em vez de receber o cancelamento.
+    """
+    @functools.wraps(funcao)
+    async def wrapper(*args, **kwargs):
+        chave = chave_usuario(funcao, kwargs)
+
+        futuro = em_andamento.get(chave)
+        if futuro is not None:
+            estatisticas_agrupamento['agrupadas'] += 1
+        while futuro is not None:
+            try:
+                return await asyncio.shield(futuro)
+            except ExecucaoCancelada:
+                #A primeira a acordar vira a nova execução; as outras passam a esperar por ela
+                futuro = em_andamento.get(chave)
+
+        futuro = asyncio.get_running_loop().create_future()
+        em_andamento[chave] = futuro
+        estatisticas_agrupamento['executadas'] += 1
+        try:
+            resposta = await funcao(*args, **kwargs)
+        except asyncio.CancelledError:
+            futuro.set_exception(ExecucaoCancelada())
+            futuro.exception()
+            raise
+        except Exception as erro:
+            futuro.set_exception(erro)
+            #Evita o aviso de exceção não lida quando ninguém estava esperando
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(resposta)
+            return resposta
+        finally:
+            del em_andamento[chave]
+
+    return wrapper
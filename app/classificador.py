@@ -0,0 +1,164 @@
+"""
+Sugestão de categoria pela descrição da despesa, aprendida com as despesas do próprio usuário.
+
+Cada usuário tem um classificador Naive Bayes multinomial sobre as palavras da descrição
+(minúsculas, sem acentos e sem números) e a descrição inteira, que pesa para despesas que
+se repetem, como "Netflix" ou "Aluguel". O classificador é montado em uma passada pelas
+despesas do usuário na primeira sugestão e depois atualizado a cada despesa gravada, editada
+ou removida neste processo. Para incorporar as alterações feitas em outros workers, ele é
+remontado depois de CLASSIFICADOR_TTL segundos.
+
+A memória é limitada a CLASSIFICADOR_TERMOS palavras por usuário (as menos frequentes saem
+primeiro) e a CLASSIFICADOR_USUARIOS classificadores por processo, em LRU.
+"""
+import heapq
+import math
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from sqlalchemy import func, select
+from dotenv import load_dotenv, find_dotenv
+from app.consultas import normalizar_busca
+from app.models import Despesas
+
+load_dotenv(find_dotenv())
+
+CLASSIFICADOR_USUARIOS = int(os.getenv("CLASSIFICADOR_USUARIOS", 1000))
+CLASSIFICADOR_TERMOS = int(os.getenv("CLASSIFICADOR_TERMOS", 5000))
+CLASSIFICADOR_TTL = int(os.getenv("CLASSIFICADOR_TTL", 3600))
+LOTE_CLASSIFICADOR = 1000
+
+def termos(descricao: str):
+    #Palavras curtas e números ("Notebook - 3 de 12") não ajudam a escolher a categoria
+    palavras = re.findall(r'[a-z]{3,}', normalizar_busca(descricao) or '')
+    if not palavras:
+        return []
+    return palavras + ['=' + ' '.join(palavras)]
+
+class Classificador:
+
+    def __init__(self):
+        # termo -> {id_categoria: ocorrências}
+        self.contagens = {}
+        # id_categoria -> despesas e total de termos da categoria
+        self.despesas = Counter()
+        self.termos_categoria = Counter()
+        self.criado = time.monotonic()
+
+    def aprender(self, descricao: str, id_categoria: int, peso: int = 1):
+        """Inclui (peso 1) ou retira (peso -1) uma despesa."""
+        if id_categoria is None:
+            return
+
+        self.despesas[id_categoria] += peso
+        if self.despesas[id_categoria] <= 0:
+            del self.despesas[id_categoria]
+
+        for termo in termos(descricao):
+            por_categoria = self.contagens.get(termo)
+            if por_categoria is None:
+                #Retirar um termo que já foi podado não muda nada
+                if peso < 0:
+                    continue
+                por_categoria = self.contagens[termo] = {}
+
+            quantidade = por_categoria.get(id_categoria, 0) + peso
+            if quantidade < 0:
+                continue
+            self.termos_categoria[id_categoria] += quantidade - por_categoria.get(id_categoria, 0)
+            if quantidade:
+                por_categoria[id_categoria] = quantidade
+            else:
+                por_categoria.pop(id_categoria, None)
+                if not por_categoria:
+                    del self.contagens[termo]
+
+        if len(self.contagens) > CLASSIFICADOR_TERMOS:
+            self.podar()
+
+    def podar(self):
+        """Descarta os termos menos frequentes até sobrar 90% do limite."""
+        excedente = len(self.contagens) - int(CLASSIFICADOR_TERMOS * 0.9)
+        for termo in heapq.nsmallest(excedente, self.contagens, key=lambda termo: sum(self.contagens[termo].values())):
+            for id_categoria, quantidade in self.contagens.pop(termo).items():
+                self.termos_categoria[id_categoria] -= quantidade
+
+    def sugerir(self, descricao: str, limite: int = 3):
+        """[(id_categoria, confiança)] em ordem decrescente; vazia se nenhuma palavra for conhecida."""
+        conhecidos = [termo for termo in termos(descricao) if termo in self.contagens]
+        total = sum(self.despesas.values())
+        if not conhecidos or not total:
+            return []
+
+        vocabulario = len(self.contagens)
+        pontos = {}
+        for id_categoria, despesas in self.despesas.items():
+            denominador = self.termos_categoria[id_categoria] + vocabulario
+            pontos[id_categoria] = math.log(despesas / total) + sum(
+                math.log((self.contagens[termo].get(id_categoria, 0) + 1) / denominador) for termo in conhecidos
+            )
+
+        maximo = max(pontos.values())
+        probabilidades = {id_categoria: math.exp(valor - maximo) for id_categoria, valor in pontos.items()}
+        soma = sum(probabilidades.values())
+        melhores = heapq.nlargest(limite, probabilidades.items(), key=lambda item: item[1])
+        return [(id_categoria, probabilidade / soma) for id_categoria, probabilidade in melhores]
+
+classificadores = OrderedDict()
+
+def guardar(id_usuario: int, classificador: Classificador):
+    classificadores[id_usuario] = classificador
+    classificadores.move_to_end(id_usuario)
+    while len(classificadores) > CLASSIFICADOR_USUARIOS:
+        classificadores.popitem(last=False)
+
+async def reconstruir(db, id_usuario: int = None):
+    """
+    Monta os classificadores em uma passada pelas despesas, do usuário ou, sem id_usuario,
+    de todos (em ordem de usuário, para guardar cada um assim que termina).
+    """
+    consulta = (
+        select(Despesas.id_usuario, func.coalesce(Despesas.despesa_busca, Despesas.despesa), Despesas.id_categoria)
+        .filter(Despesas.id_categoria != None)
+        .execution_options(yield_per=LOTE_CLASSIFICADOR)
+    )
+    if id_usuario is not None:
+        consulta = consulta.filter(Despesas.id_usuario == id_usuario)
+    else:
+        consulta = consulta.order_by(Despesas.id_usuario)
+
+    atual, classificador = id_usuario, Classificador()
+    async for usuario, descricao, id_categoria in await db.stream(consulta):
+        if usuario != atual:
+            if atual is not None:
+                guardar(atual, classificador)
+            atual, classificador = usuario, Classificador()
+        classificador.aprender(descricao, id_categoria)
+
+    if atual is not None:
+        guardar(atual, classificador)
+
+async def sugerir_categorias(db, id_usuario: int, descricao: str, limite: int = 3):
+    classificador = classificadores.get(id_usuario)
+    if classificador is None or time.monotonic() - classificador.criado > CLASSIFICADOR_TTL:
+        await reconstruir(db, id_usuario)
+        classificador = classificadores[id_usuario]
+    classificadores.move_to_end(id_usuario)
+    return classificador.sugerir(descricao, limite)
+
+def atualizar_classificador(id_usuario: int, adicionadas=(), removidas=()):
+    """
+    Aplica ao classificador do usuário, se estiver carregado, as despesas gravadas ou
+    removidas, como pares (despesa, id_categoria). Chamado depois do commit.
+    """
+    classificador = classificadores.get(id_usuario)
+    if classificador is None:
+        return
+    for despesa, id_categoria in removidas:
+        classificador.aprender(despesa, id_categoria, -1)
+    for despesa, id_categoria in adicionadas:
+        classificador.aprender(despesa, id_categoria)
+
+def descartar_classificador(id_usuario: int):
+    classificadores.pop(id_usuario, None)
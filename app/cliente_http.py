@@ -0,0 +1,35 @@
+import asyncio
+import os
+import httpx
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_TIMEOUT_CONEXAO = float(os.getenv("HTTP_TIMEOUT_CONEXAO", 3))
+HTTP_CONEXOES = int(os.getenv("HTTP_CONEXOES", 20))
+
+_cliente = None
+_loop = None
+
+def cliente_http():
+    """
+    Cliente httpx assíncrono compartilhado pelo processo, com pool de conexões e timeouts.
+    As conexões pertencem ao event loop em que foram abertas, então um loop novo (como o de
+    cada requisição do TestClient) recebe um cliente novo.
+    """
+    global _cliente, _loop
+    loop = asyncio.get_running_loop()
+    if _cliente is None or _cliente.is_closed or _loop is not loop:
+        _cliente = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_TIMEOUT_CONEXAO),
+            limits=httpx.Limits(max_connections=HTTP_CONEXOES, max_keepalive_connections=HTTP_CONEXOES),
+        )
+        _loop = loop
+    return _cliente
+
+async def fechar_cliente_http():
+    global _cliente
+    if _cliente is not None and _loop is asyncio.get_running_loop():
+        await _cliente.aclose()
+    _cliente = None
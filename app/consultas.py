@@ -0,0 +1,117 @@
+import base64
+import binascii
+import json
+import math
+import re
+import unicodedata
+from datetime import date, datetime
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+GRANULARIDADES = {
+    'dia': relativedelta(days=1),
+    'semana': relativedelta(weeks=1),
+    'mes': relativedelta(months=1),
+}
+
+#Máximo de períodos de uma consulta por granularidade: um ano por dia, cinco por semana e vinte por mês
+MAXIMO_PERIODOS = {
+    'dia': 366,
+    'semana': 261,
+    'mes': 240,
+}
+
+class truncar_data(FunctionElement):
+    """
+    Trunca uma data para o início do dia, da semana (segunda-feira) ou do mês.
+    Uso: truncar_data('mes', Despesas.vencimento)
+    """
+    type = DateTime()
+    inherit_cache = True
+    name = 'truncar_data'
+    _traverse_internals = FunctionElement._traverse_internals + [('granularidade', InternalTraversal.dp_string)]
+
+    def __init__(self, granularidade, coluna):
+        self.granularidade = granularidade
+        super().__init__(coluna)
+
+@compiles(truncar_data)
+def truncar_data_postgresql(element, compiler, **kw):
+    campo = {'dia': 'day', 'semana': 'week', 'mes': 'month'}[element.granularidade]
+    return f"date_trunc('{campo}', {compiler.process(element.clauses, **kw)})"
+
+@compiles(truncar_data, 'sqlite')
+def truncar_data_sqlite(element, compiler, **kw):
+    modificador = {'dia': '', 'semana': ", 'weekday 0', '-6 days'", 'mes': ", 'start of month'"}[element.granularidade]
+    return f"date({compiler.process(element.clauses, **kw)}{modificador})"
+
+@compiles(truncar_data, 'mysql')
+def truncar_data_mysql(element, compiler, **kw):
+    coluna = compiler.process(element.clauses, **kw)
+    return {
+        'dia': f"date({coluna})",
+        'semana': f"date(date_sub({coluna}, interval weekday({coluna}) day))",
+        'mes': f"date(date_format({coluna}, '%%Y-%%m-01'))",
+    }[element.granularidade]
+
+def inicio_periodo(data: datetime, granularidade: str):
+    data = datetime(data.year, data.month, data.day)
+    if granularidade == 'semana':
+        return data - relativedelta(days=data.weekday())
+    if granularidade == 'mes':
+        return data.replace(day=1)
+    return data
+
+def chave_periodo(valor):
+    #O PostgreSQL devolve timestamp e o SQLite devolve texto 'AAAA-MM-DD'
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime('%Y-%m-%d')
+    return str(valor)[:10]
+
+def listar_periodos(inicio: datetime, fim: datetime, granularidade: str):
+    """Períodos de [inicio, fim) no formato 'AAAA-MM-DD', incluindo os que não têm despesas."""
+    periodo = inicio_periodo(inicio, granularidade)
+    periodos = []
+    while periodo < fim:
+        periodos.append(periodo.strftime('%Y-%m-%d'))
+        periodo += GRANULARIDADES[granularidade]
+    return periodos
+
+def contar_periodos(inicio: datetime, fim: datetime, granularidade: str):
+    """Quantidade de períodos que listar_periodos geraria, sem gerá-los."""
+    primeiro = inicio_periodo(inicio, granularidade)
+    if granularidade == 'mes':
+        return (fim.year - primeiro.year) * 12 + fim.month - primeiro.month + (fim > datetime(fim.year, fim.month, 1))
+    passo = GRANULARIDADES[granularidade].days * 86400
+    return math.ceil((fim - primeiro).total_seconds() / passo)
+
+def codificar_cursor(chave):
+    """Cursor opaco da paginação pela chave (vencimento, grupo, id, parcela) do último item da página."""
+    vencimento, *posicao = chave
+    dados = json.dumps([vencimento.isoformat(), *posicao]).encode()
+    return base64.urlsafe_b64encode(dados).decode()
+
+def decodificar_cursor(cursor: str):
+    """Retorna a chave (vencimento, grupo, id, parcela) ou levanta ValueError se o cursor for inválido."""
+    try:
+        vencimento, *posicao = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        #Cursores antigos só tinham (vencimento, id_despesa)
+        if len(posicao) == 1:
+            posicao = [1, posicao[0], 0]
+        grupo, id_item, parcela = (int(valor) for valor in posicao)
+        return datetime.fromisoformat(vencimento), grupo, id_item, parcela
+    except (TypeError, ValueError, json.JSONDecodeError, binascii.Error) as erro:
+        raise ValueError('Cursor inválido') from erro
+
+def normalizar_busca(texto: str):
+    """Texto em minúsculas, sem acentos e com espaços simples, usado na busca de despesas."""
+    if texto is None:
+        return None
+    sem_acentos = ''.join(
+        caractere for caractere in unicodedata.normalize('NFKD', texto)
+        if not unicodedata.combining(caractere)
+    )
+    return re.sub(r'\s+', ' ', sem_acentos).strip().lower()
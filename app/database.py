@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 import os
 
@@ -13,9 +15,119 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Drivers assíncronos por banco. Bancos fora desta lista (ex.: SQLite nos testes)
+# usam a sessão síncrona através do SyncSessionAdapter.
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+def async_database_url(url: str):
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        return None
+    return url.set(drivername=drivername)
+
+ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL)
+
+#Fora do SQLite a sessão síncrona bloqueia o event loop a cada consulta
+SEM_DRIVER_ASSINCRONO = ASYNC_DATABASE_URL is None and make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() != 'sqlite'
+
+async_engine = None
+AsyncSessionLocal = None
+
+if ASYNC_DATABASE_URL is not None:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+class ResultadoAssincrono:
+    """Result síncrono percorrido com `async for`, como o AsyncResult devolvido por AsyncSession.stream."""
+
+    def __init__(self, result):
+        self.result = result
+        self.linhas = iter(result)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.linhas)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.result.close()
+
+class SyncSessionAdapter:
+    """
+    Expõe uma Session síncrona com a mesma interface da AsyncSession usada pelos routers.
+    Usada quando o banco não possui driver assíncrono (SQLite nos testes).
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        return self.sync_session.execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return self.sync_session.scalar(statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return self.sync_session.scalars(statement, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        return ResultadoAssincrono(self.sync_session.execute(statement, *args, **kwargs))
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    async def flush(self, objects=None):
+        self.sync_session.flush(objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        self.sync_session.refresh(instance, attribute_names)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def close(self):
+        self.sync_session.close()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+async def dialeto(db):
+    """Dialeto do banco da sessão, seja ela AsyncSession ou SyncSessionAdapter."""
+    return await db.run_sync(lambda sessao: sessao.get_bind().dialect)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        db = SyncSessionAdapter(SessionLocal())
+    else:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
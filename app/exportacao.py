@@ -0,0 +1,111 @@
+"""
+Exportação das despesas em CSV ou NDJSON, gerada aos poucos enquanto as linhas chegam do banco.
+
+O CSV usa os mesmos nomes de coluna, separador e formato de valor aceitos pela importação
+(app.importacao), então um arquivo exportado pode ser importado de volta.
+"""
+import csv
+import io
+import json
+import zlib
+
+TAMANHO_BLOCO = 64 * 1024
+
+COLUNAS = ('despesa', 'valor', 'vencimento', 'pagamento', 'categoria', 'id_despesa', 'id_recorrencia', 'parcela')
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+def registro_despesa(id_despesa, despesa, valor, vencimento, pagamento, categoria):
+    return {
+        'despesa': despesa,
+        'valor': valor,
+        'vencimento': vencimento,
+        'pagamento': pagamento,
+        'categoria': categoria,
+        'id_despesa': id_despesa,
+        'id_recorrencia': None,
+        'parcela': None,
+    }
+
+def registro_ocorrencia(ocorrencia):
+    categoria = ocorrencia.recorrencia.categorias
+    return {
+        'despesa': ocorrencia.despesa,
+        'valor': ocorrencia.valor,
+        'vencimento': ocorrencia.vencimento,
+        'pagamento': ocorrencia.pagamento,
+        'categoria': categoria.categoria if categoria else None,
+        'id_despesa': None,
+        'id_recorrencia': ocorrencia.recorrencia.id_recorrencia,
+        'parcela': ocorrencia.parcela,
+    }
+
+async def intercalar(despesas, ocorrencias):
+    """
+    Registros das despesas (linhas de um resultado em stream, já em ordem decrescente de
+    vencimento e id) intercalados com as ocorrências, na mesma ordem da listagem.
+    """
+    ocorrencias = sorted(ocorrencias, key=lambda ocorrencia: ocorrencia.chave, reverse=True)
+    posicao = 0
+
+    async for linha in despesas:
+        chave = (linha.vencimento, 1, linha.id_despesa, 0)
+        while posicao < len(ocorrencias) and ocorrencias[posicao].chave > chave:
+            yield registro_ocorrencia(ocorrencias[posicao])
+            posicao += 1
+        yield registro_despesa(*linha)
+
+    for ocorrencia in ocorrencias[posicao:]:
+        yield registro_ocorrencia(ocorrencia)
+
+def formatar_csv(registro):
+    valor = f"{registro['valor']:.2f}".replace('.', ',')
+    pagamento = registro['pagamento'].isoformat() if registro['pagamento'] else ''
+    return [
+        registro['despesa'], valor, registro['vencimento'].isoformat(), pagamento, registro['categoria'] or '',
+        registro['id_despesa'] or '', registro['id_recorrencia'] or '', registro['parcela'] or '',
+    ]
+
+def formatar_ndjson(registro):
+    return json.dumps({
+        **registro,
+        'valor': str(registro['valor']),
+        'vencimento': registro['vencimento'].isoformat(),
+        'pagamento': registro['pagamento'].isoformat() if registro['pagamento'] else None,
+    }, ensure_ascii=False) + '\n'
+
+async def gerar_arquivo(registros, formato: str, compactar: bool = False):
+    """Bytes do arquivo em blocos de até TAMANHO_BLOCO, compactados em gzip se `compactar`."""
+    compactador = zlib.compressobj(6, zlib.DEFLATED, 31) if compactar else None
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';', lineterminator='\n')
+
+    def bloco(final=False):
+        dados = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        if compactador is not None:
+            dados = compactador.compress(dados)
+            if final:
+                dados += compactador.flush()
+        return dados
+
+    if formato == 'csv':
+        escritor.writerow(COLUNAS)
+
+    async for registro in registros:
+        if formato == 'csv':
+            escritor.writerow(formatar_csv(registro))
+        else:
+            buffer.write(formatar_ndjson(registro))
+
+        if buffer.tell() >= TAMANHO_BLOCO:
+            dados = bloco()
+            #O gzip acumula internamente e pode não devolver nada neste bloco
+            if dados:
+                yield dados
+
+    yield bloco(final=True)
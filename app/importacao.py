@@ -0,0 +1,180 @@
+"""
+Leitura incremental de extratos em CSV e OFX para a importação de despesas.
+
+Os leitores consomem o arquivo em blocos e devolvem uma transação por vez, então a
+memória usada não depende do tamanho do arquivo. Cada item é (linha, dados, erro):
+dados é um dicionário com despesa, valor, vencimento, pagamento e categoria, ou None
+quando a linha tem erro. Créditos do OFX, que não viram despesas, vêm sem dados e sem erro.
+"""
+import codecs
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from dateutil.parser import isoparse
+from app.busca import converter_valor
+from app.consultas import normalizar_busca
+
+TAMANHO_BLOCO = 64 * 1024
+
+#Nomes aceitos no cabeçalho do CSV, já normalizados, para cada campo
+COLUNAS = {
+    'despesa': ('despesa', 'descricao', 'historico', 'memo', 'description'),
+    'valor': ('valor', 'montante', 'amount'),
+    'vencimento': ('vencimento', 'data', 'date'),
+    'pagamento': ('pagamento', 'data pagamento', 'data_pagamento'),
+    'categoria': ('categoria', 'category'),
+}
+
+class ExtratoInvalido(ValueError):
+    pass
+
+def converter_valor_extrato(texto: str):
+    """Valor absoluto de '1.234,56', '-85,90' ou 'R$ 10'. Débitos negativos viram despesas positivas."""
+    numero = texto.strip().replace('R$', '').replace(' ', '').lstrip('+-')
+    valor = converter_valor(numero)[0] if numero else None
+    if valor is None:
+        raise ValueError(f'Valor inválido: {texto!r}')
+    return valor.quantize(Decimal('0.01'))
+
+def converter_data_extrato(texto: str):
+    texto = texto.strip()
+    #dd/mm/aaaa é o formato mais comum e o strptime domina o tempo de arquivos grandes
+    if len(texto) == 10 and texto[2] == texto[5] == '/' and texto.replace('/', '').isdigit():
+        try:
+            return datetime(int(texto[6:]), int(texto[3:5]), int(texto[:2]))
+        except ValueError:
+            raise ValueError(f'Data inválida: {texto!r}')
+    for formato in ('%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y'):
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            pass
+    try:
+        return isoparse(texto).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f'Data inválida: {texto!r}')
+
+def ler_csv(arquivo, codificacao: str = 'utf-8-sig'):
+    #StreamReader decodifica aos poucos e funciona com o SpooledTemporaryFile do UploadFile
+    texto = codecs.getreader(codificacao)(arquivo)
+    amostra = texto.readline()
+    if not amostra.strip():
+        raise ExtratoInvalido('Arquivo vazio')
+    delimitador = ';' if amostra.count(';') >= amostra.count(',') else ','
+
+    cabecalho = [normalizar_busca(coluna) for coluna in next(csv.reader([amostra], delimiter=delimitador))]
+    indices = {}
+    for campo, nomes in COLUNAS.items():
+        for nome in nomes:
+            if nome in cabecalho:
+                indices[campo] = cabecalho.index(nome)
+                break
+
+    faltando = {'despesa', 'valor', 'vencimento'} - set(indices)
+    if faltando:
+        raise ExtratoInvalido(f'Colunas obrigatórias ausentes: {", ".join(sorted(faltando))}')
+
+    leitor = csv.reader(texto, delimiter=delimitador)
+    for campos in leitor:
+        #line_num conta a partir da segunda linha do arquivo, depois do cabeçalho
+        linha = leitor.line_num + 1
+        if not any(campo.strip() for campo in campos):
+            continue
+        try:
+            valores = {campo: campos[indice].strip() if indice < len(campos) else '' for campo, indice in indices.items()}
+            if not valores['despesa']:
+                raise ValueError('Descrição vazia')
+            vencimento = converter_data_extrato(valores['vencimento'])
+            #Sem a coluna de pagamento, o lançamento do extrato já foi pago
+            if 'pagamento' in valores:
+                pagamento = converter_data_extrato(valores['pagamento']) if valores['pagamento'] else None
+            else:
+                pagamento = vencimento
+            dados = {
+                'despesa': valores['despesa'][:256],
+                'valor': converter_valor_extrato(valores['valor']),
+                'vencimento': vencimento,
+                'pagamento': pagamento,
+                'categoria': valores.get('categoria') or None,
+            }
+        except ValueError as erro:
+            yield linha, None, str(erro)
+        else:
+            yield linha, dados, None
+
+TAG_OFX = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+def codificacao_ofx(inicio: bytes):
+    if re.search(rb'ENCODING[:=]\s*"?UTF-8', inicio, re.IGNORECASE):
+        return 'utf-8'
+    return 'cp1252'
+
+def ler_ofx(arquivo):
+    """Transações (STMTTRN) do OFX, em SGML ou XML. A linha informada é a ordem da transação no arquivo."""
+    inicio = arquivo.read(TAMANHO_BLOCO)
+    decodificador = codecs.getincrementaldecoder(codificacao_ofx(inicio))(errors='replace')
+
+    pendente = ''
+    transacao = None
+    numero = 0
+    bloco = inicio
+    while True:
+        pendente += decodificador.decode(bloco, final=not bloco)
+        #Uma tag pode estar cortada no fim do bloco; o resto fica para o próximo
+        corte = max(pendente.rfind('<'), 0) if bloco else len(pendente)
+        for fechamento, tag, valor in TAG_OFX.findall(pendente[:corte]):
+            tag = tag.upper()
+            if tag == 'STMTTRN' and not fechamento:
+                transacao = {}
+                numero += 1
+            elif tag == 'STMTTRN' and fechamento and transacao is not None:
+                yield (numero, *converter_transacao_ofx(transacao))
+                transacao = None
+            elif transacao is not None and not fechamento:
+                transacao[tag] = valor.strip()
+        pendente = pendente[corte:]
+
+        if not bloco:
+            return
+        bloco = arquivo.read(TAMANHO_BLOCO)
+
+def converter_transacao_ofx(transacao: dict):
+    try:
+        valor_texto = transacao.get('TRNAMT', '')
+        if not valor_texto.startswith('-'):
+            return None, None
+        data = transacao.get('DTPOSTED', '')
+        if not re.match(r'^\d{8}', data):
+            raise ValueError(f'Data inválida: {data!r}')
+        data = datetime(int(data[:4]), int(data[4:6]), int(data[6:8]))
+        descricao = transacao.get('MEMO') or transacao.get('NAME')
+        if not descricao:
+            raise ValueError('Descrição vazia')
+        #O OFX usa ponto como separador decimal, mas alguns bancos exportam vírgula
+        try:
+            valor = Decimal(valor_texto.lstrip('-').replace(',', '.')).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f'Valor inválido: {valor_texto!r}')
+    except ValueError as erro:
+        return None, str(erro)
+
+    return {
+        'despesa': descricao[:256],
+        'valor': valor,
+        'vencimento': data,
+        'pagamento': data,
+        'categoria': None,
+    }, None
+
+def ler_extrato(arquivo, nome_arquivo: str, codificacao: str = 'utf-8-sig'):
+    """Escolhe o leitor pela extensão ou, sem ela, pelo começo do arquivo."""
+    nome_arquivo = (nome_arquivo or '').lower()
+    if nome_arquivo.endswith(('.ofx', '.qfx')):
+        return ler_ofx(arquivo)
+    if not nome_arquivo.endswith(('.csv', '.txt')):
+        inicio = arquivo.read(512)
+        arquivo.seek(0)
+        if b'OFXHEADER' in inicio or b'<OFX>' in inicio.upper():
+            return ler_ofx(arquivo)
+    return ler_csv(arquivo, codificacao)
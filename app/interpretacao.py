@@ -0,0 +1,178 @@
+"""
+Interpretação local de despesas descritas em frases curtas, como "mercado 85,90 hoje pago".
+
+Reconhece um valor em reais, datas relativas ("hoje", "ontem", "amanhã", "dia 10", "10/01"),
+indicações de pago ou em aberto e a categoria, pelo nome das categorias do usuário ou por
+palavras associadas às categorias padrão. Só responde quando a frase não é ambígua: um único
+valor, no máximo uma data, uma única categoria e uma descrição. Nos demais casos devolve None
+e o /chatgpt consulta o modelo.
+"""
+import re
+import unicodedata
+from datetime import date, datetime, time
+from dateutil.relativedelta import relativedelta
+from app.busca import NUMERO, converter_valor
+from app.consultas import normalizar_busca
+
+# Frases mais longas costumam ter mais de uma despesa ou detalhes que só o modelo entende
+MAXIMO_PALAVRAS = 12
+
+# Listas separadas por linha, ';' ou ', ' antes de uma palavra (a vírgula dos centavos fica)
+SEPARADOR_LISTA = re.compile(r'[;\n]|,\s+(?=[^\W\d_])')
+
+DIAS_RELATIVOS = {
+    'depois de amanha': 2,
+    'anteontem': -2,
+    'ontem': -1,
+    'hoje': 0,
+    'amanha': 1,
+}
+
+DATA_RELATIVA = re.compile(r'\b(' + '|'.join(DIAS_RELATIVOS) + r')\b')
+DATA_DIA_MES = re.compile(r'(?<![\w/])(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?(?![\w/])')
+DATA_DIA = re.compile(r'\bdia (\d{1,2})\b')
+VALOR = re.compile(rf'(?<![\w/,.$])(?:r\$\s*)?({NUMERO})(?:\s*(?:reais|real|contos?))?(?![\w/]|[.,]\d)')
+ABERTO = re.compile(r'\b(a pagar|nao pag[oa]|pendente|em aberto|falta pagar|vence|vencendo|vencimento)\b')
+PAGO = re.compile(r'\b(pag[oa]|paguei|pagamos|quitad[oa]|quitei|gastei|comprei)\b')
+
+PALAVRAS_IGNORADAS = {'na', 'no', 'nas', 'nos', 'de', 'do', 'da', 'dos', 'das', 'em', 'com', 'o', 'a', 'e', 'pra', 'para', 'por', 'foi', 'r$'}
+
+# Palavras associadas às categorias padrão (sql/default_categorias.sql), pelo nome normalizado
+PALAVRAS_CATEGORIAS = {
+    'alimentacao': ('mercado', 'supermercado', 'padaria', 'restaurante', 'lanche', 'lanchonete', 'almoco', 'jantar', 'ifood', 'feira', 'acougue', 'pizza', 'hortifruti'),
+    'transporte': ('uber', 'onibus', 'metro', 'gasolina', 'combustivel', 'estacionamento', 'pedagio', 'taxi', 'passagem de onibus'),
+    'saude': ('farmacia', 'remedio', 'remedios', 'consulta', 'medico', 'dentista', 'exame', 'plano de saude'),
+    'educacao': ('escola', 'faculdade', 'curso', 'livro', 'livros', 'material escolar'),
+    'viagens': ('hotel', 'hospedagem', 'airbnb', 'passagem aerea'),
+    'investimentos': ('investimento', 'tesouro direto', 'cdb', 'acoes'),
+    'moradia': ('aluguel', 'condominio', 'iptu', 'conta de luz', 'conta de agua', 'energia', 'gas'),
+    'eletronicos': ('celular', 'notebook', 'computador', 'fone', 'televisao'),
+    'roupas': ('roupa', 'camisa', 'camiseta', 'calca', 'sapato', 'tenis', 'vestido'),
+    'internet': ('wifi', 'fibra', 'banda larga'),
+    'streaming': ('netflix', 'spotify', 'disney', 'prime video', 'hbo', 'globoplay', 'youtube premium'),
+    'contas a pagar': ('boleto', 'fatura', 'cartao de credito'),
+}
+
+def normalizar_posicoes(texto: str):
+    """Minúsculas e sem acentos, com o mesmo tamanho do texto, para que as posições coincidam."""
+    return ''.join(unicodedata.normalize('NFKD', caractere)[0] for caractere in texto.lower())
+
+class Frase:
+    """Texto normalizado em que os trechos já interpretados são apagados, guardando as posições."""
+
+    def __init__(self, texto: str):
+        self.texto = texto
+        self.normalizado = normalizar_posicoes(texto)
+        self.trechos = []
+
+    def encontrar(self, padrao: re.Pattern):
+        encontrados = list(padrao.finditer(self.normalizado))
+        for encontrado in encontrados:
+            inicio, fim = encontrado.span()
+            self.normalizado = self.normalizado[:inicio] + ' ' * (fim - inicio) + self.normalizado[fim:]
+            self.trechos.append((inicio, fim))
+        return encontrados
+
+    def restante(self):
+        """Texto original sem os trechos interpretados e sem palavras de ligação nas pontas."""
+        caracteres = list(self.texto)
+        for inicio, fim in self.trechos:
+            caracteres[inicio:fim] = ' ' * (fim - inicio)
+        palavras = ''.join(caracteres).split()
+        while palavras and normalizar_busca(palavras[0]) in PALAVRAS_IGNORADAS:
+            palavras.pop(0)
+        while palavras and normalizar_busca(palavras[-1]) in PALAVRAS_IGNORADAS:
+            palavras.pop()
+        return ' '.join(palavras).strip(' ,.;-')
+
+def contem(texto: str, termo: str):
+    return re.search(rf'\b{re.escape(termo)}\b', texto) is not None
+
+def interpretar_data(frase: Frase, hoje: datetime):
+    """Vencimento citado na frase, hoje se nenhum, ou None se houver mais de um ou for inválido."""
+    relativas = frase.encontrar(DATA_RELATIVA)
+    completas = frase.encontrar(DATA_DIA_MES)
+    dias = frase.encontrar(DATA_DIA)
+    if len(relativas) + len(completas) + len(dias) > 1:
+        return None
+
+    try:
+        if relativas:
+            return hoje + relativedelta(days=DIAS_RELATIVOS[relativas[0].group(1)])
+        if completas:
+            dia, mes, ano = completas[0].groups()
+            ano = int(ano) if ano else hoje.year
+            return datetime(ano + 2000 if ano < 100 else ano, int(mes), int(dia))
+        if dias:
+            return hoje.replace(day=int(dias[0].group(1)))
+    except ValueError:
+        return None
+    return hoje
+
+def interpretar_categoria(frase: Frase, categorias):
+    """id_categoria da única categoria citada, pelo nome ou pelas palavras associadas."""
+    texto = frase.normalizado
+    nomes = {}
+    for id_categoria, categoria in categorias:
+        nomes.setdefault(normalizar_busca(categoria), id_categoria)
+
+    pelo_nome = {
+        id_categoria for nome, id_categoria in nomes.items()
+        if contem(texto, nome) or (nome.endswith('s') and contem(texto, nome[:-1]))
+    }
+    if len(pelo_nome) == 1:
+        return pelo_nome.pop()
+    if pelo_nome:
+        return None
+
+    pelas_palavras = {
+        nomes[nome] for nome, palavras in PALAVRAS_CATEGORIAS.items()
+        if nome in nomes and any(contem(texto, palavra) for palavra in palavras)
+    }
+    return pelas_palavras.pop() if len(pelas_palavras) == 1 else None
+
+def interpretar_despesa(texto: str, categorias, hoje: datetime = None):
+    """
+    Despesa no mesmo formato da resposta do modelo (despesa, valor, id_categoria, vencimento
+    e pagamento) ou None se a frase não for interpretada com segurança.
+    `categorias` são pares (id_categoria, categoria).
+    """
+    hoje = hoje or datetime.combine(date.today(), time())
+    if not texto or len(texto.split()) > MAXIMO_PALAVRAS:
+        return None
+
+    frase = Frase(texto)
+    id_categoria = interpretar_categoria(frase, categorias)
+    vencimento = interpretar_data(frase, hoje)
+
+    aberto = frase.encontrar(ABERTO)
+    pago = frase.encontrar(PAGO)
+    valores = frase.encontrar(VALOR)
+
+    if id_categoria is None or vencimento is None or (aberto and pago) or len(valores) != 1:
+        return None
+
+    valor, _ = converter_valor(valores[0].group(1))
+    despesa = frase.restante()
+    if not valor or not re.search(r'[^\W\d_]', despesa):
+        return None
+
+    pagamento = None
+    if pago:
+        pagamento = min(vencimento, hoje)
+
+    return {
+        'despesa': (despesa[0].upper() + despesa[1:])[:256],
+        'valor': f'{valor:.2f}',
+        'id_categoria': id_categoria,
+        'vencimento': vencimento.isoformat(),
+        'pagamento': pagamento.isoformat() if pagamento else None,
+    }
+
+def interpretar_despesas(texto: str, categorias, hoje: datetime = None):
+    """Uma despesa por item de uma lista ("mercado 85,90; uber 20 ontem"), ou None se algum item não for interpretado."""
+    itens = [item for item in SEPARADOR_LISTA.split(texto or '') if item.strip()]
+    despesas = [interpretar_despesa(item, categorias, hoje) for item in itens]
+    if not despesas or None in despesas:
+        return None
+    return despesas
@@ -0,0 +1,126 @@
+"""
+Validação dos tokens de login social.
+
+O ID token do Google é um JWT assinado (RS256): a assinatura, o emissor, o cliente (`aud`),
+a validade e o e-mail verificado são conferidos localmente com as chaves públicas do Google, que ficam em
+memória pelo tempo do Cache-Control da resposta. Um `kid` desconhecido força uma nova busca
+das chaves, no máximo uma vez a cada CHAVES_INTERVALO_MINIMO segundos. O token do Facebook
+é opaco e continua sendo validado na Graph API.
+"""
+import hashlib
+import os
+import re
+import time
+import httpx
+from jose import jwt, JWTError
+from dotenv import load_dotenv, find_dotenv
+from app.cliente_http import cliente_http
+
+load_dotenv(find_dotenv())
+
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+# IDs de cliente OAuth aceitos no `aud`, separados por vírgula. Vazio desativa o login com Google.
+GOOGLE_CLIENT_IDS = [cliente for cliente in os.getenv("GOOGLE_CLIENT_ID", "").split(",") if cliente]
+GOOGLE_EMISSORES = ('accounts.google.com', 'https://accounts.google.com')
+FACEBOOK_GRAPH_URL = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com")
+
+CHAVES_TTL_PADRAO = 3600
+CHAVES_INTERVALO_MINIMO = 60
+
+PROVEDORES = ('google', 'facebook')
+
+def resumo_token(token: str):
+    """SHA-256 do token do provedor, guardado em LoginSocial.token_hash no lugar do token."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class LoginSocialInvalido(Exception):
+    pass
+
+class ProvedorIndisponivel(Exception):
+    pass
+
+class ProvedorNaoConfigurado(Exception):
+    pass
+
+class ChavesGoogle:
+
+    def __init__(self):
+        self.chaves = {}
+        self.expira = 0
+        self.atualizado = None
+        self.buscas = 0
+
+    async def atualizar(self):
+        try:
+            response = await cliente_http().get(GOOGLE_CERTS_URL)
+            response.raise_for_status()
+            chaves = response.json()['keys']
+        except (httpx.HTTPError, ValueError, KeyError) as erro:
+            raise ProvedorIndisponivel('Erro ao buscar as chaves do Google') from erro
+
+        max_age = re.search(r'max-age=(\d+)', response.headers.get('cache-control', ''))
+        self.chaves = {chave['kid']: chave for chave in chaves}
+        self.expira = time.monotonic() + (int(max_age.group(1)) if max_age else CHAVES_TTL_PADRAO)
+        self.atualizado = time.monotonic()
+        self.buscas += 1
+
+    async def buscar(self, kid: str):
+        agora = time.monotonic()
+        if agora >= self.expira:
+            await self.atualizar()
+        elif kid not in self.chaves and agora - self.atualizado >= CHAVES_INTERVALO_MINIMO:
+            #O Google troca as chaves periodicamente; um token novo pode chegar antes de a cache expirar
+            await self.atualizar()
+        return self.chaves.get(kid)
+
+chaves_google = ChavesGoogle()
+
+async def verificar_token_google(token: str):
+    """Claims do ID token (email, name, ...), no mesmo formato da resposta do tokeninfo."""
+    #Sem a lista de clientes, tokens emitidos para qualquer outro app seriam aceitos
+    if not GOOGLE_CLIENT_IDS:
+        raise ProvedorNaoConfigurado('GOOGLE_CLIENT_ID não configurado')
+
+    try:
+        cabecalho = jwt.get_unverified_header(token)
+    except JWTError:
+        raise LoginSocialInvalido()
+
+    chave = await chaves_google.buscar(cabecalho.get('kid'))
+    if chave is None:
+        raise LoginSocialInvalido()
+
+    #O jose confere um cliente por vez no `aud`
+    for cliente in GOOGLE_CLIENT_IDS:
+        try:
+            claims = jwt.decode(
+                token, chave, algorithms=['RS256'], issuer=GOOGLE_EMISSORES, audience=cliente,
+                options={'verify_at_hash': False, 'require_exp': True},
+            )
+            break
+        except JWTError:
+            continue
+    else:
+        raise LoginSocialInvalido()
+
+    #O usuário é encontrado pelo e-mail, então ele precisa ter sido confirmado pelo Google
+    if not claims.get('email') or claims.get('email_verified') not in (True, 'true'):
+        raise LoginSocialInvalido()
+
+    return claims
+
+async def buscar_usuario_facebook(token: str):
+    try:
+        response = await cliente_http().get(f'{FACEBOOK_GRAPH_URL}/me', params={'fields': 'id,name,email', 'access_token': token})
+    except httpx.HTTPError as erro:
+        raise ProvedorIndisponivel('Erro ao acessar o Facebook') from erro
+
+    if response.status_code >= 500:
+        raise ProvedorIndisponivel('Erro ao acessar o Facebook')
+    if response.status_code != 200:
+        raise LoginSocialInvalido()
+
+    dados = response.json()
+    if not dados.get('email'):
+        raise LoginSocialInvalido()
+    return dados
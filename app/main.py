@@ -1,3 +1,5 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.params import Body
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,14 +8,24 @@ from typing import Annotated
 from sqlalchemy.orm import Session
 
 from app.routers import chatgpt, dashboard
-from .routers import auth, conta, icone, categoria, despesa
-from .models import Base
-from .database import engine, get_db
+from .routers import auth, conta, icone, categoria, despesa, recorrencia, tarefa
+from .database import get_db
+from .cliente_http import fechar_cliente_http
+from . import database, login_social
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not login_social.GOOGLE_CLIENT_IDS:
+        logging.getLogger(__name__).warning('GOOGLE_CLIENT_ID não configurado: o login com Google fica desativado')
+    if database.SEM_DRIVER_ASSINCRONO:
+        logging.getLogger(__name__).warning('Banco sem driver assíncrono: as consultas usam a sessão síncrona e bloqueiam o event loop')
+    yield
+    await fechar_cliente_http()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,11 +39,11 @@ app.include_router(auth.router)
 app.include_router(dashboard.router)
 app.include_router(conta.router)
 app.include_router(despesa.router)
+app.include_router(recorrencia.router)
 app.include_router(categoria.router)
 app.include_router(icone.router)
 app.include_router(chatgpt.router)
-
-Base.metadata.create_all(bind=engine)
+app.include_router(tarefa.router)
 
 #db_dependency = Annotated[Session, Depends(get_db)]
 
@@ -0,0 +1,38 @@
+"""
+Migrações do banco de dados (Alembic).
+
+O esquema não é mais criado quando a aplicação sobe. Para criar ou atualizar o banco
+configurado em SQLALCHEMY_DATABASE_URL:
+
+    python -m app.migrations upgrade head
+
+Os demais comandos do Alembic funcionam da mesma forma, por exemplo:
+
+    python -m app.migrations revision --autogenerate -m "descricao"
+    python -m app.migrations current
+"""
+import os
+from alembic import op
+from alembic.config import Config
+from sqlalchemy import inspect
+
+def configuracao(url: str = None):
+    """Configuração do Alembic sem alembic.ini, para que as migrações acompanhem o pacote app."""
+    config = Config()
+    config.set_main_option('script_location', os.path.dirname(os.path.abspath(__file__)))
+    if url:
+        #O ConfigParser interpreta '%' em senhas codificadas na URL
+        config.set_main_option('sqlalchemy.url', url.replace('%', '%%'))
+    return config
+
+# Bancos criados antes das migrações (pelo create_all na subida da aplicação) já têm parte
+# do esquema, então as primeiras revisões só criam o que ainda não existe.
+
+def tabela_existe(tabela: str):
+    return inspect(op.get_bind()).has_table(tabela)
+
+def colunas(tabela: str):
+    return {coluna['name'] for coluna in inspect(op.get_bind()).get_columns(tabela)}
+
+def indices(tabela: str):
+    return {indice['name'] for indice in inspect(op.get_bind()).get_indexes(tabela)}
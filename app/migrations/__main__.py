@@ -0,0 +1,9 @@
+from alembic.config import CommandLine
+from app.migrations import configuracao
+
+if __name__ == '__main__':
+    linha_comando = CommandLine(prog='python -m app.migrations')
+    opcoes = linha_comando.parser.parse_args()
+    if not hasattr(opcoes, 'cmd'):
+        linha_comando.parser.error('informe um comando, ex.: upgrade head')
+    linha_comando.run_cmd(configuracao(), opcoes)
@@ -0,0 +1,41 @@
+from alembic import context
+from sqlalchemy import create_engine
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.models import Base
+
+target_metadata = Base.metadata
+
+def database_url():
+    return context.config.get_main_option('sqlalchemy.url') or SQLALCHEMY_DATABASE_URL
+
+def run_migrations_offline():
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={'paramstyle': 'named'},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    engine = create_engine(database_url())
+
+    with engine.connect() as conexao:
+        context.configure(
+            connection=conexao,
+            target_metadata=target_metadata,
+            #O SQLite não altera colunas e constraints com ALTER TABLE
+            render_as_batch=conexao.dialect.name == 'sqlite',
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+    engine.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
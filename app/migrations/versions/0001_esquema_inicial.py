@@ -0,0 +1,88 @@
+"""Esquema inicial: usuários, login social, ícones, categorias e despesas
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrations import tabela_existe
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if not tabela_existe('usuarios'):
+        op.create_table(
+            'usuarios',
+            sa.Column('id_usuario', sa.Integer(), nullable=False),
+            sa.Column('nome', sa.String(256), nullable=False),
+            sa.Column('email', sa.String(256), nullable=False),
+            sa.Column('senha', sa.String(2048), nullable=False),
+            sa.Column('limite_gastos', sa.DECIMAL(10, 2), nullable=False),
+            sa.Column('status', sa.Boolean(), nullable=True),
+            sa.Column('criado', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id_usuario'),
+            sa.UniqueConstraint('email'),
+        )
+        op.create_index('ix_usuarios_id_usuario', 'usuarios', ['id_usuario'])
+
+    if not tabela_existe('icones'):
+        op.create_table(
+            'icones',
+            sa.Column('id_icone', sa.Integer(), nullable=False),
+            sa.Column('icone', sa.String(256), nullable=False),
+            sa.PrimaryKeyConstraint('id_icone'),
+        )
+        op.create_index('ix_icones_id_icone', 'icones', ['id_icone'])
+
+    if not tabela_existe('categorias'):
+        op.create_table(
+            'categorias',
+            sa.Column('id_categoria', sa.Integer(), nullable=False),
+            sa.Column('id_usuario', sa.Integer(), nullable=True),
+            sa.Column('id_icone', sa.Integer(), nullable=True),
+            sa.Column('categoria', sa.String(256), nullable=False),
+            sa.Column('status', sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(['id_icone'], ['icones.id_icone']),
+            sa.ForeignKeyConstraint(['id_usuario'], ['usuarios.id_usuario']),
+            sa.PrimaryKeyConstraint('id_categoria'),
+        )
+        op.create_index('ix_categorias_id_categoria', 'categorias', ['id_categoria'])
+
+    if not tabela_existe('login_social'):
+        op.create_table(
+            'login_social',
+            sa.Column('id_login_social', sa.Integer(), nullable=False),
+            sa.Column('id_usuario', sa.Integer(), nullable=True),
+            sa.Column('token', sa.String(2048), nullable=False),
+            sa.Column('provedor', sa.String(256), nullable=True),
+            sa.ForeignKeyConstraint(['id_usuario'], ['usuarios.id_usuario']),
+            sa.PrimaryKeyConstraint('id_login_social'),
+        )
+        op.create_index('ix_login_social_id_login_social', 'login_social', ['id_login_social'])
+
+    if not tabela_existe('despesas'):
+        op.create_table(
+            'despesas',
+            sa.Column('id_despesa', sa.Integer(), nullable=False),
+            sa.Column('id_usuario', sa.Integer(), nullable=True),
+            sa.Column('id_categoria', sa.Integer(), nullable=True),
+            sa.Column('despesa', sa.String(256), nullable=False),
+            sa.Column('valor', sa.DECIMAL(10, 2), nullable=False),
+            sa.Column('vencimento', sa.DateTime(), nullable=False),
+            sa.Column('pagamento', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['id_categoria'], ['categorias.id_categoria']),
+            sa.ForeignKeyConstraint(['id_usuario'], ['usuarios.id_usuario']),
+            sa.PrimaryKeyConstraint('id_despesa'),
+        )
+        op.create_index('ix_despesas_id_despesa', 'despesas', ['id_despesa'])
+
+def downgrade():
+    op.drop_table('despesas')
+    op.drop_table('login_social')
+    op.drop_table('categorias')
+    op.drop_table('icones')
+    op.drop_table('usuarios')
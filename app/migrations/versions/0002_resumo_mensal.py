@@ -0,0 +1,92 @@
+"""Resumo mensal das despesas por usuário e categoria
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:10:00
+"""
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from alembic import op
+import sqlalchemy as sa
+from app.migrations import tabela_existe
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+#Tabelas como eram nesta revisão, para a migração não depender dos models atuais
+despesas = sa.table(
+    'despesas',
+    sa.column('id_usuario', sa.Integer),
+    sa.column('id_categoria', sa.Integer),
+    sa.column('valor', sa.Numeric(10, 2)),
+    sa.column('vencimento', sa.DateTime),
+    sa.column('pagamento', sa.DateTime),
+)
+
+resumo_mensal = sa.table(
+    'resumo_mensal',
+    sa.column('id_usuario', sa.Integer),
+    sa.column('id_categoria', sa.Integer),
+    sa.column('mes', sa.DateTime),
+    sa.column('quantidade', sa.Integer),
+    sa.column('valor', sa.Numeric(14, 2)),
+    sa.column('quantidade_paga', sa.Integer),
+    sa.column('valor_pago', sa.Numeric(14, 2)),
+)
+
+def preencher_resumo(conexao):
+    """Resumo mensal a partir das despesas existentes, somado em Python para funcionar em qualquer banco."""
+    resumo = {}
+    linhas = conexao.execution_options(yield_per=1000).execute(
+        sa.select(despesas.c.id_usuario, despesas.c.id_categoria, despesas.c.valor, despesas.c.vencimento, despesas.c.pagamento)
+        .where(despesas.c.id_usuario != None)
+    )
+    for id_usuario, id_categoria, valor, vencimento, pagamento in linhas:
+        chave = (id_usuario, datetime(vencimento.year, vencimento.month, 1), id_categoria)
+        valor = Decimal(str(valor)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        quantidade, total, quantidade_paga, total_pago = resumo.get(chave, (0, Decimal(0), 0, Decimal(0)))
+        if pagamento is not None:
+            quantidade_paga += 1
+            total_pago += valor
+        resumo[chave] = (quantidade + 1, total + valor, quantidade_paga, total_pago)
+
+    conexao.execute(resumo_mensal.delete())
+    if resumo:
+        conexao.execute(resumo_mensal.insert(), [
+            {
+                'id_usuario': id_usuario,
+                'mes': mes,
+                'id_categoria': id_categoria,
+                'quantidade': quantidade,
+                'valor': valor,
+                'quantidade_paga': quantidade_paga,
+                'valor_pago': valor_pago,
+            }
+            for (id_usuario, mes, id_categoria), (quantidade, valor, quantidade_paga, valor_pago) in resumo.items()
+        ])
+
+def upgrade():
+    if not tabela_existe('resumo_mensal'):
+        op.create_table(
+            'resumo_mensal',
+            sa.Column('id_resumo', sa.Integer(), nullable=False),
+            sa.Column('id_usuario', sa.Integer(), nullable=False),
+            sa.Column('id_categoria', sa.Integer(), nullable=True),
+            sa.Column('mes', sa.DateTime(), nullable=False),
+            sa.Column('quantidade', sa.Integer(), nullable=False),
+            sa.Column('valor', sa.DECIMAL(14, 2), nullable=False),
+            sa.Column('quantidade_paga', sa.Integer(), nullable=False),
+            sa.Column('valor_pago', sa.DECIMAL(14, 2), nullable=False),
+            sa.ForeignKeyConstraint(['id_categoria'], ['categorias.id_categoria']),
+            sa.ForeignKeyConstraint(['id_usuario'], ['usuarios.id_usuario']),
+            sa.PrimaryKeyConstraint('id_resumo'),
+            sa.UniqueConstraint('id_usuario', 'mes', 'id_categoria'),
+        )
+        op.create_index('ix_resumo_mensal_id_resumo', 'resumo_mensal', ['id_resumo'])
+
+    preencher_resumo(op.get_bind())
+
+def downgrade():
+    op.drop_table('resumo_mensal')
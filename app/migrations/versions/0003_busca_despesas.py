@@ -0,0 +1,69 @@
+"""Coluna de pesquisa das despesas e índices da pesquisa
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:20:00
+"""
+import re
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+from app.migrations import colunas, indices
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+#Tabela e normalização como eram nesta revisão, para a migração não depender do código atual
+despesas = sa.table(
+    'despesas',
+    sa.column('id_despesa', sa.Integer),
+    sa.column('despesa', sa.String),
+    sa.column('despesa_busca', sa.String),
+)
+
+def normalizar_busca(texto: str):
+    if texto is None:
+        return None
+    sem_acentos = ''.join(
+        caractere for caractere in unicodedata.normalize('NFKD', texto)
+        if not unicodedata.combining(caractere)
+    )
+    return re.sub(r'\s+', ' ', sem_acentos).strip().lower()
+
+def preencher_busca(conexao, lote: int = 1000):
+    while True:
+        linhas = conexao.execute(
+            sa.select(despesas.c.id_despesa, despesas.c.despesa).where(despesas.c.despesa_busca == None).limit(lote)
+        ).all()
+        if not linhas:
+            return
+        conexao.execute(
+            despesas.update().where(despesas.c.id_despesa == sa.bindparam('b_id')).values(despesa_busca=sa.bindparam('b_busca')),
+            [{'b_id': id_despesa, 'b_busca': normalizar_busca(despesa)} for id_despesa, despesa in linhas]
+        )
+
+def upgrade():
+    if 'despesa_busca' not in colunas('despesas'):
+        op.add_column('despesas', sa.Column('despesa_busca', sa.String(256), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    existentes = indices('despesas')
+    if 'ix_despesas_despesa_busca' not in existentes:
+        op.create_index(
+            'ix_despesas_despesa_busca', 'despesas', ['despesa_busca'],
+            postgresql_using='gin', postgresql_ops={'despesa_busca': 'gin_trgm_ops'}
+        )
+    if 'ix_despesas_usuario_valor' not in existentes:
+        op.create_index('ix_despesas_usuario_valor', 'despesas', ['id_usuario', 'valor'])
+
+    preencher_busca(op.get_bind())
+
+def downgrade():
+    op.drop_index('ix_despesas_usuario_valor', table_name='despesas')
+    op.drop_index('ix_despesas_despesa_busca', table_name='despesas')
+    with op.batch_alter_table('despesas') as batch_op:
+        batch_op.drop_column('despesa_busca')
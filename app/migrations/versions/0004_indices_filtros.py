@@ -0,0 +1,30 @@
+"""Índices compostos dos filtros por usuário, período e situação
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:30:00
+"""
+from alembic import op
+from app.migrations import indices
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    existentes = indices('despesas')
+    #Listagem paginada (vencimento, id_despesa) e dashboards por período
+    if 'ix_despesas_usuario_vencimento' not in existentes:
+        op.create_index('ix_despesas_usuario_vencimento', 'despesas', ['id_usuario', 'vencimento', 'id_despesa'])
+    #Despesas em aberto (pagamento IS NULL) ou pagas, seguidas do período
+    if 'ix_despesas_usuario_pagamento' not in existentes:
+        op.create_index('ix_despesas_usuario_pagamento', 'despesas', ['id_usuario', 'pagamento', 'vencimento'])
+
+    if 'ix_categorias_usuario_status' not in indices('categorias'):
+        op.create_index('ix_categorias_usuario_status', 'categorias', ['id_usuario', 'status'])
+
+def downgrade():
+    op.drop_index('ix_categorias_usuario_status', table_name='categorias')
+    op.drop_index('ix_despesas_usuario_pagamento', table_name='despesas')
+    op.drop_index('ix_despesas_usuario_vencimento', table_name='despesas')
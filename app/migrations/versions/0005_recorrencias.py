@@ -0,0 +1,51 @@
+"""Recorrências: regras de despesas mensais e alterações por ocorrência
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'recorrencias',
+        sa.Column('id_recorrencia', sa.Integer(), nullable=False),
+        sa.Column('id_usuario', sa.Integer(), nullable=False),
+        sa.Column('id_categoria', sa.Integer(), nullable=True),
+        sa.Column('despesa', sa.String(256), nullable=False),
+        sa.Column('valor', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('dia_vencimento', sa.Integer(), nullable=False),
+        sa.Column('inicio', sa.DateTime(), nullable=False),
+        sa.Column('parcelas', sa.Integer(), nullable=True),
+        sa.Column('fim', sa.DateTime(), nullable=True),
+        sa.Column('criado', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['id_categoria'], ['categorias.id_categoria']),
+        sa.ForeignKeyConstraint(['id_usuario'], ['usuarios.id_usuario']),
+        sa.PrimaryKeyConstraint('id_recorrencia'),
+    )
+    op.create_index('ix_recorrencias_id_recorrencia', 'recorrencias', ['id_recorrencia'])
+    op.create_index('ix_recorrencias_usuario_inicio', 'recorrencias', ['id_usuario', 'inicio'])
+
+    op.create_table(
+        'ocorrencias_recorrencia',
+        sa.Column('id_ocorrencia', sa.Integer(), nullable=False),
+        sa.Column('id_recorrencia', sa.Integer(), nullable=False),
+        sa.Column('parcela', sa.Integer(), nullable=False),
+        sa.Column('valor', sa.DECIMAL(10, 2), nullable=True),
+        sa.Column('pagamento', sa.DateTime(), nullable=True),
+        sa.Column('removida', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['id_recorrencia'], ['recorrencias.id_recorrencia']),
+        sa.PrimaryKeyConstraint('id_ocorrencia'),
+        sa.UniqueConstraint('id_recorrencia', 'parcela'),
+    )
+    op.create_index('ix_ocorrencias_recorrencia_id_ocorrencia', 'ocorrencias_recorrencia', ['id_ocorrencia'])
+
+def downgrade():
+    op.drop_table('ocorrencias_recorrencia')
+    op.drop_table('recorrencias')
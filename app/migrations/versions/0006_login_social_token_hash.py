@@ -0,0 +1,69 @@
+"""Resumo SHA-256 do token do login social no lugar do token
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 11:00:00
+"""
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+login_social = sa.table(
+    'login_social',
+    sa.column('id_login_social', sa.Integer),
+    sa.column('token', sa.String),
+    sa.column('token_hash', sa.String),
+    sa.column('provedor', sa.String),
+)
+
+def resumo_token(token: str):
+    #Cópia de app.login_social.resumo_token na data desta revisão
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def upgrade():
+    op.add_column('login_social', sa.Column('token_hash', sa.String(64), nullable=True))
+
+    conexao = op.get_bind()
+    linhas = conexao.execute(
+        sa.select(login_social.c.id_login_social, login_social.c.token, login_social.c.provedor)
+        .order_by(login_social.c.id_login_social.desc())
+    ).all()
+
+    #O mesmo token em mais de uma linha do provedor violaria o índice único; fica a mais recente
+    atualizacoes = []
+    duplicadas = []
+    vistos = set()
+    for id_login_social, token, provedor in linhas:
+        token_hash = resumo_token(token)
+        if (provedor, token_hash) in vistos:
+            duplicadas.append(id_login_social)
+            continue
+        vistos.add((provedor, token_hash))
+        atualizacoes.append({'b_id': id_login_social, 'b_hash': token_hash})
+
+    if duplicadas:
+        conexao.execute(login_social.delete().where(login_social.c.id_login_social.in_(duplicadas)))
+    if atualizacoes:
+        conexao.execute(
+            login_social.update()
+            .where(login_social.c.id_login_social == sa.bindparam('b_id'))
+            .values(token_hash=sa.bindparam('b_hash')),
+            atualizacoes
+        )
+
+    with op.batch_alter_table('login_social') as batch_op:
+        batch_op.alter_column('token_hash', existing_type=sa.String(64), nullable=False)
+        batch_op.drop_column('token')
+    op.create_index('ix_login_social_provedor_token_hash', 'login_social', ['provedor', 'token_hash'], unique=True)
+
+def downgrade():
+    #Os tokens originais não podem ser recuperados do resumo
+    op.drop_index('ix_login_social_provedor_token_hash', table_name='login_social')
+    with op.batch_alter_table('login_social') as batch_op:
+        batch_op.add_column(sa.Column('token', sa.String(2048), nullable=False, server_default=''))
+        batch_op.drop_column('token_hash')
@@ -0,0 +1,37 @@
+"""Fila de tarefas executadas pelo worker
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 12:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'tarefas',
+        sa.Column('id_tarefa', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(64), nullable=False),
+        sa.Column('dados', sa.Text(), nullable=False),
+        sa.Column('prioridade', sa.Integer(), nullable=False),
+        sa.Column('estado', sa.String(16), nullable=False),
+        sa.Column('tentativas', sa.Integer(), nullable=False),
+        sa.Column('maximo_tentativas', sa.Integer(), nullable=False),
+        sa.Column('disponivel_em', sa.DateTime(), nullable=False),
+        sa.Column('reserva', sa.String(36), nullable=True),
+        sa.Column('reservada_ate', sa.DateTime(), nullable=True),
+        sa.Column('erro', sa.Text(), nullable=True),
+        sa.Column('criado', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id_tarefa'),
+    )
+    op.create_index('ix_tarefas_id_tarefa', 'tarefas', ['id_tarefa'])
+    op.create_index('ix_tarefas_fila', 'tarefas', ['estado', 'prioridade', 'disponivel_em'])
+    op.create_index('ix_tarefas_reserva', 'tarefas', ['reserva'])
+
+def downgrade():
+    op.drop_table('tarefas')
@@ -0,0 +1,25 @@
+"""Tokens revogados guardados no banco
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 13:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'tokens_revogados',
+        sa.Column('jti', sa.String(32), nullable=False),
+        sa.Column('expira', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('jti'),
+    )
+    op.create_index('ix_tokens_revogados_expira', 'tokens_revogados', ['expira'])
+
+def downgrade():
+    op.drop_table('tokens_revogados')
@@ -0,0 +1,100 @@
+"""Chave não nula da categoria no resumo mensal
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 14:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+resumo_mensal = sa.table(
+    'resumo_mensal',
+    sa.column('id_resumo', sa.Integer),
+    sa.column('id_usuario', sa.Integer),
+    sa.column('id_categoria', sa.Integer),
+    sa.column('categoria_chave', sa.Integer),
+    sa.column('mes', sa.DateTime),
+    sa.column('quantidade', sa.Integer),
+    sa.column('valor', sa.Numeric(14, 2)),
+    sa.column('quantidade_paga', sa.Integer),
+    sa.column('valor_pago', sa.Numeric(14, 2)),
+)
+
+COLUNAS_ANTIGAS = ['id_usuario', 'mes', 'id_categoria']
+COLUNAS_NOVAS = ['id_usuario', 'mes', 'categoria_chave']
+
+#Nomes para as restrições sem nome refletidas pelo SQLite no modo batch
+CONVENCAO = {'uq': 'uq_%(table_name)s_%(column_0_name)s_%(column_1_name)s_%(column_2_name)s'}
+
+def nome_restricao(colunas):
+    for restricao in sa.inspect(op.get_bind()).get_unique_constraints('resumo_mensal'):
+        if restricao['column_names'] == colunas and restricao['name']:
+            return restricao['name']
+    return f"uq_resumo_mensal_{'_'.join(colunas)}"
+
+def juntar_sem_categoria(conexao):
+    #No PostgreSQL a restrição antiga não cobria id_categoria nulo, então pode haver linhas repetidas
+    linhas = conexao.execute(
+        sa.select(
+            resumo_mensal.c.id_resumo, resumo_mensal.c.id_usuario, resumo_mensal.c.mes,
+            resumo_mensal.c.quantidade, resumo_mensal.c.valor, resumo_mensal.c.quantidade_paga, resumo_mensal.c.valor_pago
+        )
+        .where(resumo_mensal.c.id_categoria == None)
+        .order_by(resumo_mensal.c.id_resumo)
+    ).all()
+
+    somas = {}
+    repetidas = []
+    for id_resumo, id_usuario, mes, *valores in linhas:
+        chave = (id_usuario, mes)
+        if chave in somas:
+            somas[chave][1] = [a + b for a, b in zip(somas[chave][1], valores)]
+            repetidas.append(id_resumo)
+        else:
+            somas[chave] = [id_resumo, list(valores)]
+
+    if not repetidas:
+        return
+    conexao.execute(resumo_mensal.delete().where(resumo_mensal.c.id_resumo.in_(repetidas)))
+    conexao.execute(
+        resumo_mensal.update()
+        .where(resumo_mensal.c.id_resumo == sa.bindparam('b_id'))
+        .values(
+            quantidade=sa.bindparam('b_quantidade'),
+            valor=sa.bindparam('b_valor'),
+            quantidade_paga=sa.bindparam('b_quantidade_paga'),
+            valor_pago=sa.bindparam('b_valor_pago'),
+        ),
+        [
+            {'b_id': id_resumo, 'b_quantidade': valores[0], 'b_valor': valores[1], 'b_quantidade_paga': valores[2], 'b_valor_pago': valores[3]}
+            for id_resumo, valores in somas.values()
+        ]
+    )
+
+def upgrade():
+    op.add_column('resumo_mensal', sa.Column('categoria_chave', sa.Integer(), nullable=False, server_default='0'))
+
+    conexao = op.get_bind()
+    conexao.execute(
+        resumo_mensal.update()
+        .where(resumo_mensal.c.id_categoria != None)
+        .values(categoria_chave=resumo_mensal.c.id_categoria)
+    )
+    juntar_sem_categoria(conexao)
+
+    antiga = nome_restricao(COLUNAS_ANTIGAS)
+    #A nova restrição é criada antes de apagar a antiga: no MySQL a chave estrangeira de id_usuario usa o índice
+    with op.batch_alter_table('resumo_mensal', naming_convention=CONVENCAO) as batch_op:
+        batch_op.create_unique_constraint('uq_resumo_mensal_usuario_mes_categoria', COLUNAS_NOVAS)
+        batch_op.drop_constraint(antiga, type_='unique')
+
+def downgrade():
+    with op.batch_alter_table('resumo_mensal', naming_convention=CONVENCAO) as batch_op:
+        batch_op.create_unique_constraint('uq_resumo_mensal_id_usuario_mes_id_categoria', COLUNAS_ANTIGAS)
+        batch_op.drop_constraint('uq_resumo_mensal_usuario_mes_categoria', type_='unique')
+        batch_op.drop_column('categoria_chave')
@@ -1,7 +1,8 @@
 from pydantic import BaseModel
-from sqlalchemy import Column, Integer, String, Boolean, Float, DECIMAL, DateTime, ForeignKey
-from sqlalchemy.orm import relationship, DeclarativeBase
+from sqlalchemy import Column, Integer, String, Boolean, Float, DECIMAL, DateTime, Text, ForeignKey, Index, UniqueConstraint, DDL, event
+from sqlalchemy.orm import relationship, DeclarativeBase, deferred, validates
 from babel.numbers import format_currency
+from app.consultas import normalizar_busca
 
 class Base(DeclarativeBase):
     pass
@@ -29,25 +30,43 @@ class Usuarios(Base):
 
 class LoginSocial(Base):
     __tablename__ = 'login_social'
+    __table_args__ = (
+        #O token do provedor não é guardado, somente o SHA-256 (login_social.resumo_token)
+        Index('ix_login_social_provedor_token_hash', 'provedor', 'token_hash', unique=True),
+    )
 
     id_login_social = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, ForeignKey('usuarios.id_usuario'), nullable=True)
-    token = Column(String(2048), nullable=False)
+    token_hash = Column(String(64), nullable=False)
     provedor = Column(String(256), unique=False)
     
 class Despesas(Base):
     __tablename__ = 'despesas'
+    __table_args__ = (
+        #Trigramas no PostgreSQL atendem o LIKE '%termo%' da pesquisa sem varrer as despesas
+        Index('ix_despesas_despesa_busca', 'despesa_busca', postgresql_using='gin', postgresql_ops={'despesa_busca': 'gin_trgm_ops'}),
+        Index('ix_despesas_usuario_valor', 'id_usuario', 'valor'),
+        #Listagem paginada e dashboards filtram por usuário e período, em aberto ou pagas
+        Index('ix_despesas_usuario_vencimento', 'id_usuario', 'vencimento', 'id_despesa'),
+        Index('ix_despesas_usuario_pagamento', 'id_usuario', 'pagamento', 'vencimento'),
+    )
 
     id_despesa = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, ForeignKey('usuarios.id_usuario'), nullable=True)
     id_categoria = Column(Integer, ForeignKey('categorias.id_categoria'))
     despesa = Column(String(256), nullable=False)
+    despesa_busca = deferred(Column(String(256)))
     valor = Column(DECIMAL(10, 2), nullable=False)
     vencimento = Column(DateTime, nullable=False)
     pagamento = Column(DateTime)
 
     categorias = relationship("Categorias", back_populates="despesas")
 
+    @validates('despesa')
+    def validar_despesa(self, key, despesa):
+        self.despesa_busca = normalizar_busca(despesa)
+        return despesa
+
     def serialize(self):
         pagamento = ''
         if self.pagamento and self.pagamento != '0000-00-00 00:00:00':
@@ -63,8 +82,17 @@ class Despesas(Base):
             'categorias': self.categorias,
         }
 
+event.listen(
+    Despesas.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
 class Categorias(Base):
     __tablename__ = 'categorias'
+    __table_args__ = (
+        Index('ix_categorias_usuario_status', 'id_usuario', 'status'),
+    )
 
     id_categoria = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, ForeignKey('usuarios.id_usuario'))
@@ -84,7 +112,103 @@ class Icones(Base):
 
     categorias = relationship("Categorias", back_populates="icones")
 
+class ResumoMensal(Base):
+    __tablename__ = 'resumo_mensal'
+    __table_args__ = (
+        UniqueConstraint('id_usuario', 'mes', 'categoria_chave', name='uq_resumo_mensal_usuario_mes_categoria'),
+    )
 
+    id_resumo = Column(Integer, primary_key=True, index=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id_usuario'), nullable=False)
+    id_categoria = Column(Integer, ForeignKey('categorias.id_categoria'))
+    #id_categoria, ou 0 sem categoria: a restrição única também cobre as despesas sem categoria
+    categoria_chave = Column(Integer, nullable=False, default=0, server_default='0')
+    mes = Column(DateTime, nullable=False)
+    quantidade = Column(Integer, nullable=False, default=0)
+    valor = Column(DECIMAL(14, 2), nullable=False, default=0)
+    quantidade_paga = Column(Integer, nullable=False, default=0)
+    valor_pago = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+class Recorrencias(Base):
+    """
+    Despesa mensal guardada como regra: conta fixa (parcelas vazio) ou parcelamento.
+    As ocorrências são calculadas para o período consultado (app.recorrencias).
+    """
+    __tablename__ = 'recorrencias'
+    __table_args__ = (
+        Index('ix_recorrencias_usuario_inicio', 'id_usuario', 'inicio'),
+    )
+
+    id_recorrencia = Column(Integer, primary_key=True, index=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id_usuario'), nullable=False)
+    id_categoria = Column(Integer, ForeignKey('categorias.id_categoria'))
+    despesa = Column(String(256), nullable=False)
+    valor = Column(DECIMAL(10, 2), nullable=False)
+    dia_vencimento = Column(Integer, nullable=False)
+    inicio = Column(DateTime, nullable=False)
+    parcelas = Column(Integer)
+    fim = Column(DateTime)
+    criado = Column(DateTime, nullable=False)
 
+    categorias = relationship("Categorias")
+    ocorrencias = relationship("OcorrenciasRecorrencia", back_populates="recorrencia", cascade="all, delete-orphan")
 
+    def serialize(self):
+        return {
+            'id_recorrencia': self.id_recorrencia,
+            'id_categoria': self.id_categoria,
+            'despesa': self.despesa,
+            'valor': format_currency(self.valor, 'BRL', locale='pt_BR'),
+            'dia_vencimento': self.dia_vencimento,
+            'inicio': self.inicio.strftime('%m-%Y'),
+            'parcelas': self.parcelas,
+            'fim': self.fim.strftime('%m-%Y') if self.fim else None,
+            'categorias': self.categorias,
+        }
 
+class OcorrenciasRecorrencia(Base):
+    """Pagamento, valor alterado ou remoção de uma ocorrência de recorrência. Só existe para ocorrências alteradas."""
+    __tablename__ = 'ocorrencias_recorrencia'
+    __table_args__ = (
+        UniqueConstraint('id_recorrencia', 'parcela'),
+    )
+
+    id_ocorrencia = Column(Integer, primary_key=True, index=True)
+    id_recorrencia = Column(Integer, ForeignKey('recorrencias.id_recorrencia'), nullable=False)
+    parcela = Column(Integer, nullable=False)
+    valor = Column(DECIMAL(10, 2))
+    pagamento = Column(DateTime)
+    removida = Column(Boolean, nullable=False, default=False)
+
+    recorrencia = relationship("Recorrencias", back_populates="ocorrencias")
+
+class TokensRevogados(Base):
+    """Tokens revogados (logout e uso único) até a data em que expirariam."""
+    __tablename__ = 'tokens_revogados'
+
+    jti = Column(String(32), primary_key=True)
+    expira = Column(DateTime, nullable=False, index=True)
+
+class Tarefas(Base):
+    """
+    Tarefa da fila executada pelo worker (app.tarefas). Concluídas são apagadas; as que
+    esgotaram as tentativas ficam com estado 'falhou' e o último erro.
+    """
+    __tablename__ = 'tarefas'
+    __table_args__ = (
+        Index('ix_tarefas_fila', 'estado', 'prioridade', 'disponivel_em'),
+        Index('ix_tarefas_reserva', 'reserva'),
+    )
+
+    id_tarefa = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(64), nullable=False)
+    dados = Column(Text, nullable=False)
+    prioridade = Column(Integer, nullable=False, default=0)
+    estado = Column(String(16), nullable=False, default='pendente')
+    tentativas = Column(Integer, nullable=False, default=0)
+    maximo_tentativas = Column(Integer, nullable=False)
+    disponivel_em = Column(DateTime, nullable=False)
+    reserva = Column(String(36))
+    reservada_ate = Column(DateTime)
+    erro = Column(Text)
+    criado = Column(DateTime, nullable=False)
@@ -0,0 +1,255 @@
+"""
+Despesas recorrentes (contas mensais e parcelamentos) guardadas como regra.
+
+As ocorrências não são gravadas em despesas: a listagem, a pesquisa e os dashboards
+expandem as regras somente para o período consultado. A ocorrência `parcela` (a partir
+de 1) vence no mês inicio + parcela - 1, no dia_vencimento ou no último dia dos meses
+mais curtos. Regras com `fim` não têm ocorrências a partir dessa data. Pagamentos,
+valores alterados e ocorrências removidas ficam em OcorrenciasRecorrencia.
+
+Regras sem número de parcelas são expandidas no máximo até o fim do mês atual, o mesmo
+horizonte de uma conta mensal que já teria sido lançada.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from babel.numbers import format_currency
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload
+from app.models import Categorias, OcorrenciasRecorrencia, Recorrencias
+
+@dataclass
+class Ocorrencia:
+    recorrencia: Recorrencias
+    parcela: int
+    vencimento: datetime
+    valor: Decimal
+    pagamento: datetime = None
+
+    @property
+    def despesa(self):
+        if self.recorrencia.parcelas:
+            return f'{self.recorrencia.despesa} - {self.parcela} de {self.recorrencia.parcelas}'
+        return self.recorrencia.despesa
+
+    @property
+    def id_categoria(self):
+        return self.recorrencia.id_categoria
+
+    @property
+    def chave(self):
+        """Posição na listagem: as despesas lançadas vêm antes das ocorrências com o mesmo vencimento."""
+        return (self.vencimento, 0, self.recorrencia.id_recorrencia, self.parcela)
+
+    def serialize(self):
+        pagamento = ''
+        if self.pagamento:
+            pagamento = self.pagamento.strftime('%d/%m/%Y %H:%M:%S')
+        return {
+            'id_despesa': None,
+            'id_recorrencia': self.recorrencia.id_recorrencia,
+            'parcela': self.parcela,
+            'id_usuario': self.recorrencia.id_usuario,
+            'id_categoria': self.recorrencia.id_categoria,
+            'despesa': self.despesa,
+            'valor': format_currency(self.valor, 'BRL', locale='pt_BR'),
+            'vencimento': self.vencimento.strftime('%d/%m/%Y %H:%M:%S'),
+            'pagamento': pagamento,
+            'categorias': self.recorrencia.categorias,
+        }
+
+def meses_entre(inicio: datetime, data: datetime):
+    return (data.year - inicio.year) * 12 + data.month - inicio.month
+
+def vencimento_parcela(recorrencia: Recorrencias, parcela: int):
+    #relativedelta(day=31) limita o dia ao último dia do mês
+    return recorrencia.inicio + relativedelta(months=parcela - 1, day=recorrencia.dia_vencimento)
+
+def horizonte(data_atual: datetime = None):
+    data_atual = data_atual or datetime.now()
+    return datetime(data_atual.year, data_atual.month, 1) + relativedelta(months=1)
+
+def faixa_parcelas(recorrencia: Recorrencias, inicio: datetime = None, fim: datetime = None):
+    """Primeira e última parcela da regra em [inicio, fim), sem percorrer as ocorrências. Vazia se primeira > ultima."""
+    if not recorrencia.parcelas:
+        fim = horizonte() if fim is None else min(fim, horizonte())
+    if recorrencia.fim is not None:
+        fim = recorrencia.fim if fim is None else min(fim, recorrencia.fim)
+
+    primeira = 1 if inicio is None else max(1, meses_entre(recorrencia.inicio, inicio) + 1)
+    ultima = recorrencia.parcelas if fim is None else meses_entre(recorrencia.inicio, fim) + 1
+    if recorrencia.parcelas:
+        ultima = min(ultima, recorrencia.parcelas)
+
+    #A parcela vence no mês calculado, então só as pontas podem cair fora do período
+    if inicio is not None and primeira <= ultima and vencimento_parcela(recorrencia, primeira) < inicio:
+        primeira += 1
+    if fim is not None and primeira <= ultima and vencimento_parcela(recorrencia, ultima) >= fim:
+        ultima -= 1
+    return primeira, ultima
+
+def parcelas_no_periodo(recorrencia: Recorrencias, inicio: datetime = None, fim: datetime = None):
+    """Números e vencimentos das ocorrências da regra em [inicio, fim), sem consultar o banco."""
+    primeira, ultima = faixa_parcelas(recorrencia, inicio, fim)
+    for parcela in range(primeira, ultima + 1):
+        yield parcela, vencimento_parcela(recorrencia, parcela)
+
+def consultar_recorrencias(id_usuario: int, inicio: datetime = None, fim: datetime = None, categoria: int = 0):
+    """Regras do usuário com ocorrências possíveis em [inicio, fim)."""
+    recorrencias_query = select(Recorrencias).filter(Recorrencias.id_usuario == id_usuario)
+    if fim is not None:
+        recorrencias_query = recorrencias_query.filter(Recorrencias.inicio < fim)
+    if inicio is not None:
+        recorrencias_query = recorrencias_query.filter(or_(Recorrencias.fim == None, Recorrencias.fim > inicio))
+    if categoria != 0:
+        recorrencias_query = recorrencias_query.filter(Recorrencias.id_categoria == categoria)
+    return recorrencias_query
+
+def aplicar_alteracoes(ocorrencias, alteracoes):
+    """Pagamentos e valores alterados das ocorrências, sem as removidas. `alteracoes` é indexado por (id_recorrencia, parcela)."""
+    resultado = []
+    for ocorrencia in ocorrencias:
+        alteracao = alteracoes.get((ocorrencia.recorrencia.id_recorrencia, ocorrencia.parcela))
+        if alteracao is not None:
+            if alteracao.removida:
+                continue
+            if alteracao.valor is not None:
+                ocorrencia.valor = alteracao.valor
+            ocorrencia.pagamento = alteracao.pagamento
+        resultado.append(ocorrencia)
+    return resultado
+
+async def expandir_recorrencias(db, id_usuario: int, inicio: datetime = None, fim: datetime = None, categoria: int = 0):
+    """
+    Ocorrências das recorrências do usuário em [inicio, fim), já com pagamentos e valores alterados
+    e sem as removidas. Uma consulta para as regras e outra para as alterações do período.
+    """
+    recorrencias_query = (
+        consultar_recorrencias(id_usuario, inicio, fim, categoria)
+        .options(joinedload(Recorrencias.categorias).joinedload(Categorias.icones))
+    )
+
+    ocorrencias = []
+    faixas = []
+    for recorrencia in (await db.scalars(recorrencias_query)).unique().all():
+        parcelas = [
+            Ocorrencia(recorrencia, parcela, vencimento, recorrencia.valor)
+            for parcela, vencimento in parcelas_no_periodo(recorrencia, inicio, fim)
+        ]
+        if parcelas:
+            ocorrencias.extend(parcelas)
+            faixas.append(and_(
+                OcorrenciasRecorrencia.id_recorrencia == recorrencia.id_recorrencia,
+                OcorrenciasRecorrencia.parcela.between(parcelas[0].parcela, parcelas[-1].parcela)
+            ))
+
+    if not faixas:
+        return []
+
+    alteracoes = {
+        (alteracao.id_recorrencia, alteracao.parcela): alteracao
+        for alteracao in (await db.scalars(select(OcorrenciasRecorrencia).filter(or_(*faixas)))).all()
+    }
+
+    return aplicar_alteracoes(ocorrencias, alteracoes)
+
+def somar_abertas(recorrencias, alteracoes, inicio: datetime = None, fim: datetime = None):
+    """
+    Quantidade e valor das ocorrências em aberto em [inicio, fim), sem expandir as regras:
+    cada regra contribui com a sua faixa de parcelas, corrigida pelas alterações que caem nela.
+    """
+    quantidade = 0
+    valor = 0
+    faixas = {}
+    for recorrencia in recorrencias:
+        primeira, ultima = faixa_parcelas(recorrencia, inicio, fim)
+        if primeira <= ultima:
+            quantidade += ultima - primeira + 1
+            valor += (ultima - primeira + 1) * recorrencia.valor
+            faixas[recorrencia.id_recorrencia] = (primeira, ultima, recorrencia.valor)
+
+    for (id_recorrencia, parcela), alteracao in alteracoes.items():
+        faixa = faixas.get(id_recorrencia)
+        if faixa is None or not faixa[0] <= parcela <= faixa[1]:
+            continue
+        #Pagas e removidas saem do aberto; as demais alteradas só mudam de valor
+        valor_ocorrencia = faixa[2] if alteracao.valor is None else alteracao.valor
+        if alteracao.removida or alteracao.pagamento is not None:
+            quantidade -= 1
+            valor -= valor_ocorrencia
+        else:
+            valor += valor_ocorrencia - faixa[2]
+
+    return quantidade, valor
+
+async def resumir_recorrencias(db, id_usuario: int, inicio: datetime, fim: datetime):
+    """
+    Para os cards: ocorrências em [inicio, fim) e (quantidade, valor) em aberto antes de inicio
+    e a partir de fim. As regras e as alterações do usuário são lidas uma única vez; sem regras,
+    é uma única consulta.
+    """
+    recorrencias = (
+        await db.scalars(
+            consultar_recorrencias(id_usuario)
+            .options(joinedload(Recorrencias.categorias).joinedload(Categorias.icones))
+        )
+    ).unique().all()
+    if not recorrencias:
+        return [], (0, 0), (0, 0)
+
+    alteracoes = {
+        (alteracao.id_recorrencia, alteracao.parcela): alteracao
+        for alteracao in await db.execute(
+            select(
+                OcorrenciasRecorrencia.id_recorrencia,
+                OcorrenciasRecorrencia.parcela,
+                OcorrenciasRecorrencia.valor,
+                OcorrenciasRecorrencia.pagamento,
+                OcorrenciasRecorrencia.removida
+            )
+            .join(Recorrencias, Recorrencias.id_recorrencia == OcorrenciasRecorrencia.id_recorrencia)
+            .filter(Recorrencias.id_usuario == id_usuario)
+        )
+    }
+
+    ocorrencias = aplicar_alteracoes([
+        Ocorrencia(recorrencia, parcela, vencimento, recorrencia.valor)
+        for recorrencia in recorrencias
+        for parcela, vencimento in parcelas_no_periodo(recorrencia, inicio, fim)
+    ], alteracoes)
+
+    return ocorrencias, somar_abertas(recorrencias, alteracoes, fim=inicio), somar_abertas(recorrencias, alteracoes, inicio=fim)
+
+def resumir_ocorrencias(ocorrencias):
+    """
+    Ocorrências agrupadas no formato do resumo mensal:
+    (mes, id_categoria, categoria, quantidade, valor, quantidade_paga, valor_pago).
+    """
+    resumo = {}
+    for ocorrencia in ocorrencias:
+        categoria = ocorrencia.recorrencia.categorias
+        chave = (
+            datetime(ocorrencia.vencimento.year, ocorrencia.vencimento.month, 1),
+            ocorrencia.id_categoria,
+            categoria.categoria if categoria else None
+        )
+        quantidade, valor, quantidade_paga, valor_pago = resumo.get(chave, (0, 0, 0, 0))
+        if ocorrencia.pagamento is not None:
+            quantidade_paga += 1
+            valor_pago += ocorrencia.valor
+        resumo[chave] = (quantidade + 1, valor + ocorrencia.valor, quantidade_paga, valor_pago)
+
+    return [chave + valores for chave, valores in resumo.items()]
+
+def aberto_mes_atual(ocorrencias, data_atual: datetime):
+    """Mesmo formato de dashboard.buscar_aberto_mes_atual, para as ocorrências."""
+    primeiro_dia_mes_atual = data_atual.replace(day=1)
+    resultado = [0, 0, 0, 0]
+    for ocorrencia in ocorrencias:
+        if ocorrencia.pagamento is not None or not primeiro_dia_mes_atual <= ocorrencia.vencimento < horizonte(data_atual):
+            continue
+        atrasada = ocorrencia.vencimento < data_atual
+        resultado[0 if atrasada else 1] += 1
+        resultado[2 if atrasada else 3] += ocorrencia.valor
+    return resultado
@@ -0,0 +1,142 @@
+"""
+Resumo mensal das despesas por usuário e categoria, usado pelos dashboards.
+
+As rotas de escrita de despesas aplicam a diferença de cada alteração com
+atualizar_resumo. Para recriar o resumo a partir da tabela de despesas:
+
+    python -m app.resumo [--usuario ID] [--fila]
+
+Com --fila a recriação é executada pelo worker (tarefa 'recriar_resumo').
+"""
+import argparse
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app.consultas import chave_periodo, truncar_data
+from app.database import dialeto
+from app.models import Despesas, ResumoMensal
+from app.tarefas import PRIORIDADE_BAIXA, enfileirar, tarefa
+
+def valores_resumo(despesa: Despesas):
+    """Chave e contribuição de uma despesa no resumo: (chave, (quantidade, valor, quantidade_paga, valor_pago))."""
+    vencimento = despesa.vencimento
+    chave = (despesa.id_usuario, datetime(vencimento.year, vencimento.month, 1), despesa.id_categoria)
+    valor = Decimal(str(despesa.valor)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if despesa.pagamento is None:
+        return chave, (1, valor, 0, Decimal(0))
+    return chave, (1, valor, 1, valor)
+
+SOMAS = ('quantidade', 'valor', 'quantidade_paga', 'valor_pago')
+
+def somar_resumo(dialeto: str):
+    """
+    INSERT que, se a chave (usuario, mes, categoria) já existe, soma os valores na linha existente.
+    É um único comando atômico, então escritas simultâneas do mesmo mês não se perdem nem conflitam.
+    """
+    tabela = ResumoMensal.__table__
+    if dialeto == 'mysql':
+        comando = mysql.insert(tabela)
+        return comando.on_duplicate_key_update(**{coluna: tabela.c[coluna] + comando.inserted[coluna] for coluna in SOMAS})
+
+    #PostgreSQL e SQLite têm a mesma sintaxe de ON CONFLICT
+    comando = (postgresql if dialeto == 'postgresql' else sqlite).insert(tabela)
+    return comando.on_conflict_do_update(
+        index_elements=['id_usuario', 'mes', 'categoria_chave'],
+        set_={coluna: tabela.c[coluna] + comando.excluded[coluna] for coluna in SOMAS}
+    )
+
+async def atualizar_resumo(db, removidas=(), adicionadas=()):
+    """
+    Aplica no resumo a saída das despesas em `removidas` e a entrada das despesas em `adicionadas`.
+    Os itens são os retornos de valores_resumo, capturados antes e depois da alteração.
+    Usa um único comando, independente da quantidade de meses afetados.
+    """
+    diferencas = {}
+    for sinal, itens in ((-1, removidas), (1, adicionadas)):
+        for chave, valores in itens:
+            atual = diferencas.get(chave, (0, 0, 0, 0))
+            diferencas[chave] = tuple(a + sinal * v for a, v in zip(atual, valores))
+
+    linhas = [
+        {
+            'id_usuario': id_usuario,
+            'mes': mes,
+            'id_categoria': id_categoria,
+            'categoria_chave': id_categoria or 0,
+            **dict(zip(SOMAS, valores)),
+        }
+        for (id_usuario, mes, id_categoria), valores in diferencas.items()
+        if any(valores)
+    ]
+    if not linhas:
+        return
+
+    await db.execute(somar_resumo((await dialeto(db)).name), linhas)
+
+def reconstruir_resumo(db, id_usuario: int = None):
+    """Recria o resumo com uma única leitura agregada da tabela de despesas. Recebe uma Session síncrona."""
+    mes = truncar_data('mes', Despesas.vencimento)
+    pago = Despesas.pagamento != None
+
+    despesas_query = (
+        select(
+            Despesas.id_usuario,
+            mes,
+            Despesas.id_categoria,
+            func.count(),
+            func.sum(Despesas.valor),
+            func.count(case((pago, 1))),
+            func.coalesce(func.sum(case((pago, Despesas.valor))), 0)
+        )
+        .filter(Despesas.id_usuario != None)
+        .group_by(Despesas.id_usuario, mes, Despesas.id_categoria)
+    )
+
+    resumo_delete = delete(ResumoMensal)
+
+    if id_usuario is not None:
+        despesas_query = despesas_query.filter(Despesas.id_usuario == id_usuario)
+        resumo_delete = resumo_delete.where(ResumoMensal.id_usuario == id_usuario)
+
+    resumos = [
+        {
+            'id_usuario': usuario,
+            'mes': datetime.strptime(chave_periodo(data), '%Y-%m-%d'),
+            'id_categoria': id_categoria,
+            'categoria_chave': id_categoria or 0,
+            'quantidade': quantidade,
+            'valor': valor,
+            'quantidade_paga': quantidade_paga,
+            'valor_pago': valor_pago,
+        }
+        for usuario, data, id_categoria, quantidade, valor, quantidade_paga, valor_pago in db.execute(despesas_query)
+    ]
+
+    db.execute(resumo_delete)
+    if resumos:
+        db.execute(insert(ResumoMensal), resumos)
+    db.commit()
+
+    return len(resumos)
+
+@tarefa('recriar_resumo')
+async def recriar_resumo(db, dados):
+    await db.run_sync(reconstruir_resumo, dados.get('id_usuario'))
+
+if __name__ == '__main__':
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description='Recria o resumo mensal das despesas.')
+    parser.add_argument('--usuario', type=int, default=None, help='Recria somente o resumo deste usuário.')
+    parser.add_argument('--fila', action='store_true', help='Coloca a recriação na fila de tarefas do worker.')
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.fila:
+            enfileirar(db, 'recriar_resumo', {'id_usuario': args.usuario}, prioridade=PRIORIDADE_BAIXA)
+            db.commit()
+            print('Recriação do resumo colocada na fila.')
+        else:
+            total = reconstruir_resumo(db, args.usuario)
+            print(f'{total} linhas de resumo recriadas.')
@@ -1,35 +1,39 @@
-from datetime import timedelta, datetime
+from datetime import datetime
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
-import httpx
 from pydantic import BaseModel
 import requests
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from starlette import status
-from app.database import get_db
+from app.database import get_async_db
 from app.models import LoginSocial, Usuarios
-from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from jose import jwt, JWTError
 import os
 from app.send_email import recuperar_senha_mail
+from app.senha import gerar_hash, verificar_senha
+from app.login_social import PROVEDORES, LoginSocialInvalido, ProvedorIndisponivel, ProvedorNaoConfigurado, buscar_usuario_facebook, resumo_token, verificar_token_google
+from app.tokens import ACESSO, DURACOES, RECUPERACAO, RENOVACAO, TokenInvalido, criar_token, revogar_token, verificar_token
 
 router = APIRouter(
     prefix='/auth',
     tags=['Autenticação']
 )
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-SECRET_ALGORITHM = os.getenv("SECRET_ALGORITHM")
-
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str
+    expires_in: int
+
+class Renovacao(BaseModel):
+    refresh_token: str
+
+class Logout(BaseModel):
+    refresh_token: str = ''
 
 class Login(BaseModel):
     email: str
@@ -51,124 +55,122 @@ class LoginSocialRequest(BaseModel):
     token: str
     provedor: str
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 
-def auth_usuario(email: str, senha: str, db):
-    usuario = db.query(Usuarios).filter(Usuarios.email == email).first()
+async def auth_usuario(email: str, senha: str, db):
+    usuario = (await db.scalars(select(Usuarios).filter(Usuarios.email == email))).first()
     if not usuario:
         return False
-    if not bcrypt_context.verify(senha, usuario.senha):
+    valida, novo_hash = await verificar_senha(senha, usuario.senha)
+    if not valida:
         return False
+    if novo_hash:
+        usuario.senha = novo_hash
+        await db.commit()
     return usuario
 
 def criar_access_token(email: str, id_usuario: int):
-    encode = {'sub': email, 'id': id_usuario, 'datetime': datetime.now().isoformat() }
-    return jwt.encode(encode, SECRET_KEY, algorithm=SECRET_ALGORITHM)
+    return criar_token(email, id_usuario, ACESSO)
+
+def criar_tokens(email: str, id_usuario: int):
+    return {
+        'access_token': criar_access_token(email, id_usuario),
+        'token_type': 'bearer',
+        'refresh_token': criar_token(email, id_usuario, RENOVACAO),
+        'expires_in': DURACOES[ACESSO],
+    }
 
-async def buscar_usuario_auth(token: Annotated[str, Depends(oauth2_bearer)]):
+async def buscar_usuario_auth(token: Annotated[str, Depends(oauth2_bearer)], db: db_dependency):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[SECRET_ALGORITHM])
-        email: str = payload.get('sub')
-        id_usuario: int = payload.get('id')
-        if email is None or id_usuario is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-        
-        return {'email': email, 'id_usuario': id_usuario}
-    
-    except JWTError:
+        claims = await verificar_token(db, token, ACESSO)
+    except TokenInvalido:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-async def buscar_usuario_token(token: str):
+    return {'email': claims['sub'], 'id_usuario': claims['id'], 'claims': claims}
+
+async def buscar_usuario_token(db, token: str, tipo: str = RECUPERACAO):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[SECRET_ALGORITHM])
-        email: str = payload.get('sub')
-        id_usuario: int = payload.get('id')
-        if email is None or id_usuario is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail='Could not validate user .'
-            )
-        
-        return {'email': email, 'id_usuario': id_usuario}
-    
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        claims = await verificar_token(db, token, tipo)
+    except TokenInvalido:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user .'
+        )
+
+    return {'email': claims['sub'], 'id_usuario': claims['id'], 'claims': claims}
 
 async def auth_usuario_token(login: LoginSocialRequest, db):
-    
-    login_social = db.query(LoginSocial).filter(LoginSocial.token == login.token).first()
+    provedor = login.provedor.lower()
+    if provedor not in PROVEDORES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Provedor não suportado')
+    token_hash = resumo_token(login.token)
+
+    login_social = (await db.scalars(select(LoginSocial).filter(LoginSocial.provedor == provedor, LoginSocial.token_hash == token_hash))).first()
 
     if login_social:
-        usuario = db.query(Usuarios).filter(Usuarios.id_usuario == login_social.id_usuario).first()
+        usuario = await db.get(Usuarios, login_social.id_usuario)
         if usuario:
             return usuario
 
-    provedor_usuario = { 'email' : '' }
-    if login.provedor.lower() == 'google':
+    if provedor == 'google':
         provedor_usuario = await google_login(login.token)
-    
-    if login.provedor.lower() == 'facebook':
+    else:
         provedor_usuario = await facebook_login(login.token)
     
-    usuario = db.query(Usuarios).filter(Usuarios.email == provedor_usuario['email']).first()
+    usuario = (await db.scalars(select(Usuarios).filter(Usuarios.email == provedor_usuario['email']))).first()
     if not usuario:
         usuario = Usuarios(nome=provedor_usuario['name'], email=provedor_usuario['email'], senha='', limite_gastos=0, status=True, criado=datetime.now())
         db.add(usuario)
+        await db.flush()
 
-    login_social = db.query(LoginSocial).filter(and_(LoginSocial.id_usuario == usuario.id_usuario, LoginSocial.provedor == login.provedor)).first()
+    login_social = (await db.scalars(select(LoginSocial).filter(and_(LoginSocial.id_usuario == usuario.id_usuario, LoginSocial.provedor == provedor)))).first()
     if login_social:
-        login_social.token = login.token
+        login_social.token_hash = token_hash
     else:
-        login_social = LoginSocial(id_usuario=usuario.id_usuario, token=login.token, provedor=login.provedor.lower())
+        login_social = LoginSocial(id_usuario=usuario.id_usuario, token_hash=token_hash, provedor=provedor)
         db.add(login_social)
 
-    db.commit()
+    await db.commit()
 
     return usuario
 
 async def google_login(token: str):
     try:
-        response = httpx.get(f"https://www.googleapis.com/oauth2/v3/tokeninfo?id_token={token}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(status_code=response.status_code, detail="Error retrieving Google user data")
-    except httpx.HTTPError:
-        raise HTTPException(status_code=500, detail="Internal server error")
+        return await verificar_token_google(token)
+    except LoginSocialInvalido:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Google token")
+    except ProvedorIndisponivel:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Error retrieving Google user data")
+    except ProvedorNaoConfigurado:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Google login is not configured")
 
 async def facebook_login(token: str):
     try:
-        response = httpx.get(f"https://graph.facebook.com/me?fields=id,name,email&access_token={token}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(status_code=response.status_code, detail="Error retrieving Facebook user data")
-    except httpx.HTTPError:
-        raise HTTPException(status_code=500, detail="Internal server error")
+        return await buscar_usuario_facebook(token)
+    except LoginSocialInvalido:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid Facebook token")
+    except ProvedorIndisponivel:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Error retrieving Facebook user data")
 
 @router.post("/token", response_model=Token)
 async def token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: db_dependency):
     
-    usuario = auth_usuario(form_data.username, form_data.password, db)
+    usuario = await auth_usuario(form_data.username, form_data.password, db)
     
     if not usuario:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     
-    token = criar_access_token(usuario.email, usuario.id_usuario)
-
-    return {'access_token': token, 'token_type': 'bearer'}
+    return criar_tokens(usuario.email, usuario.id_usuario)
 
 @router.post("/login", response_model=Token)
 async def login(login: Login, db: db_dependency ):
     
-    usuario = auth_usuario(login.email, login.senha, db)
+    usuario = await auth_usuario(login.email, login.senha, db)
     
     if not usuario:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user.')
     
-    token = criar_access_token(usuario.email, usuario.id_usuario)
-
-    return {'access_token': token, 'token_type': 'bearer'}
+    return criar_tokens(usuario.email, usuario.id_usuario)
 
 @router.post("/cadastro", response_model=Token)
 async def cadastro(usuario: Usuario, db: db_dependency ):
@@ -176,39 +178,35 @@ async def cadastro(usuario: Usuario, db: db_dependency ):
         usuario_db = Usuarios(
             nome=usuario.nome,
             email=usuario.email,
-            senha=bcrypt_context.hash(usuario.senha),
+            senha=await gerar_hash(usuario.senha),
             limite_gastos=0,
             status=True,
             criado=datetime.now(),
         )
         
         db.add(usuario_db)
-        db.commit()
+        await db.commit()
 
-        token = criar_access_token(usuario_db.email, usuario_db.id_usuario)
-
-        return {'access_token': token, 'token_type': 'bearer'}
+        return criar_tokens(usuario_db.email, usuario_db.id_usuario)
     except SQLAlchemyError:
-        db.rollback() 
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Erro ao cadastrar usuário.')
 
 @router.post("/recuperar/mail", response_description="recuperar senha")
 async def recuperar_senha(recuperar: Recupear, db: db_dependency ):
-    usuario_db = db.query(Usuarios).filter(Usuarios.email == recuperar.email).first()
+    usuario_db = (await db.scalars(select(Usuarios).filter(Usuarios.email == recuperar.email))).first()
 
     if usuario_db is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conta não encontrada")
     
-    expires = datetime.now() + timedelta(hours=20)
-    encode = { 'sub': usuario_db.email, 'id': usuario_db.id_usuario, 'exp': expires }
-    
-    token = jwt.encode(encode, SECRET_KEY, algorithm=SECRET_ALGORITHM)
+    token = criar_token(usuario_db.email, usuario_db.id_usuario, RECUPERACAO)
 
     URL_RESET_PASSWORD = os.getenv("URL_RESET_PASSWORD")
 
     reset_link = f'{URL_RESET_PASSWORD}?token={token}'
 
     await recuperar_senha_mail(
+        db,
         "Recuperar Senha", 
         usuario_db.email, 
         {
@@ -216,24 +214,26 @@ async def recuperar_senha(recuperar: Recupear, db: db_dependency ):
             "reset_link": reset_link
         }
     )
+    await db.commit()
 
     return {}
 
 @router.post("/recuperar/senha", response_description="recuperar senha")
 async def recuperar_senha(nova_senha: NovaSenha, db: db_dependency ):
 
-    usuario = await buscar_usuario_token(nova_senha.token)
-    usuario_db = db.query(Usuarios).filter(Usuarios.id_usuario == usuario['id_usuario']).first()
+    usuario = await buscar_usuario_token(db, nova_senha.token)
+    usuario_db = await db.get(Usuarios, usuario['id_usuario'])
 
     if usuario_db is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conta não encontrada")
-    
-    usuario_db.senha=bcrypt_context.hash(nova_senha.senha),
-    db.commit()
 
-    token = criar_access_token(usuario_db.email, usuario_db.id_usuario)
+    usuario_db.senha = await gerar_hash(nova_senha.senha)
 
-    return {'access_token': token, 'token_type': 'bearer'}
+    #O link de recuperação só pode ser usado uma vez; a nova senha é gravada no mesmo commit da revogação
+    if not await revogar_token(db, usuario['claims']):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user .')
+
+    return criar_tokens(usuario_db.email, usuario_db.id_usuario)
 
 @router.post("/social")
 async def login_social(login: LoginSocialRequest, db: db_dependency ):
@@ -243,6 +243,26 @@ async def login_social(login: LoginSocialRequest, db: db_dependency ):
     if not usuario:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user.')
     
-    token = criar_access_token(usuario.email, usuario.id_usuario)
+    return criar_tokens(usuario.email, usuario.id_usuario)
+
+@router.post("/refresh", response_model=Token)
+async def renovar(renovacao: Renovacao, db: db_dependency):
+    usuario = await buscar_usuario_token(db, renovacao.refresh_token, RENOVACAO)
+
+    #Cada token de renovação só pode ser usado uma vez; a resposta traz o próximo
+    if not await revogar_token(db, usuario['claims']):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user .')
+
+    return criar_tokens(usuario['email'], usuario['id_usuario'])
 
-    return {'access_token': token, 'token_type': 'bearer'}
+@router.post("/logout")
+async def logout(logout: Logout, usuario: Annotated[dict, Depends(buscar_usuario_auth)], db: db_dependency):
+    await revogar_token(db, usuario['claims'])
+
+    if logout.refresh_token:
+        try:
+            await revogar_token(db, await verificar_token(db, logout.refresh_token, RENOVACAO))
+        except TokenInvalido:
+            pass
+
+    return {}
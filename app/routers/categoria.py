@@ -2,13 +2,16 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from sqlalchemy import and_, desc, or_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, desc, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from passlib.context import CryptContext
 from starlette import status
-from app.database import get_db
+from app.database import get_async_db
 from app.models import Icones, Categorias
 from app.routers import auth
+from app.cache import agrupar_requisicoes, cache_usuario, invalidar_usuario
+from app.classificador import sugerir_categorias
 
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
@@ -23,7 +26,7 @@ class Categoria(BaseModel):
     categoria: str
     status: bool
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
 
 @router.post("/")
@@ -38,7 +41,8 @@ async def add(categoria: Categoria, usuario: auth_dependency, db: db_dependency
     )
 
     db.add(categoria_db)
-    db.commit()
+    await db.commit()
+    invalidar_usuario(id_usuario)
 
     return {}
 
@@ -46,42 +50,53 @@ async def add(categoria: Categoria, usuario: auth_dependency, db: db_dependency
 async def editar(id_categoria: int, categoria: Categoria, usuario: auth_dependency, db: db_dependency ):
     id_usuario = usuario['id_usuario']
 
-    categoria_db = db.query(Categorias).filter(Categorias.id_categoria == id_categoria, Categorias.id_usuario == id_usuario).first()
+    categoria_db = (await db.scalars(select(Categorias).filter(Categorias.id_categoria == id_categoria, Categorias.id_usuario == id_usuario))).first()
     if not categoria_db:
         raise HTTPException(status_code=404, detail="Categoria não encontrado")
 
-    categoria_db.id_icone = categoria.id_icone,
-    categoria_db.categoria = categoria.categoria,
+    categoria_db.id_icone = categoria.id_icone
+    categoria_db.categoria = categoria.categoria
     categoria_db.status = categoria.status
     
-    db.commit()
+    await db.commit()
+    invalidar_usuario(id_usuario)
 
     return {}
 
 @router.get("/categoria/{id_categoria}", status_code=status.HTTP_200_OK)
 async def buscar(id_categoria: int, usuario: auth_dependency, db: db_dependency):
     id_usuario = usuario['id_usuario']
-    categoria = db.query(Categorias).filter((Categorias.id_usuario == id_usuario) & (Categorias.id_categoria == id_categoria)).options(joinedload(Categorias.icones)).first()
+    categoria = (await db.scalars(select(Categorias).filter((Categorias.id_usuario == id_usuario) & (Categorias.id_categoria == id_categoria)).options(joinedload(Categorias.icones)))).first()
 
     return categoria
 
 @router.get("/", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def buscar_todos(usuario: auth_dependency, db: db_dependency):
     
     id_usuario = usuario['id_usuario']
-    categorias = db.query(Categorias).filter(or_(Categorias.id_usuario == id_usuario, Categorias.id_usuario == None)).options(joinedload(Categorias.icones)).order_by(desc(Categorias.id_categoria)).all()
+    categorias = (await db.scalars(select(Categorias).filter(or_(Categorias.id_usuario == id_usuario, Categorias.id_usuario == None)).options(joinedload(Categorias.icones)).order_by(desc(Categorias.id_categoria)))).all()
 
     return categorias
 
 @router.get("/disponivel", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def buscar_disponivel(usuario: auth_dependency, db: db_dependency):
     
     id_usuario = usuario['id_usuario']
-    categorias = db.query(Categorias).filter(
+    categorias = (await db.scalars(select(Categorias).filter(
                 and_(
                     or_(Categorias.id_usuario == id_usuario, Categorias.id_usuario == None), 
                     Categorias.status
-                )).options(joinedload(Categorias.icones)).all()
+                )).options(joinedload(Categorias.icones)))).all()
 
     return categorias
 
+@router.get("/sugestao", status_code=status.HTTP_200_OK)
+async def sugestao(usuario: auth_dependency, db: db_dependency, despesa: str = Query(min_length=1), limite: int = Query(3, ge=1, le=10)):
+    """Categorias mais prováveis para a descrição, aprendidas com as despesas do usuário."""
+    sugestoes = await sugerir_categorias(db, usuario['id_usuario'], despesa, limite)
+
+    return {'sugestoes': [{'id_categoria': id_categoria, 'confianca': round(confianca, 4)} for id_categoria, confianca in sugestoes]}
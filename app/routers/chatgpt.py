@@ -1,21 +1,29 @@
-from datetime import date
+import asyncio
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+import hashlib
 import json
 import os
 import openai 
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-import httpx
 from pydantic import BaseModel
-from sqlalchemy import and_, func, or_
-from sqlalchemy.orm import Session, joinedload
-from passlib.context import CryptContext
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from app.database import get_db
-from app.models import Icones, Categorias
+from dateutil.parser import isoparse
+from app.busca import converter_valor
+from app.cache import cache_respostas, invalidar_usuario
+from app.classificador import atualizar_classificador
+from app.consultas import normalizar_busca
+from app.database import get_async_db
+from app.interpretacao import interpretar_despesas
+from app.models import Categorias
 from app.routers import auth
+from app.routers.despesa import inserir_despesas
 
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
 
 router = APIRouter(
@@ -23,89 +31,241 @@ router = APIRouter(
     tags=['ChatGPT']
 )
 
-db_dependency = Annotated[Session, Depends(get_db)]
+CHATGPT_MODELO = os.getenv("CHATGPT_MODELO", "gpt-3.5-turbo-16k-0613")
+CHATGPT_API_BASE = os.getenv("OPENAI_API_BASE", openai.api_base)
+CHATGPT_TIMEOUT = float(os.getenv("CHATGPT_TIMEOUT", 30))
+CHATGPT_TIMEOUT_CONEXAO = float(os.getenv("CHATGPT_TIMEOUT_CONEXAO", 5))
+# Chamadas simultâneas por processo; as demais esperam até CHATGPT_ESPERA segundos por uma vaga
+CHATGPT_CONCORRENCIA = int(os.getenv("CHATGPT_CONCORRENCIA", 4))
+CHATGPT_ESPERA = float(os.getenv("CHATGPT_ESPERA", 10))
+CHATGPT_CACHE_TTL = int(os.getenv("CHATGPT_CACHE_TTL", 24 * 60 * 60))
+# Despesas aceitas de uma única entrada
+MAXIMO_DESPESAS = 50
+
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
 
 class Input(BaseModel):
     input: str
 
-@router.post("/")
-async def chat_input(input: Input, usuario: auth_dependency, db: db_dependency ):
-    id_usuario = usuario['id_usuario']
+# Quantas respostas vieram de cada caminho: interpretação local, cache ou modelo
+estatisticas_interpretacao = {'local': 0, 'cache': 0, 'modelo': 0}
+
+_limitador = None
+_loop = None
 
-    categorias = db.query(Categorias).filter(
+def limitador():
+    #O semáforo pertence ao event loop em que é usado, como o cliente_http
+    global _limitador, _loop
+    loop = asyncio.get_running_loop()
+    if _limitador is None or _loop is not loop:
+        _limitador = asyncio.Semaphore(CHATGPT_CONCORRENCIA)
+        _loop = loop
+    return _limitador
+
+def chave_chatgpt(input: str, categorias: tuple):
+    """Mesma entrada (sem diferença de maiúsculas, acentos e espaços), mesmo dia e mesmas categorias."""
+    conteudo = json.dumps([normalizar_busca(input), categorias], ensure_ascii=False)
+    return f'chatgpt:despesas:{date.today()}:{hashlib.sha256(conteudo.encode()).hexdigest()}'
+
+async def buscar_categorias(db, id_usuario: int):
+    linhas = (await db.execute(select(Categorias.id_categoria, Categorias.categoria).filter(
                 and_(
                     or_(Categorias.id_usuario == id_usuario, Categorias.id_usuario == None), 
                     Categorias.status
-                )).options(joinedload(Categorias.icones)).all()
-    
-    string_categorias = ''
-    for categoria in categorias:
-        string_categorias += f"ID: {categoria.id_categoria}, Categoria: {categoria.categoria}\n"
+                )).order_by(Categorias.id_categoria))).all()
+    return tuple((id_categoria, categoria) for id_categoria, categoria in linhas)
 
-    despesa = await chatgpt(input.input, string_categorias)
+async def interpretar(input: str, categorias: tuple):
+    """Despesas do texto e o caminho que as interpretou: local, cache ou modelo."""
+    #Frases e listas simples são interpretadas aqui mesmo, sem esperar o modelo
+    despesas = interpretar_despesas(input, categorias)
+    origem = 'local'
+    if despesas is None:
+        chave = chave_chatgpt(input, categorias)
+        despesas = cache_respostas.get(chave)
+        origem = 'cache'
+        if despesas is None:
+            despesas = await chatgpt(input, categorias)
+            cache_respostas.set(chave, despesas, CHATGPT_CACHE_TTL)
+            origem = 'modelo'
 
-    return despesa 
+    estatisticas_interpretacao[origem] += 1
+    return despesas[:MAXIMO_DESPESAS], origem
 
-async def chatgpt(input: str, categorias: str):
+def converter_despesa(despesa: dict, id_usuario: int, id_categorias: set):
+    """Linha de Despesas a partir de uma despesa interpretada; levanta ValueError se não der para gravar."""
+    descricao = str(despesa.get('despesa') or '').strip()
+    if not descricao:
+        raise ValueError('Descrição vazia')
+
+    valor, _ = converter_valor(str(despesa.get('valor') or '').replace('R$', '').strip())
+    if not valor or valor <= 0:
+        raise ValueError(f"Valor inválido: {despesa.get('valor')!r}")
+
+    try:
+        vencimento = isoparse(despesa['vencimento']).replace(tzinfo=None) if despesa.get('vencimento') else datetime.combine(date.today(), time())
+        pagamento = isoparse(despesa['pagamento']).replace(tzinfo=None) if despesa.get('pagamento') else None
+    except (TypeError, ValueError):
+        raise ValueError('Data inválida')
+
+    #O modelo pode inventar um id que não é uma categoria do usuário
+    id_categoria = despesa.get('id_categoria')
+    return {
+        'id_usuario': id_usuario,
+        'id_categoria': id_categoria if id_categoria in id_categorias else None,
+        'despesa': descricao[:256],
+        'despesa_busca': normalizar_busca(descricao[:256]),
+        'valor': valor.quantize(Decimal('0.01')),
+        'vencimento': vencimento,
+        'pagamento': pagamento,
+    }
+
+@router.post("/")
+async def chat_input(input: Input, usuario: auth_dependency, db: db_dependency ):
+    categorias = await buscar_categorias(db, usuario['id_usuario'])
+    despesas, origem = await interpretar(input.input, categorias)
+
+    #Uma única despesa, como antes; listas ficam em /chatgpt/despesas
+    return {**despesas[0], 'origem': origem}
+
+@router.post("/despesas")
+async def chat_input_despesas(input: Input, usuario: auth_dependency, db: db_dependency, gravar: bool = False):
+    """
+    Todas as despesas do texto (uma lista ou uma nota inteira) em uma única interpretação.
+    Com `gravar`, as que forem válidas são gravadas juntas em um único INSERT.
+    """
+    id_usuario = usuario['id_usuario']
+    categorias = await buscar_categorias(db, id_usuario)
+    despesas, origem = await interpretar(input.input, categorias)
 
-    openai.api_key = os.getenv('CHATGPT_SECRET')
+    resposta = {'despesas': despesas, 'origem': origem}
+    if not gravar:
+        return resposta
 
-    functions = [
+    id_categorias = {id_categoria for id_categoria, _ in categorias}
+    despesas_db = []
+    erros = []
+    for posicao, despesa in enumerate(despesas):
+        try:
+            despesas_db.append(converter_despesa(despesa, id_usuario, id_categorias))
+        except ValueError as erro:
+            erros.append({'posicao': posicao, 'erro': str(erro)})
+
+    if not despesas_db:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=erros)
+
+    ids = await inserir_despesas(db, despesas_db)
+    await db.commit()
+    invalidar_usuario(id_usuario)
+    atualizar_classificador(id_usuario, adicionadas=[(despesa_db['despesa'], despesa_db['id_categoria']) for despesa_db in despesas_db])
+
+    return {**resposta, 'id_despesas': ids, 'erros': erros}
+
+@router.get("/estatisticas", status_code=status.HTTP_200_OK)
+async def estatisticas(usuario: auth_dependency):
+    total = sum(estatisticas_interpretacao.values())
+    return {
+        **estatisticas_interpretacao,
+        'taxa_local': estatisticas_interpretacao['local'] / total if total else 0,
+    }
+
+@lru_cache(maxsize=1024)
+def montar_funcoes(categorias: tuple, hoje: date):
+    """Definição da função do prompt, montada uma vez por conjunto de categorias e dia."""
+    string_categorias = ''
+    for id_categoria, categoria in categorias:
+        string_categorias += f"ID: {id_categoria}, Categoria: {categoria}\n"
+
+    return [
         {
-            "name": "criar_despesa",
-            "description": "Gostaria de criar uma despesa atraves de um input, se não for uma despesa, retorne um json vazio",
+            "name": "criar_despesas",
+            "description": "Gostaria de criar as despesas citadas no input, que pode ter uma ou várias (como uma lista ou uma nota fiscal). Se não houver despesas, retorne a lista vazia",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "id_categoria": {
-                        "type": "integer",
-                        "description": f"Categorias disponivies: {categorias}"
-                    },
-                    "despesa": {
-                        "type": "string",
-                        "description": "Nome da despesa."
-                    },
-                    "valor": {
-                        "type": "string",
-                        "description": "Valor da despesa em decimal"
-                    },
-                    "vencimento": {
-                        "type": "string",
-                        "description": f"Data de vencimento da despesa em formato datetime hoje o dia é: {date.today()}"
-                    },
-                    "pagamento": {
-                        "type": "string",
-                        "description": f"Data de pagamento da despesa é em formato datetime hoje o dia é: {date.today()} caso o pagamento não tenha sido efetuado, retorne null"
-                    },
-                }
+                    "despesas": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id_categoria": {
+                                    "type": "integer",
+                                    "description": f"Categorias disponivies: {string_categorias}"
+                                },
+                                "despesa": {
+                                    "type": "string",
+                                    "description": "Nome da despesa."
+                                },
+                                "valor": {
+                                    "type": "string",
+                                    "description": "Valor da despesa em decimal"
+                                },
+                                "vencimento": {
+                                    "type": "string",
+                                    "description": f"Data de vencimento da despesa em formato datetime hoje o dia é: {hoje}"
+                                },
+                                "pagamento": {
+                                    "type": "string",
+                                    "description": f"Data de pagamento da despesa é em formato datetime hoje o dia é: {hoje} caso o pagamento não tenha sido efetuado, retorne null"
+                                },
+                            }
+                        }
+                    }
+                },
+                "required": ["despesas"]
             }
         }
     ]
- 
-    response = openai.ChatCompletion.create(
-        model = "gpt-3.5-turbo-16k-0613",
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a useful assistant."
-            },
-            {
-                "role": "user",
-                "content": f"Aqui o input: {input}. Retorne a despesa em json."
+
+async def chatgpt(input: str, categorias: tuple):
+
+    functions = montar_funcoes(categorias, date.today())
+
+    semaforo = limitador()
+    try:
+        await asyncio.wait_for(semaforo.acquire(), CHATGPT_ESPERA)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Muitas requisições ao ChatGPT, tente novamente")
+
+    try:
+        response = await openai.ChatCompletion.acreate(
+            api_key = os.getenv('CHATGPT_SECRET'),
+            api_base = CHATGPT_API_BASE,
+            request_timeout = (CHATGPT_TIMEOUT_CONEXAO, CHATGPT_TIMEOUT),
+            model = CHATGPT_MODELO,
+            messages = [
+                {
+                    "role": "system",
+                    "content": "You are a useful assistant."
+                },
+                {
+                    "role": "user",
+                    "content": f"Aqui o input: {input}. Retorne as despesas em json."
+                }
+            ],
+            functions = functions,
+            function_call = {
+                "name": functions[0]["name"]
             }
-        ],
-        functions = functions,
-        function_call = {
-            "name": functions[0]["name"]
-        }
-    )
+        )
+    except openai.error.Timeout:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="O ChatGPT não respondeu a tempo")
+    except openai.error.OpenAIError:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Erro ao acessar o ChatGPT")
+    finally:
+        semaforo.release()
     
-    arguments = response.choices[0]["message"]["function_call"]["arguments"]
-
-    despesa = json.loads(arguments)
+    try:
+        despesas = json.loads(response.choices[0]["message"]["function_call"]["arguments"])["despesas"]
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
-    if despesa['despesa'] == None or 'valor' not in  despesa or 'id_categoria' not in despesa:
+    despesas = [
+        despesa for despesa in (despesas if isinstance(despesas, list) else [])
+        if isinstance(despesa, dict) and despesa.get('despesa') and 'valor' in despesa and 'id_categoria' in despesa
+    ]
+    if not despesas:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
-    return json.loads(arguments)
+    return despesas
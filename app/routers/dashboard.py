@@ -2,16 +2,19 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from sqlalchemy import and_, func, or_, desc
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, case, func, or_, desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from starlette import status
-from app.database import get_db
-from app.models import Categorias, Despesas, Icones, Usuarios
+from app.database import get_async_db
+from app.models import Categorias, Despesas, Icones, ResumoMensal, Usuarios
 from app.routers import auth
+from app.consultas import MAXIMO_PERIODOS, chave_periodo, contar_periodos, inicio_periodo, listar_periodos, truncar_data
+from app.recorrencias import aberto_mes_atual, expandir_recorrencias, horizonte, resumir_ocorrencias, resumir_recorrencias
+from app.cache import agrupar_requisicoes, cache_respostas, cache_usuario, estatisticas_agrupamento
 from dateutil.relativedelta import relativedelta
-import calendar
 
 
 
@@ -31,123 +34,253 @@ class Despesa(BaseModel):
     pagamento: str
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
 
+WIDGETS = ('cards', 'line_ano', 'pie_mes', 'pie_ano')
+
+async def buscar_aberto_mes_atual(db, id_usuario: int, data_atual: datetime):
+    """
+    No mês atual as despesas em aberto se dividem entre atrasadas e pendentes pelo dia de hoje.
+    Retorna (quantidade_atrasada, quantidade_pendente, valor_atrasado, valor_pendente).
+    """
+    primeiro_dia_mes_atual = data_atual.replace(day=1)
+    atrasada = Despesas.vencimento < data_atual
+    pendente = Despesas.vencimento >= data_atual
+
+    return (
+        await db.execute(
+            select(
+                func.count(case((atrasada, 1))),
+                func.count(case((pendente, 1))),
+                func.coalesce(func.sum(case((atrasada, Despesas.valor))), 0),
+                func.coalesce(func.sum(case((pendente, Despesas.valor))), 0),
+            )
+            .filter(
+                Despesas.id_usuario == id_usuario,
+                Despesas.vencimento >= primeiro_dia_mes_atual,
+                Despesas.vencimento < primeiro_dia_mes_atual + relativedelta(months=1),
+                Despesas.pagamento == None
+            )
+        )
+    ).one()
+
+def formatar_cards(resumo, aberto_mes_atual):
+    """
+    resumo: (aberto dos meses passados, aberto dos meses futuros, quantidade do mês atual, quantidade do mês anterior)
+    seguido dos valores na mesma ordem.
+    """
+    return {
+        'despesas_atrasadas' : resumo[0] + aberto_mes_atual[0],
+        'despesas_pendentes' : resumo[1] + aberto_mes_atual[1],
+        'despesas_mes_atual' : resumo[2],
+        'despesas_mes_anterior' : resumo[3],
+        'valor_atrasadas' : float(resumo[4] + aberto_mes_atual[2]),
+        'valor_pendentes' : float(resumo[5] + aberto_mes_atual[3]),
+        'valor_mes_atual' : float(resumo[6]),
+        'valor_mes_anterior' : float(resumo[7]),
+    }
+
+def acumular_resumo(linhas, data_atual: datetime):
+    """
+    Acumula linhas no formato (mes, categoria, quantidade, valor, quantidade_paga, valor_pago)
+    nos cards, nos meses do ano atual e nas categorias do mês anterior e do ano.
+    """
+    primeiro_dia_mes_atual = data_atual.replace(day=1)
+    primeiro_dia_mes_anterior = primeiro_dia_mes_atual - relativedelta(months=1)
+    ano_inicio = datetime(data_atual.year, 1, 1)
+    ano_fim = datetime(data_atual.year + 1, 1, 1)
+
+    cards = [0, 0, 0, 0, 0, 0, 0, 0]
+    meses = {}
+    categorias_mes = {}
+    categorias_ano = {}
+
+    for mes, categoria, quantidade, valor, quantidade_paga, valor_pago in linhas:
+        if mes < primeiro_dia_mes_atual:
+            cards[0] += quantidade - quantidade_paga
+            cards[4] += valor - valor_pago
+        elif mes > primeiro_dia_mes_atual:
+            cards[1] += quantidade - quantidade_paga
+            cards[5] += valor - valor_pago
+        else:
+            cards[2] += quantidade
+            cards[6] += valor
+
+        if mes == primeiro_dia_mes_anterior:
+            cards[3] += quantidade
+            cards[7] += valor
+            if categoria is not None:
+                categorias_mes[categoria] = categorias_mes.get(categoria, 0) + valor
+
+        if ano_inicio <= mes < ano_fim:
+            chave = mes.strftime('%Y-%m-%d')
+            valor_mes, quantidade_mes = meses.get(chave, (0, 0))
+            meses[chave] = (valor_mes + valor, quantidade_mes + quantidade)
+            if categoria is not None:
+                categorias_ano[categoria] = categorias_ano.get(categoria, 0) + valor
+
+    return cards, meses, categorias_mes, categorias_ano
+
+def somar_abertas_fora(cards, antes, depois):
+    """
+    Soma aos cards as ocorrências em aberto fora do período expandido, vindas de resumir_recorrencias:
+    as de antes são atrasadas e as de depois pendentes. O período expandido contém o mês atual.
+    """
+    cards[0] += antes[0]
+    cards[4] += antes[1]
+    cards[1] += depois[0]
+    cards[5] += depois[1]
+    return cards
+
+def linhas_recorrencias(ocorrencias):
+    return [(mes, categoria, *valores) for mes, _, categoria, *valores in resumir_ocorrencias(ocorrencias)]
+
+def somar_categorias(despesas_categoria, ocorrencias):
+    """Soma as ocorrências das recorrências às linhas (categoria, valor) lidas do resumo."""
+    valores = {categoria: valor for categoria, valor in despesas_categoria}
+    for ocorrencia in ocorrencias:
+        if ocorrencia.recorrencia.categorias is not None:
+            categoria = ocorrencia.recorrencia.categorias.categoria
+            valores[categoria] = valores.get(categoria, 0) + ocorrencia.valor
+    return valores.items()
+
 
 @router.get("/cards", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def dashboard_cards(
     usuario: auth_dependency, 
     db: db_dependency, ):
 
     id_usuario = usuario['id_usuario']
 
-    data_atual = datetime.now().date()
-
-    despesas_atrasadas = (
-        db.query(Despesas)
-        .filter(
-            Despesas.id_usuario == id_usuario,
-            Despesas.vencimento < data_atual,
-            Despesas.pagamento == None
-        )
-    ).count()
-
-    despesas_pendentes = (
-        db.query(Despesas)
-        .filter(
-            Despesas.id_usuario == id_usuario,
-            Despesas.vencimento >= data_atual,
-            Despesas.pagamento == None
-        )
-    ).count()
+    data_atual = datetime.combine(datetime.now().date(), datetime.min.time())
 
     primeiro_dia_mes_atual = data_atual.replace(day=1)
-    ultimo_dia_mes_atual = (data_atual.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-    
-    primeiro_dia_mes_anterior = (data_atual.replace(day=1) - timedelta(days=1)).replace(day=1)
-    ultimo_dia_mes_anterior = primeiro_dia_mes_atual - timedelta(days=1)
-
-    despesas_mes_atual = (
-        db.query(Despesas)
-        .filter(
-            Despesas.id_usuario == id_usuario,
-            Despesas.vencimento >= primeiro_dia_mes_atual,
-            Despesas.vencimento <= ultimo_dia_mes_atual
-        )
-    ).count()
-
-    despesas_mes_anterior = (
-        db.query(Despesas)
-        .filter(
-            Despesas.id_usuario == id_usuario,
-            Despesas.vencimento >= primeiro_dia_mes_anterior,
-            Despesas.vencimento <= ultimo_dia_mes_anterior
+    primeiro_dia_mes_anterior = primeiro_dia_mes_atual - relativedelta(months=1)
+
+    quantidade_aberta = ResumoMensal.quantidade - ResumoMensal.quantidade_paga
+    valor_aberto = ResumoMensal.valor - ResumoMensal.valor_pago
+    mes_passado = ResumoMensal.mes < primeiro_dia_mes_atual
+    mes_futuro = ResumoMensal.mes > primeiro_dia_mes_atual
+    mes_atual = ResumoMensal.mes == primeiro_dia_mes_atual
+    mes_anterior = ResumoMensal.mes == primeiro_dia_mes_anterior
+
+    #Contadores mensais lidos do resumo, sem percorrer o histórico de despesas
+    resumo = (
+        await db.execute(
+            select(
+                func.coalesce(func.sum(case((mes_passado, quantidade_aberta))), 0),
+                func.coalesce(func.sum(case((mes_futuro, quantidade_aberta))), 0),
+                func.coalesce(func.sum(case((mes_atual, ResumoMensal.quantidade))), 0),
+                func.coalesce(func.sum(case((mes_anterior, ResumoMensal.quantidade))), 0),
+                func.coalesce(func.sum(case((mes_passado, valor_aberto))), 0),
+                func.coalesce(func.sum(case((mes_futuro, valor_aberto))), 0),
+                func.coalesce(func.sum(case((mes_atual, ResumoMensal.valor))), 0),
+                func.coalesce(func.sum(case((mes_anterior, ResumoMensal.valor))), 0),
+            )
+            .filter(ResumoMensal.id_usuario == id_usuario)
         )
-    ).count()
+    ).one()
 
-    return {
-        'despesas_atrasadas' : despesas_atrasadas,
-        'despesas_pendentes' : despesas_pendentes,
-        'despesas_mes_atual' : despesas_mes_atual,
-        'despesas_mes_anterior' : despesas_mes_anterior
-    }
+    #Recorrências expandidas só no mês anterior e no atual; o aberto dos outros meses é somado por regra
+    ocorrencias, antes, depois = await resumir_recorrencias(db, id_usuario, primeiro_dia_mes_anterior, horizonte(data_atual))
+    cards_recorrencias, *_ = acumular_resumo(linhas_recorrencias(ocorrencias), data_atual)
+    cards_recorrencias = somar_abertas_fora(cards_recorrencias, antes, depois)
+
+    resumo = [a + b for a, b in zip(resumo, cards_recorrencias)]
+    aberto = [a + b for a, b in zip(await buscar_aberto_mes_atual(db, id_usuario, data_atual), aberto_mes_atual(ocorrencias, data_atual))]
+
+    return formatar_cards(resumo, aberto)
 
 
 @router.get("/line_ano", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def dashboard_line_ano(
     usuario: auth_dependency, 
-    db: db_dependency, ):
+    db: db_dependency, 
+    ano: int = Query(None, ge=1900, le=9999),
+    inicio: str = '',
+    fim: str = '',
+    granularidade: str = Query('mes', pattern='^(dia|semana|mes)$')):
 
     id_usuario = usuario['id_usuario']
 
-    data_atual = datetime.now()
-
-    valores_por_mes = []
-
-    for i in range(12):
-        mes = i + 1
-        mes_primeiro_dia = datetime(data_atual.year, mes, 1)
-        mes_ultimo_dia = datetime(data_atual.year, mes, calendar.monthrange(data_atual.year, mes)[1]) + timedelta(days=1)
-
-        despesas_mes = (
-            db.query(Despesas)
+    #Filtro por período (dd/mm/aaaa, inclusivo) ou pelo ano, que por padrão é o atual
+    if bool(inicio) != bool(fim):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Informe inicio e fim")
+    if inicio and fim:
+        try:
+            data_inicio = datetime.strptime(inicio, "%d/%m/%Y")
+            data_fim = datetime.strptime(fim, "%d/%m/%Y") + timedelta(days=1)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Datas devem estar no formato dd/mm/aaaa")
+    else:
+        ano = ano or datetime.now().year
+        data_inicio = datetime(ano, 1, 1)
+        data_fim = datetime(ano + 1, 1, 1)
+
+    if data_fim <= data_inicio:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Período inválido")
+    if contar_periodos(data_inicio, data_fim, granularidade) > MAXIMO_PERIODOS[granularidade]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Período muito longo: no máximo {MAXIMO_PERIODOS[granularidade]} períodos por {granularidade}")
+
+    if granularidade == 'mes' and data_inicio.day == 1 and data_fim.day == 1:
+        #Meses completos vêm direto do resumo mensal
+        despesas_query = (
+            select(ResumoMensal.mes, func.sum(ResumoMensal.valor), func.sum(ResumoMensal.quantidade))
+            .filter(
+                ResumoMensal.id_usuario == id_usuario,
+                ResumoMensal.mes >= data_inicio,
+                ResumoMensal.mes < data_fim,
+                ResumoMensal.quantidade > 0
+            )
+            .group_by(ResumoMensal.mes)
+        )
+    else:
+        periodo = truncar_data(granularidade, Despesas.vencimento)
+        despesas_query = (
+            select(periodo, func.sum(Despesas.valor), func.count())
             .filter(
                 Despesas.id_usuario == id_usuario,
-                Despesas.vencimento >= mes_primeiro_dia,
-                Despesas.vencimento <= mes_ultimo_dia
+                Despesas.vencimento >= data_inicio,
+                Despesas.vencimento < data_fim
             )
-            .all()
+            .group_by(periodo)
         )
 
-        total_despesas_mes = sum(despesa.valor for despesa in despesas_mes)
-        valores_por_mes.append(total_despesas_mes)
+    despesas_periodo = (await db.execute(despesas_query)).all()
 
-    despesas_qtd_ano = (
-        db.query(Despesas)
-        .filter(
-            Despesas.id_usuario == id_usuario,
-            Despesas.vencimento >= datetime(data_atual.year, 1, 1),
-            Despesas.vencimento <= datetime((data_atual.year + 1), 1, 1),
-        )
-        .count()
-    )
+    valores = {chave_periodo(data): (valor, quantidade) for data, valor, quantidade in despesas_periodo}
+
+    for ocorrencia in await expandir_recorrencias(db, id_usuario, data_inicio, data_fim):
+        chave = inicio_periodo(ocorrencia.vencimento, granularidade).strftime('%Y-%m-%d')
+        valor, quantidade = valores.get(chave, (0, 0))
+        valores[chave] = (valor + ocorrencia.valor, quantidade + 1)
+
+    periodos = []
+    for data in listar_periodos(data_inicio, data_fim, granularidade):
+        valor, quantidade = valores.get(data, (0, 0))
+        periodos.append({ 'periodo': data, 'valor': float(valor), 'quantidade': quantidade })
+
+    despesas_qtd_ano = sum(quantidade for _, quantidade in valores.values())
+
+    usuario = await db.get(Usuarios, id_usuario)
 
-    usuario = (
-            db.query(Usuarios)
-            .filter(Usuarios.id_usuario >= id_usuario)
-            .first()
-        )
-    
     limite_gastos = usuario.limite_gastos
 
     return {
-        'valores_por_mes' : valores_por_mes,
+        'valores_por_mes' : [periodo['valor'] for periodo in periodos],
+        'periodos' : periodos,
         'despesas_qtd_ano': despesas_qtd_ano,
         'limite_gastos' : limite_gastos
     }
 
 @router.get("/pie_mes", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def dashboard_pie_mes(
     usuario: auth_dependency, 
     db: db_dependency, ):
@@ -155,19 +288,24 @@ async def dashboard_pie_mes(
     id_usuario = usuario['id_usuario']
 
     hoje = datetime.now()
-    mes_passado_inicio = (hoje.replace(day=1) - timedelta(days=hoje.day)).replace(day=1)
-    mes_passado_fim = hoje.replace(day=1) - timedelta(days=hoje.day)
+    mes_passado_inicio = datetime(hoje.year, hoje.month, 1) - relativedelta(months=1)
 
     despesas_mes = (
-    db.query(Categorias.categoria, func.sum(Despesas.valor).label("valor"))
-        .outerjoin(Despesas, Categorias.id_categoria == Despesas.id_categoria)
-        .filter(
-            Despesas.vencimento >= mes_passado_inicio,
-            Despesas.vencimento <= mes_passado_fim,
-            Despesas.id_usuario == id_usuario
+        await db.execute(
+            select(Categorias.categoria, func.sum(ResumoMensal.valor).label("valor"))
+            .join(ResumoMensal, Categorias.id_categoria == ResumoMensal.id_categoria)
+            .filter(
+                ResumoMensal.mes == mes_passado_inicio,
+                ResumoMensal.id_usuario == id_usuario,
+                ResumoMensal.quantidade > 0
+            )
+            .group_by(Categorias.categoria)
         )
-        .group_by(Categorias.categoria)
-        .all()
+    ).all()
+
+    despesas_mes = somar_categorias(
+        despesas_mes,
+        await expandir_recorrencias(db, id_usuario, mes_passado_inicio, mes_passado_inicio + relativedelta(months=1))
     )
 
     despesas_mes_json = []
@@ -180,6 +318,8 @@ async def dashboard_pie_mes(
     }
 
 @router.get("/pie_ano", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def dashboard_pie_ano(usuario: auth_dependency, db: db_dependency):
 
     id_usuario = usuario['id_usuario']
@@ -189,16 +329,20 @@ async def dashboard_pie_ano(usuario: auth_dependency, db: db_dependency):
     ano_fim = datetime((ano + 1), 1, 1)
 
     despesas_ano = (
-    db.query(Categorias.categoria, func.sum(Despesas.valor).label("valor"))
-        .outerjoin(Despesas, Categorias.id_categoria == Despesas.id_categoria)
-        .filter(
-            Despesas.id_usuario == id_usuario,
-            Despesas.vencimento >= ano_inicio,
-            Despesas.vencimento <= ano_fim
+        await db.execute(
+            select(Categorias.categoria, func.sum(ResumoMensal.valor).label("valor"))
+            .join(ResumoMensal, Categorias.id_categoria == ResumoMensal.id_categoria)
+            .filter(
+                ResumoMensal.id_usuario == id_usuario,
+                ResumoMensal.mes >= ano_inicio,
+                ResumoMensal.mes < ano_fim,
+                ResumoMensal.quantidade > 0
+            )
+            .group_by(Categorias.categoria)
         )
-        .group_by(Categorias.categoria)
-        .all()
-    )
+    ).all()
+
+    despesas_ano = somar_categorias(despesas_ano, await expandir_recorrencias(db, id_usuario, ano_inicio, ano_fim))
 
     despesas_ano_json = []
     for categoria, valor in despesas_ano:
@@ -206,4 +350,96 @@ async def dashboard_pie_ano(usuario: auth_dependency, db: db_dependency):
 
     return {
         'despesas_ano' : despesas_ano_json,
-    }
\ No newline at end of file
+    }
+
+@router.get("/overview", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
+async def dashboard_overview(
+    usuario: auth_dependency, 
+    db: db_dependency, 
+    fields: str = ','.join(WIDGETS)):
+
+    id_usuario = usuario['id_usuario']
+
+    widgets = [campo.strip() for campo in fields.split(',') if campo.strip()]
+    if not widgets or set(widgets) - set(WIDGETS):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"fields deve conter: {', '.join(WIDGETS)}")
+
+    data_atual = datetime.combine(datetime.now().date(), datetime.min.time())
+    primeiro_dia_mes_atual = data_atual.replace(day=1)
+    primeiro_dia_mes_anterior = primeiro_dia_mes_atual - relativedelta(months=1)
+    ano_inicio = datetime(data_atual.year, 1, 1)
+    ano_fim = datetime(data_atual.year + 1, 1, 1)
+
+    #Uma única leitura do resumo mensal alimenta todos os widgets.
+    #Os cards precisam de todo o histórico em aberto; os gráficos só do ano e do mês anterior.
+    resumo_query = (
+        select(
+            ResumoMensal.mes,
+            Categorias.categoria,
+            ResumoMensal.quantidade,
+            ResumoMensal.valor,
+            ResumoMensal.quantidade_paga,
+            ResumoMensal.valor_pago
+        )
+        .outerjoin(Categorias, Categorias.id_categoria == ResumoMensal.id_categoria)
+        .filter(ResumoMensal.id_usuario == id_usuario, ResumoMensal.quantidade > 0)
+    )
+    if 'cards' not in widgets:
+        resumo_query = resumo_query.filter(
+            ResumoMensal.mes >= min(ano_inicio, primeiro_dia_mes_anterior),
+            ResumoMensal.mes < ano_fim
+        )
+
+    resumo = (await db.execute(resumo_query)).all()
+
+    if 'cards' in widgets:
+        ocorrencias, antes, depois = await resumir_recorrencias(db, id_usuario, min(ano_inicio, primeiro_dia_mes_anterior), ano_fim)
+    else:
+        ocorrencias = await expandir_recorrencias(db, id_usuario, min(ano_inicio, primeiro_dia_mes_anterior), ano_fim)
+
+    cards, meses, categorias_mes, categorias_ano = acumular_resumo(resumo + linhas_recorrencias(ocorrencias), data_atual)
+    if 'cards' in widgets:
+        cards = somar_abertas_fora(cards, antes, depois)
+
+    overview = {}
+
+    if 'cards' in widgets:
+        aberto = [a + b for a, b in zip(await buscar_aberto_mes_atual(db, id_usuario, data_atual), aberto_mes_atual(ocorrencias, data_atual))]
+        overview['cards'] = formatar_cards(cards, aberto)
+
+    if 'line_ano' in widgets:
+        periodos = []
+        for data in listar_periodos(ano_inicio, ano_fim, 'mes'):
+            valor, quantidade = meses.get(data, (0, 0))
+            periodos.append({ 'periodo': data, 'valor': float(valor), 'quantidade': quantidade })
+
+        usuario_db = await db.get(Usuarios, id_usuario)
+
+        overview['line_ano'] = {
+            'valores_por_mes' : [periodo['valor'] for periodo in periodos],
+            'periodos' : periodos,
+            'despesas_qtd_ano': sum(periodo['quantidade'] for periodo in periodos),
+            'limite_gastos' : usuario_db.limite_gastos
+        }
+
+    if 'pie_mes' in widgets:
+        overview['pie_mes'] = {
+            'despesas_mes' : [{ 'categoria': categoria, 'valor' : float(valor)} for categoria, valor in categorias_mes.items()],
+        }
+
+    if 'pie_ano' in widgets:
+        overview['pie_ano'] = {
+            'despesas_ano' : [{ 'categoria': categoria, 'valor' : float(valor)} for categoria, valor in categorias_ano.items()],
+        }
+
+    return overview
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+async def dashboard_cache(usuario: auth_dependency):
+    return {
+        **cache_respostas.estatisticas(),
+        'requisicoes_executadas': estatisticas_agrupamento['executadas'],
+        'requisicoes_agrupadas': estatisticas_agrupamento['agrupadas'],
+    }
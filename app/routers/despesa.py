@@ -1,16 +1,29 @@
+import codecs
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel
-from sqlalchemy import and_, or_, desc
-from sqlalchemy.orm import Session, joinedload
+from pydantic import BaseModel, Field
+from sqlalchemy import and_, case, func, insert, or_, desc, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 from passlib.context import CryptContext
 from starlette import status
-from app.database import get_db
+from app.database import dialeto, get_async_db
 from app.models import Categorias, Despesas, Icones
 from app.routers import auth
+from app.resumo import atualizar_resumo, valores_resumo
+from app.cache import cache_respostas, invalidar_usuario
+from app.classificador import atualizar_classificador, descartar_classificador
+from app.consultas import codificar_cursor, decodificar_cursor, normalizar_busca
+from app.busca import corresponde_pesquisa, filtro_pesquisa
+from app.recorrencias import expandir_recorrencias
+from app.importacao import ExtratoInvalido, ler_extrato
+from app.exportacao import FORMATOS, gerar_arquivo, intercalar
 from dateutil.relativedelta import relativedelta
+from dateutil.parser import isoparse
 
 
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
@@ -28,25 +41,40 @@ class Despesa(BaseModel):
     vencimento: str
     pagamento: str
 
+#Financiamentos de até 30 anos
+MAXIMO_PARCELAS = 360
+
 class DespesaParcelada(BaseModel):
     id_categoria: int
     despesa: str
     valor: float
-    parcelas: int
+    parcelas: int = Field(ge=1, le=MAXIMO_PARCELAS)
     data_primeiro_vencimento: str
-    dia_vencimento: int
+    dia_vencimento: int = Field(ge=1, le=31)
 
 class DespesaPagamento(BaseModel):
     pagamento: str
 
-db_dependency = Annotated[Session, Depends(get_db)]
+#Linhas gravadas por INSERT na importação e erros devolvidos na resposta
+LOTE_IMPORTACAO = 1000
+MAXIMO_ERROS_IMPORTACAO = 100
+#Linhas buscadas por vez no cursor do banco durante a exportação
+LOTE_EXPORTACAO = 1000
+
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
 
-def calcular_proximo_mes(data_referencia, dia_vencimento):
-    proximo_mes = data_referencia + relativedelta(months=1)
-    ultimo_dia_mes = ((datetime(proximo_mes.year, proximo_mes.month, 1) + relativedelta(months=1)) - relativedelta(days=1)).day
-    proxima_data_vencimento = datetime(proximo_mes.year, proximo_mes.month, min(dia_vencimento,  ultimo_dia_mes))
-    return proxima_data_vencimento
+def calcular_vencimentos(primeiro_mes: datetime, dia_vencimento: int, parcelas: int):
+    """Vencimentos das parcelas a partir do mês de primeiro_mes, no dia informado ou no último dia dos meses mais curtos."""
+    primeiro_mes = datetime(primeiro_mes.year, primeiro_mes.month, 1)
+    #relativedelta(day=31) limita o dia ao último dia do mês
+    return [primeiro_mes + relativedelta(months=i, day=dia_vencimento) for i in range(parcelas)]
+
+def converter_data(data: str):
+    #O driver assíncrono não converte texto para timestamp, então a conversão é feita aqui.
+    if not data:
+        return None
+    return isoparse(data)
 
 @router.post("/")
 async def add(despesa: Despesa, usuario: auth_dependency, db: db_dependency ):
@@ -60,12 +88,15 @@ async def add(despesa: Despesa, usuario: auth_dependency, db: db_dependency ):
         id_categoria = despesa.id_categoria,
         despesa = despesa.despesa,
         valor = despesa.valor,
-        vencimento = despesa.vencimento,
-        pagamento = despesa.pagamento
+        vencimento = converter_data(despesa.vencimento),
+        pagamento = converter_data(despesa.pagamento)
     )
 
     db.add(despesa_db)
-    db.commit()
+    await atualizar_resumo(db, adicionadas=[valores_resumo(despesa_db)])
+    await db.commit()
+    invalidar_usuario(id_usuario)
+    atualizar_classificador(id_usuario, adicionadas=[(despesa.despesa, despesa.id_categoria)])
 
     return {}
 
@@ -75,39 +106,187 @@ async def add_parcelado(despesa_parcelada: DespesaParcelada, usuario: auth_depen
 
     id_categoria = despesa_parcelada.id_categoria
     despesa = despesa_parcelada.despesa
-    valor = despesa_parcelada.valor / despesa_parcelada.parcelas
     parcelas = despesa_parcelada.parcelas
-    dia_vencimento = despesa_parcelada.dia_vencimento
-
-    #Começa o vencimento com um mês anterior para que o próximo mês seja o mês desejado, como primeiro.
-    vencimento = datetime.strptime(despesa_parcelada.data_primeiro_vencimento, "%m-%Y") - relativedelta(months=1)
-
-    for i in range(1, (parcelas + 1)):
-        vencimento = calcular_proximo_mes(vencimento, dia_vencimento)
-        despesa_db = Despesas(
-            id_usuario = id_usuario,
-            id_categoria = id_categoria,
-            despesa = f'{despesa} - {i} de {parcelas}',
-            valor = valor,
-            vencimento = vencimento,
-            pagamento = None
+    valor = (Decimal(str(despesa_parcelada.valor)) / parcelas).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    try:
+        primeiro_mes = datetime.strptime(despesa_parcelada.data_primeiro_vencimento, "%m-%Y")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Data do primeiro vencimento inválida")
+
+    vencimentos = calcular_vencimentos(primeiro_mes, despesa_parcelada.dia_vencimento, parcelas)
+
+    #O insert em lote não passa pelos validates do model, então a coluna de pesquisa é preenchida aqui
+    despesas_db = []
+    for i, vencimento in enumerate(vencimentos, start=1):
+        descricao = f'{despesa} - {i} de {parcelas}'
+        despesas_db.append({
+            'id_usuario': id_usuario,
+            'id_categoria': id_categoria,
+            'despesa': descricao,
+            'despesa_busca': normalizar_busca(descricao),
+            'valor': valor,
+            'vencimento': vencimento,
+            'pagamento': None,
+        })
+
+    ids = await inserir_despesas(db, despesas_db)
+    await db.commit()
+    invalidar_usuario(id_usuario)
+    atualizar_classificador(id_usuario, adicionadas=[(despesa_db['despesa'], id_categoria) for despesa_db in despesas_db])
+
+    return {'id_despesas': ids}
+
+async def inserir_despesas(db, despesas_db):
+    """
+    Grava as despesas e atualiza o resumo mensal, retornando os ids na ordem das despesas.
+    Com INSERT ... RETURNING é um único INSERT com várias linhas; sem ele (MySQL) cada
+    linha é gravada pela sessão.
+    """
+    if (await dialeto(db)).insert_returning:
+        ids = (await db.scalars(insert(Despesas).returning(Despesas.id_despesa, sort_by_parameter_order=True), despesas_db)).all()
+    else:
+        despesas = [Despesas(**despesa_db) for despesa_db in despesas_db]
+        db.add_all(despesas)
+        await db.flush()
+        ids = [despesa.id_despesa for despesa in despesas]
+    await atualizar_resumo(db, adicionadas=[valores_resumo(Despesas(**despesa_db)) for despesa_db in despesas_db])
+    return ids
+
+async def gravar_lote(db, despesas_db):
+    await db.execute(insert(Despesas), despesas_db)
+    await atualizar_resumo(db, adicionadas=[valores_resumo(Despesas(**despesa_db)) for despesa_db in despesas_db])
+
+@router.post("/importar")
+async def importar(arquivo: UploadFile, usuario: auth_dependency, db: db_dependency, id_categoria: int = 0, codificacao: str = 'utf-8-sig'):
+    """
+    Importa um extrato CSV (despesa, valor, vencimento e opcionalmente pagamento e categoria)
+    ou OFX. Linhas com erro são ignoradas e listadas na resposta; as demais são gravadas em
+    lotes e confirmadas juntas no final. O andamento fica em /despesas/importar/progresso.
+    """
+    id_usuario = usuario['id_usuario']
+    chave_progresso = f'importacao:{id_usuario}'
+
+    try:
+        codecs.lookup(codificacao)
+    except LookupError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Codificação desconhecida: {codificacao}")
+
+    #Categorias pelo nome sem acentos, com as do usuário no lugar das padrão de mesmo nome.
+    #Nomes que não existirem usam id_categoria.
+    categorias = {
+        normalizar_busca(categoria): id_categoria_db
+        for id_categoria_db, categoria in await db.execute(
+            select(Categorias.id_categoria, Categorias.categoria)
+            .filter(or_(Categorias.id_usuario == id_usuario, Categorias.id_usuario == None))
+            .order_by(Categorias.id_usuario != None)
         )
+    }
 
-        db.add(despesa_db)
+    progresso = {'arquivo': arquivo.filename, 'linhas': 0, 'importadas': 0, 'ignoradas': 0, 'erros': 0, 'concluida': False, 'falhou': False}
+    erros = []
+    lote = []
+    cache_respostas.set(chave_progresso, dict(progresso))
+
+    try:
+        for linha, dados, erro in ler_extrato(arquivo.file, arquivo.filename, codificacao):
+            progresso['linhas'] += 1
+            if erro:
+                progresso['erros'] += 1
+                if len(erros) < MAXIMO_ERROS_IMPORTACAO:
+                    erros.append({'linha': linha, 'erro': erro})
+                continue
+            if dados is None:
+                progresso['ignoradas'] += 1
+                continue
+
+            categoria = dados.pop('categoria')
+            lote.append({
+                **dados,
+                'id_usuario': id_usuario,
+                'id_categoria': categorias.get(normalizar_busca(categoria), id_categoria or None) if categoria else (id_categoria or None),
+                'despesa_busca': normalizar_busca(dados['despesa']),
+            })
+
+            if len(lote) == LOTE_IMPORTACAO:
+                await gravar_lote(db, lote)
+                progresso['importadas'] += len(lote)
+                lote = []
+                cache_respostas.set(chave_progresso, dict(progresso))
+    except Exception as erro:
+        await db.rollback()
+        #Nada foi gravado; o progresso termina como falha em vez de ficar em andamento até o TTL
+        cache_respostas.set(chave_progresso, {**progresso, 'importadas': 0, 'concluida': True, 'falhou': True})
+        if isinstance(erro, (ExtratoInvalido, UnicodeDecodeError)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Arquivo inválido: {erro}")
+        raise
+
+    if lote:
+        await gravar_lote(db, lote)
+        progresso['importadas'] += len(lote)
+
+    await db.commit()
+    invalidar_usuario(id_usuario)
+    #Um extrato pode ter muitas linhas; o classificador é remontado na próxima sugestão
+    descartar_classificador(id_usuario)
+
+    progresso['concluida'] = True
+    cache_respostas.set(chave_progresso, progresso)
+
+    return {**progresso, 'detalhes_erros': erros}
+
+@router.get("/exportar", status_code=status.HTTP_200_OK)
+async def exportar(
+    usuario: auth_dependency, 
+    db: db_dependency, 
+    formato: str = Query('csv', pattern='^(csv|ndjson)$'),
+    gzip: bool = False,
+    categoria: int = 0, 
+    pesquisa: str = '',
+    inicio: str = '',
+    fim: str = '',
+    pendente: bool = False):
+    """Todas as despesas com os filtros da listagem, em CSV ou NDJSON, geradas enquanto são lidas do banco."""
+    id_usuario = usuario['id_usuario']
+    despesas_query, ocorrencias = await filtrar_despesas(db, id_usuario, categoria, pesquisa, inicio, fim, pendente)
+
+    #Somente colunas, sem montar objetos na sessão, lidas em lotes por um cursor no servidor
+    exportacao_query = (
+        despesas_query
+        .with_only_columns(Despesas.id_despesa, Despesas.despesa, Despesas.valor, Despesas.vencimento, Despesas.pagamento, Categorias.categoria)
+        .select_from(Despesas)
+        .outerjoin(Categorias, Categorias.id_categoria == Despesas.id_categoria)
+        .order_by(desc(Despesas.vencimento), desc(Despesas.id_despesa))
+        .execution_options(yield_per=LOTE_EXPORTACAO)
+    )
+    despesas = await db.stream(exportacao_query)
 
-    db.commit()
+    nome_arquivo = f'despesas.{formato}' + ('.gz' if gzip else '')
 
-    return {}
+    #A sessão do get_async_db só é fechada depois que a resposta termina de ser enviada
+    return StreamingResponse(
+        gerar_arquivo(intercalar(despesas, ocorrencias), formato, gzip),
+        media_type = 'application/gzip' if gzip else FORMATOS[formato],
+        headers = {'Content-Disposition': f'attachment; filename="{nome_arquivo}"'},
+    )
+
+@router.get("/importar/progresso", status_code=status.HTTP_200_OK)
+async def importar_progresso(usuario: auth_dependency):
+    return cache_respostas.get(f'importacao:{usuario["id_usuario"]}') or {}
 
 @router.patch("/pagamento/{id_despesa}")
 async def editar(id_despesa: int, despesa: DespesaPagamento, usuario: auth_dependency, db: db_dependency ):
     id_usuario = usuario['id_usuario']
 
-    despesa_db = db.query(Despesas).filter(and_(Despesas.id_usuario == id_usuario, Despesas.id_despesa == id_despesa)).first()
+    despesa_db = (await db.scalars(select(Despesas).filter(and_(Despesas.id_usuario == id_usuario, Despesas.id_despesa == id_despesa)))).first()
 
-    despesa_db.pagamento = despesa.pagamento
-    
-    db.commit()
+    resumo_anterior = valores_resumo(despesa_db)
+
+    despesa_db.pagamento = converter_data(despesa.pagamento)
+
+    await atualizar_resumo(db, removidas=[resumo_anterior], adicionadas=[valores_resumo(despesa_db)])
+    await db.commit()
+    invalidar_usuario(id_usuario)
 
     return {}
 
@@ -115,17 +294,21 @@ async def editar(id_despesa: int, despesa: DespesaPagamento, usuario: auth_depen
 async def editar(id_despesa: int, despesa: Despesa, usuario: auth_dependency, db: db_dependency ):
     id_usuario = usuario['id_usuario']
 
-    despesa_db = db.query(Despesas).filter(and_(Despesas.id_usuario == id_usuario, Despesas.id_despesa == id_despesa)).first()
+    despesa_db = (await db.scalars(select(Despesas).filter(and_(Despesas.id_usuario == id_usuario, Despesas.id_despesa == id_despesa)))).first()
+
+    resumo_anterior = valores_resumo(despesa_db)
+    classificada_anterior = (despesa_db.despesa, despesa_db.id_categoria)
 
     despesa_db.id_categoria = despesa.id_categoria
     despesa_db.despesa = despesa.despesa
     despesa_db.valor = despesa.valor
-    despesa_db.vencimento = despesa.vencimento
-    despesa_db.pagamento = despesa.pagamento
-    if despesa.pagamento == '':
-        despesa_db.pagamento = None
-    
-    db.commit()
+    despesa_db.vencimento = converter_data(despesa.vencimento)
+    despesa_db.pagamento = converter_data(despesa.pagamento)
+
+    await atualizar_resumo(db, removidas=[resumo_anterior], adicionadas=[valores_resumo(despesa_db)])
+    await db.commit()
+    invalidar_usuario(id_usuario)
+    atualizar_classificador(id_usuario, adicionadas=[(despesa.despesa, despesa.id_categoria)], removidas=[classificada_anterior])
 
     return {}
 
@@ -133,10 +316,15 @@ async def editar(id_despesa: int, despesa: Despesa, usuario: auth_dependency, db
 async def remover(id_despesa: int, usuario: auth_dependency, db: db_dependency ):
     id_usuario = usuario['id_usuario']
 
-    despesa_db = db.query(Despesas).filter(and_(Despesas.id_usuario == id_usuario, Despesas.id_despesa == id_despesa) ).first()
+    despesa_db = (await db.scalars(select(Despesas).filter(and_(Despesas.id_usuario == id_usuario, Despesas.id_despesa == id_despesa) ))).first()
+
+    classificada = (despesa_db.despesa, despesa_db.id_categoria)
 
-    db.delete(despesa_db)
-    db.commit()
+    await db.delete(despesa_db)
+    await atualizar_resumo(db, removidas=[valores_resumo(despesa_db)])
+    await db.commit()
+    invalidar_usuario(id_usuario)
+    atualizar_classificador(id_usuario, removidas=[classificada])
 
     return {}
 
@@ -144,23 +332,17 @@ async def remover(id_despesa: int, usuario: auth_dependency, db: db_dependency )
 async def buscar(id_despesa: int, usuario: auth_dependency, db: db_dependency):
     
     id_usuario = usuario['id_usuario']
-    despesa = db.query(Despesas).filter((Despesas.id_usuario == id_usuario) & (Despesas.id_despesa == id_despesa)).options(joinedload(Despesas.categorias).joinedload(Categorias.icones)).first()
+    despesa = (await db.scalars(select(Despesas).filter((Despesas.id_usuario == id_usuario) & (Despesas.id_despesa == id_despesa)).options(joinedload(Despesas.categorias).joinedload(Categorias.icones)))).first()
     return despesa
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def buscar_todos(
-    usuario: auth_dependency, 
-    db: db_dependency, 
-    skip: int = Query(0, ge=0), 
-    limit: int = Query(10, le=100), 
-    categoria: int = 0, 
-    pesquisa: str = '',
-    inicio: str = '',
-    fim: str = '',
-    pendente: bool = False):
-    
-    id_usuario = usuario['id_usuario']
-    despesas_query = (db.query(Despesas).filter(Despesas.id_usuario == id_usuario).options(joinedload(Despesas.categorias).joinedload(Categorias.icones)))
+async def filtrar_despesas(db, id_usuario: int, categoria: int = 0, pesquisa: str = '', inicio: str = '', fim: str = '', pendente: bool = False):
+    """
+    Filtros da listagem de despesas, compartilhados com a exportação.
+    Retorna a consulta das despesas lançadas e as ocorrências das recorrências que passam nos mesmos filtros.
+    """
+    despesas_query = select(Despesas).filter(Despesas.id_usuario == id_usuario)
+    data_inicio = None
+    data_fim = None
     
     #Filtro somente pagamento pendente
     if pendente:
@@ -184,33 +366,104 @@ async def buscar_todos(
 
     
     #Filtro por Despesa ou Valor
-    if pesquisa:
-        valor = pesquisa.replace(".", "").replace(",", ".").replace(" ", "").replace("R", "").replace("$", "").rstrip('0').rstrip('.')
-        despesas_query = despesas_query.filter(
-            or_(
-                Despesas.despesa.ilike(f'%{pesquisa}%'),
-                Despesas.valor.ilike(f'%{valor}%')
-            )
-        )
+    if pesquisa.strip():
+        despesas_query = despesas_query.filter(filtro_pesquisa(pesquisa))
+
+    #Ocorrências das recorrências no período, calculadas sem gravar uma despesa por mês
+    ocorrencias = [
+        ocorrencia for ocorrencia in await expandir_recorrencias(db, id_usuario, data_inicio, data_fim, categoria)
+        if (not pendente or ocorrencia.pagamento is None)
+        and (not pesquisa.strip() or corresponde_pesquisa(pesquisa, ocorrencia.despesa, ocorrencia.valor))
+    ]
+
+    return despesas_query, ocorrencias
+
+@router.get("/", status_code=status.HTTP_200_OK)
+async def buscar_todos(
+    usuario: auth_dependency, 
+    db: db_dependency, 
+    skip: int = Query(0, ge=0), 
+    limit: int = Query(10, ge=1, le=100), 
+    cursor: str = '',
+    totais: bool = True,
+    categoria: int = 0, 
+    pesquisa: str = '',
+    inicio: str = '',
+    fim: str = '',
+    pendente: bool = False):
+    
+    id_usuario = usuario['id_usuario']
+    despesas_query, ocorrencias = await filtrar_despesas(db, id_usuario, categoria, pesquisa, inicio, fim, pendente)
 
-    despesas = despesas_query.order_by(desc(Despesas.vencimento)).offset(skip).limit(limit).all()
-    total = despesas_query.count()
-    valor_total = 0
-    valor_pago = 0
-    valor_aberto = 0
+    #Paginação por cursor na chave (vencimento, grupo, id, parcela) do último item; sem cursor, mantém o skip quando não há ocorrências
+    pagina_query = (
+        despesas_query
+        .options(joinedload(Despesas.categorias).joinedload(Categorias.icones))
+        .order_by(desc(Despesas.vencimento), desc(Despesas.id_despesa))
+    )
 
-    for despesa in despesas:
-        valor_total += despesa.valor
-        if despesa.pagamento is None:
-            valor_aberto += despesa.valor
+    ocorrencias_pagina = ocorrencias
+    limite_query = limit + 1
+    if cursor:
+        try:
+            chave_cursor = decodificar_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+
+        cursor_vencimento, cursor_grupo, cursor_id, _ = chave_cursor
+        if cursor_grupo == 1:
+            pagina_query = pagina_query.filter(tuple_(Despesas.vencimento, Despesas.id_despesa) < tuple_(cursor_vencimento, cursor_id))
+        else:
+            #No mesmo vencimento as despesas vêm antes das ocorrências, então já foram listadas
+            pagina_query = pagina_query.filter(Despesas.vencimento < cursor_vencimento)
+        ocorrencias_pagina = [ocorrencia for ocorrencia in ocorrencias if ocorrencia.chave < chave_cursor]
+    elif ocorrencias and skip:
+        #Com ocorrências o skip precisaria ler todas as despesas anteriores; a paginação é pelo cursor
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use o cursor para paginar despesas com recorrências")
+    elif not ocorrencias:
+        pagina_query = pagina_query.offset(skip)
+
+    despesas = (await db.scalars(pagina_query.limit(limite_query))).all()
+
+    itens = sorted(
+        [((despesa.vencimento, 1, despesa.id_despesa, 0), despesa) for despesa in despesas]
+        + [(ocorrencia.chave, ocorrencia) for ocorrencia in ocorrencias_pagina],
+        key=lambda item: item[0],
+        reverse=True
+    )
+    proximo_cursor = None
+    if len(itens) > limit:
+        itens = itens[:limit]
+        proximo_cursor = codificar_cursor(itens[-1][0])
+
+    #Quantidade e valores de todas as despesas filtradas em uma única consulta agregada
+    total = None
+    valor_total_reais = None
+    valor_pago_reais = None
+    valor_aberto_reais = None
+
+    if totais:
+        total, valor_total, valor_aberto = (
+            await db.execute(
+                despesas_query.with_only_columns(
+                    func.count(),
+                    func.coalesce(func.sum(Despesas.valor), 0),
+                    func.coalesce(func.sum(case((Despesas.pagamento == None, Despesas.valor))), 0),
+                )
+            )
+        ).one()
+
+        total += len(ocorrencias)
+        valor_total += sum(ocorrencia.valor for ocorrencia in ocorrencias)
+        valor_aberto += sum(ocorrencia.valor for ocorrencia in ocorrencias if ocorrencia.pagamento is None)
 
-    valor_pago = valor_total - valor_aberto
+        valor_pago = valor_total - valor_aberto
 
-    valor_total_reais = f"R$ {valor_total}".replace(".", ",")
-    valor_pago_reais = f"R$ {valor_pago}".replace(".", ",")
-    valor_aberto_reais = f"R$ {valor_aberto}".replace(".", ",")
+        valor_total_reais = f"R$ {valor_total}".replace(".", ",")
+        valor_pago_reais = f"R$ {valor_pago}".replace(".", ",")
+        valor_aberto_reais = f"R$ {valor_aberto}".replace(".", ",")
 
-    despesa_serialized = [despesa.serialize() for despesa in despesas]
+    despesa_serialized = [item.serialize() for _, item in itens]
 
     return {  
         'despesas': despesa_serialized , 
@@ -218,5 +471,5 @@ async def buscar_todos(
         "valor_total": valor_total_reais, 
         "valor_pago": valor_pago_reais, 
         "valor_aberto": valor_aberto_reais,
+        "proximo_cursor": proximo_cursor,
     }
-
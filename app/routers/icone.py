@@ -1,12 +1,14 @@
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from starlette import status
-from app.database import get_db
+from app.database import get_async_db
 from app.models import Categorias, Usuarios, Icones
 from app.routers import auth
+from app.cache import agrupar_requisicoes, cache_usuario
 
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
@@ -16,14 +18,16 @@ router = APIRouter(
     tags=['Icones']
 )
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
 
 @router.get("/disponiveis", status_code=status.HTTP_200_OK)
+@cache_usuario
+@agrupar_requisicoes
 async def buscar_icones(usuario: auth_dependency, db: db_dependency):
     id_usuario = usuario['id_usuario']
-    icones = db.query(Icones).filter(
-        ~Icones.id_icone.in_(db.query(Categorias.id_icone).filter((Categorias.id_usuario == id_usuario) | (Categorias.id_usuario == None)))
-    ).all()
+    icones = (await db.scalars(select(Icones).filter(
+        ~Icones.id_icone.in_(select(Categorias.id_icone).filter((Categorias.id_usuario == id_usuario) | (Categorias.id_usuario == None)))
+    ))).all()
     
     return icones
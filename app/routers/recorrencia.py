@@ -0,0 +1,163 @@
+from typing import Annotated, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from starlette import status
+from app.database import get_async_db
+from app.models import Categorias, OcorrenciasRecorrencia, Recorrencias
+from app.routers import auth
+from app.routers.despesa import MAXIMO_PARCELAS, converter_data
+from app.recorrencias import meses_entre, vencimento_parcela
+from app.cache import invalidar_usuario
+
+router = APIRouter(
+    prefix='/recorrencias',
+    tags=['Recorrências']
+)
+
+class Recorrencia(BaseModel):
+    id_categoria: int
+    despesa: str
+    valor: float
+    data_primeiro_vencimento: str
+    dia_vencimento: int = Field(ge=1, le=31)
+    #Vazio para contas mensais sem data para acabar
+    parcelas: Optional[int] = Field(None, ge=1, le=MAXIMO_PARCELAS)
+
+class RecorrenciaEncerramento(BaseModel):
+    ultimo_vencimento: str
+
+class OcorrenciaAlteracao(BaseModel):
+    valor: Optional[float] = None
+    pagamento: Optional[str] = None
+
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
+
+def converter_mes(mes: str):
+    try:
+        return datetime.strptime(mes, "%m-%Y")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Mês inválido, use mm-aaaa")
+
+async def buscar_recorrencia(db, id_usuario: int, id_recorrencia: int):
+    recorrencia = (await db.scalars(select(Recorrencias).filter(Recorrencias.id_usuario == id_usuario, Recorrencias.id_recorrencia == id_recorrencia))).first()
+    if not recorrencia:
+        raise HTTPException(status_code=404, detail="Recorrência não encontrada")
+    return recorrencia
+
+async def buscar_ocorrencia(db, recorrencia: Recorrencias, parcela: int):
+    """Registro de alteração da ocorrência, criado na primeira alteração."""
+    if parcela < 1 or (recorrencia.parcelas and parcela > recorrencia.parcelas) or (recorrencia.fim and vencimento_parcela(recorrencia, parcela) >= recorrencia.fim):
+        raise HTTPException(status_code=404, detail="Ocorrência não encontrada")
+
+    ocorrencia = (await db.scalars(select(OcorrenciasRecorrencia).filter(OcorrenciasRecorrencia.id_recorrencia == recorrencia.id_recorrencia, OcorrenciasRecorrencia.parcela == parcela))).first()
+    if ocorrencia is None:
+        ocorrencia = OcorrenciasRecorrencia(id_recorrencia = recorrencia.id_recorrencia, parcela = parcela, removida = False)
+        db.add(ocorrencia)
+    return ocorrencia
+
+@router.post("/")
+async def add(recorrencia: Recorrencia, usuario: auth_dependency, db: db_dependency ):
+    id_usuario = usuario['id_usuario']
+
+    recorrencia_db = Recorrencias(
+        id_usuario = id_usuario,
+        id_categoria = recorrencia.id_categoria,
+        despesa = recorrencia.despesa,
+        valor = recorrencia.valor,
+        dia_vencimento = recorrencia.dia_vencimento,
+        inicio = converter_mes(recorrencia.data_primeiro_vencimento),
+        parcelas = recorrencia.parcelas,
+        criado = datetime.now()
+    )
+
+    db.add(recorrencia_db)
+    await db.commit()
+    invalidar_usuario(id_usuario)
+
+    return {'id_recorrencia': recorrencia_db.id_recorrencia}
+
+@router.get("/", status_code=status.HTTP_200_OK)
+async def buscar_todos(usuario: auth_dependency, db: db_dependency):
+    id_usuario = usuario['id_usuario']
+
+    recorrencias = (await db.scalars(
+        select(Recorrencias)
+        .filter(Recorrencias.id_usuario == id_usuario)
+        .options(joinedload(Recorrencias.categorias).joinedload(Categorias.icones))
+        .order_by(desc(Recorrencias.id_recorrencia))
+    )).all()
+
+    return [recorrencia.serialize() for recorrencia in recorrencias]
+
+@router.patch("/{id_recorrencia}/encerrar")
+async def encerrar(id_recorrencia: int, encerramento: RecorrenciaEncerramento, usuario: auth_dependency, db: db_dependency ):
+    id_usuario = usuario['id_usuario']
+
+    recorrencia_db = await buscar_recorrencia(db, id_usuario, id_recorrencia)
+
+    ultimo_mes = converter_mes(encerramento.ultimo_vencimento)
+    if meses_entre(recorrencia_db.inicio, ultimo_mes) < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O último vencimento é anterior ao primeiro")
+
+    recorrencia_db.fim = ultimo_mes + relativedelta(months=1)
+
+    await db.commit()
+    invalidar_usuario(id_usuario)
+
+    return {}
+
+@router.delete("/{id_recorrencia}")
+async def remover(id_recorrencia: int, usuario: auth_dependency, db: db_dependency ):
+    id_usuario = usuario['id_usuario']
+
+    recorrencia_db = (await db.scalars(
+        select(Recorrencias)
+        .filter(Recorrencias.id_usuario == id_usuario, Recorrencias.id_recorrencia == id_recorrencia)
+        .options(joinedload(Recorrencias.ocorrencias))
+    )).unique().first()
+    if not recorrencia_db:
+        raise HTTPException(status_code=404, detail="Recorrência não encontrada")
+
+    await db.delete(recorrencia_db)
+    await db.commit()
+    invalidar_usuario(id_usuario)
+
+    return {}
+
+@router.patch("/{id_recorrencia}/ocorrencias/{parcela}")
+async def editar_ocorrencia(id_recorrencia: int, parcela: int, alteracao: OcorrenciaAlteracao, usuario: auth_dependency, db: db_dependency ):
+    id_usuario = usuario['id_usuario']
+
+    recorrencia_db = await buscar_recorrencia(db, id_usuario, id_recorrencia)
+    ocorrencia_db = await buscar_ocorrencia(db, recorrencia_db, parcela)
+
+    #Somente os campos enviados são alterados; pagamento '' desfaz o pagamento
+    if alteracao.valor is not None:
+        ocorrencia_db.valor = alteracao.valor
+    if alteracao.pagamento is not None:
+        ocorrencia_db.pagamento = converter_data(alteracao.pagamento)
+
+    await db.commit()
+    invalidar_usuario(id_usuario)
+
+    return {}
+
+@router.delete("/{id_recorrencia}/ocorrencias/{parcela}")
+async def remover_ocorrencia(id_recorrencia: int, parcela: int, usuario: auth_dependency, db: db_dependency ):
+    id_usuario = usuario['id_usuario']
+
+    recorrencia_db = await buscar_recorrencia(db, id_usuario, id_recorrencia)
+    ocorrencia_db = await buscar_ocorrencia(db, recorrencia_db, parcela)
+
+    ocorrencia_db.removida = True
+
+    await db.commit()
+    invalidar_usuario(id_usuario)
+
+    return {}
@@ -0,0 +1,19 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+from app.database import get_async_db
+from app.routers import auth
+from app import tarefas
+
+router = APIRouter(
+    prefix='/tarefas',
+    tags=['Tarefas']
+)
+
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+auth_dependency = Annotated[dict, Depends(auth.buscar_usuario_auth)]
+
+@router.get("/estatisticas", status_code=status.HTTP_200_OK)
+async def estatisticas(usuario: auth_dependency, db: db_dependency):
+    return await tarefas.estatisticas(db)
@@ -1,32 +1,138 @@
+"""
+Envio de e-mails pela fila de tarefas (app/tarefas.py).
+
+As rotas só gravam a tarefa 'email' e respondem. O worker envia por uma conexão SMTP
+autenticada que fica aberta entre as mensagens e é fechada depois de MAIL_OCIOSO segundos
+sem envios; falhas são repetidas pela fila, com espera crescente. Os templates são
+compilados uma única vez por processo.
+"""
+import asyncio
 import os
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from email.message import EmailMessage
+from email.utils import formataddr
 from typing import Dict
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from dotenv import load_dotenv, find_dotenv
+from app.tarefas import PRIORIDADE_ALTA, TarefaInvalida, enfileirar, tarefa
 
 
 load_dotenv()
 
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM = os.getenv("MAIL_USERNAME"),
-    MAIL_PORT = 587,
-    MAIL_SERVER = "smtp.gmail.com",
-    MAIL_FROM_NAME = "Compra Inteligente",
-    MAIL_SSL_TLS=False,
-    MAIL_STARTTLS=True,
-    USE_CREDENTIALS=True,
-    TEMPLATE_FOLDER="app/templates"
+MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM", MAIL_USERNAME)
+MAIL_FROM_NAME = "Compra Inteligente"
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() == "true"
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() == "true"
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", 30))
+MAIL_OCIOSO = float(os.getenv("MAIL_OCIOSO", 60))
+
+templates = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    autoescape=select_autoescape(['html']),
 )
+#Somente estes templates podem ser usados pelas tarefas 'email'
+TEMPLATES_EMAIL = {nome: templates.get_template(nome) for nome in ('recuperar-senha.html',)}
+
+class DespachanteEmail:
+    """Conexão SMTP autenticada mantida aberta entre os envios do worker."""
+
+    def __init__(self):
+        self.smtp = None
+        self.loop = None
+        self.fechamento = None
+        self.enviados = 0
+        self.falhas = 0
+        self.conexoes = 0
+
+    async def conectar(self):
+        loop = asyncio.get_running_loop()
+        #A conexão pertence ao event loop em que foi aberta, como o cliente_http
+        if self.smtp is not None and self.smtp.is_connected and self.loop is loop:
+            return self.smtp
+
+        smtp = aiosmtplib.SMTP(
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS,
+            timeout=MAIL_TIMEOUT,
+        )
+        await smtp.connect()
+        if MAIL_USERNAME and MAIL_PASSWORD:
+            await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self.smtp = smtp
+        self.loop = loop
+        self.conexoes += 1
+        return smtp
+
+    async def desconectar(self):
+        if self.fechamento is not None:
+            self.fechamento.cancel()
+            self.fechamento = None
+        smtp, self.smtp = self.smtp, None
+        if smtp is None or self.loop is not asyncio.get_running_loop():
+            return
+        try:
+            await smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            smtp.close()
+
+    def agendar_fechamento(self):
+        if self.fechamento is not None:
+            self.fechamento.cancel()
+        self.fechamento = self.loop.call_later(MAIL_OCIOSO, lambda: self.loop.create_task(self.desconectar()))
+
+    async def enviar(self, mensagem: EmailMessage):
+        """Envia pela conexão aberta. Os erros são repassados para a fila de tarefas repetir o envio."""
+        try:
+            smtp = await self.conectar()
+            try:
+                await smtp.send_message(mensagem)
+            except aiosmtplib.SMTPServerDisconnected:
+                #O servidor pode ter fechado a conexão ociosa; uma nova conexão resolve
+                await self.desconectar()
+                smtp = await self.conectar()
+                await smtp.send_message(mensagem)
+        except (aiosmtplib.SMTPException, OSError):
+            self.falhas += 1
+            await self.desconectar()
+            raise
+        self.enviados += 1
+        self.agendar_fechamento()
+
+    async def fechar(self):
+        await self.desconectar()
+
+despachante = DespachanteEmail()
+
+def criar_mensagem(subject: str, email_to: str, html: str):
+    mensagem = EmailMessage()
+    mensagem['From'] = formataddr((MAIL_FROM_NAME, MAIL_FROM))
+    mensagem['To'] = email_to
+    mensagem['Subject'] = subject
+    mensagem.set_content(html, subtype='html')
+    return mensagem
 
-async def recuperar_senha_mail(subject: str, email_to: str, body: Dict):
-    message = MessageSchema(
-        subject=subject,
-        recipients=[email_to],
-        template_body=body,
-        subtype="html"
-    )
+async def fechar_email():
+    await despachante.fechar()
 
-    fm = FastMail(conf)
+@tarefa('email')
+async def enviar_email(db, dados: Dict):
+    template = TEMPLATES_EMAIL.get(dados['template'])
+    if template is None:
+        raise TarefaInvalida(f"Template de e-mail não permitido: {dados['template']!r}")
+    html = template.render(**dados['contexto'])
+    await despachante.enviar(criar_mensagem(dados['assunto'], dados['para'], html))
 
-    await fm.send_message(message=message, template_name="recuperar-senha.html")
+async def recuperar_senha_mail(db, subject: str, email_to: str, body: Dict):
+    """Coloca o e-mail na fila de tarefas; quem chamou faz o commit."""
+    enfileirar(db, 'email', {
+        'assunto': subject,
+        'para': email_to,
+        'template': 'recuperar-senha.html',
+        'contexto': body,
+    }, prioridade=PRIORIDADE_ALTA)
@@ -0,0 +1,38 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+SENHA_WORKERS = int(os.getenv("SENHA_WORKERS", 2))
+
+# min/max iguais ao custo atual fazem o passlib marcar hashes com outro custo para atualização.
+bcrypt_context = CryptContext(
+    schemes=['bcrypt'],
+    deprecated='auto',
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# O bcrypt libera o GIL, então um pool de threads limitado basta para tirar o custo do event loop
+# sem deixar um pico de logins ocupar todos os núcleos do worker.
+executor = ThreadPoolExecutor(max_workers=SENHA_WORKERS, thread_name_prefix='senha')
+
+async def gerar_hash(senha: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, bcrypt_context.hash, senha)
+
+async def verificar_senha(senha: str, senha_hash: str):
+    """
+    Retorna (valida, novo_hash). novo_hash vem preenchido quando o hash salvo usa
+    um custo diferente de BCRYPT_ROUNDS e deve ser regravado.
+    """
+    if not senha_hash:
+        return False, None
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, bcrypt_context.verify_and_update, senha, senha_hash)
@@ -0,0 +1,172 @@
+"""
+Fila de tarefas guardada no próprio banco e executada pelo worker (worker.py).
+
+As rotas adicionam a tarefa com enfileirar na mesma transação das suas alterações, então
+a tarefa só existe se o commit da rota aconteceu. O worker reserva lotes de tarefas
+disponíveis, da maior prioridade para a menor: no PostgreSQL com SELECT ... FOR UPDATE
+SKIP LOCKED, para vários workers não disputarem as mesmas linhas; nos outros bancos com um
+único UPDATE que marca o lote com uma reserva, atômico no SQLite. A reserva vale
+TAREFAS_VISIBILIDADE segundos: se o worker morrer, a tarefa volta para a fila depois disso.
+Falhas são repetidas com espera exponencial até maximo_tentativas; depois a tarefa fica
+com estado 'falhou' e o último erro.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, func, or_, select, update
+from app.database import dialeto
+from app.models import Tarefas
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+TAREFAS_LOTE = int(os.getenv("TAREFAS_LOTE", 20))
+TAREFAS_TENTATIVAS = int(os.getenv("TAREFAS_TENTATIVAS", 5))
+TAREFAS_ESPERA_TENTATIVA = float(os.getenv("TAREFAS_ESPERA_TENTATIVA", 10))
+TAREFAS_ESPERA_MAXIMA = float(os.getenv("TAREFAS_ESPERA_MAXIMA", 3600))
+TAREFAS_VISIBILIDADE = float(os.getenv("TAREFAS_VISIBILIDADE", 300))
+TAREFAS_INTERVALO = float(os.getenv("TAREFAS_INTERVALO", 1))
+
+PRIORIDADE_ALTA = 10
+PRIORIDADE_NORMAL = 0
+PRIORIDADE_BAIXA = -10
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+FALHOU = 'falhou'
+
+logger = logging.getLogger(__name__)
+
+class TarefaInvalida(Exception):
+    """Erro que não adianta repetir: a tarefa falha na hora, sem novas tentativas."""
+
+tipos = {}
+
+def tarefa(tipo: str):
+    """Registra a função assíncrona (db, dados) que executa as tarefas do tipo."""
+    def registrar(funcao):
+        tipos[tipo] = funcao
+        return funcao
+    return registrar
+
+def enfileirar(db, tipo: str, dados: dict, prioridade: int = PRIORIDADE_NORMAL, atraso: float = 0, tentativas: int = None):
+    """Adiciona a tarefa à sessão. Ela só é gravada no commit de quem chamou."""
+    agora = datetime.now()
+    tarefa_db = Tarefas(
+        tipo = tipo,
+        dados = json.dumps(dados),
+        prioridade = prioridade,
+        estado = PENDENTE,
+        tentativas = 0,
+        maximo_tentativas = tentativas or TAREFAS_TENTATIVAS,
+        disponivel_em = agora + timedelta(seconds=atraso),
+        criado = agora
+    )
+    db.add(tarefa_db)
+    return tarefa_db
+
+def espera_tentativa(tentativas: int):
+    return min(TAREFAS_ESPERA_TENTATIVA * 2 ** (tentativas - 1), TAREFAS_ESPERA_MAXIMA)
+
+def disponiveis(agora: datetime):
+    #Tarefas em execução com a reserva vencida são de um worker que parou no meio
+    return or_(
+        and_(Tarefas.estado == PENDENTE, Tarefas.disponivel_em <= agora),
+        and_(Tarefas.estado == EXECUTANDO, Tarefas.reservada_ate < agora),
+    )
+
+async def reservar(db, quantidade: int = TAREFAS_LOTE):
+    """Reserva até `quantidade` tarefas para este worker e retorna as linhas reservadas."""
+    agora = datetime.now()
+    reserva = str(uuid.uuid4())
+    candidatas = (
+        select(Tarefas.id_tarefa)
+        .where(disponiveis(agora))
+        .order_by(Tarefas.prioridade.desc(), Tarefas.disponivel_em, Tarefas.id_tarefa)
+        .limit(quantidade)
+    )
+
+    #Os ids são lidos antes do UPDATE: o MySQL não aceita LIMIT dentro de IN nem subconsulta na própria tabela.
+    #Sem SKIP LOCKED (SQLite), a condição disponiveis no UPDATE evita reservar uma tarefa que outro worker pegou.
+    if (await dialeto(db)).name in ('postgresql', 'mysql'):
+        candidatas = candidatas.with_for_update(skip_locked=True)
+    ids = (await db.scalars(candidatas)).all()
+    if not ids:
+        await db.commit()
+        return []
+
+    await db.execute(
+        update(Tarefas)
+        .where(Tarefas.id_tarefa.in_(ids), disponiveis(agora))
+        .values(
+            estado = EXECUTANDO,
+            reserva = reserva,
+            reservada_ate = agora + timedelta(seconds=TAREFAS_VISIBILIDADE),
+            tentativas = Tarefas.tentativas + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    return (await db.execute(
+        select(Tarefas.id_tarefa, Tarefas.tipo, Tarefas.dados, Tarefas.tentativas, Tarefas.maximo_tentativas, Tarefas.reserva)
+        .where(Tarefas.reserva == reserva)
+        .order_by(Tarefas.prioridade.desc(), Tarefas.disponivel_em, Tarefas.id_tarefa)
+    )).all()
+
+async def executar(db, tarefa_db):
+    """Executa uma tarefa reservada. Retorna True se ela foi concluída."""
+    #A condição pela reserva evita alterar uma tarefa que outro worker reservou depois de a nossa vencer
+    minha = and_(Tarefas.id_tarefa == tarefa_db.id_tarefa, Tarefas.reserva == tarefa_db.reserva)
+    funcao = tipos.get(tarefa_db.tipo)
+    try:
+        if funcao is None:
+            raise TarefaInvalida(f'Tipo de tarefa desconhecido: {tarefa_db.tipo}')
+        if tarefa_db.tentativas > tarefa_db.maximo_tentativas:
+            raise TarefaInvalida('Reserva vencida na última tentativa')
+        await asyncio.wait_for(funcao(db, json.loads(tarefa_db.dados)), TAREFAS_VISIBILIDADE)
+    except Exception as erro:
+        await db.rollback()
+        logger.warning('Tarefa %s (%s) falhou na tentativa %d: %r', tarefa_db.id_tarefa, tarefa_db.tipo, tarefa_db.tentativas, erro)
+        if isinstance(erro, TarefaInvalida) or tarefa_db.tentativas >= tarefa_db.maximo_tentativas:
+            valores = {'estado': FALHOU}
+        else:
+            valores = {'estado': PENDENTE, 'disponivel_em': datetime.now() + timedelta(seconds=espera_tentativa(tarefa_db.tentativas))}
+        await db.execute(update(Tarefas).where(minha).values(**valores, erro=repr(erro)[:2000], reserva=None, reservada_ate=None))
+        await db.commit()
+        return False
+
+    await db.execute(delete(Tarefas).where(minha))
+    await db.commit()
+    return True
+
+async def processar(db, quantidade: int = TAREFAS_LOTE):
+    """Reserva e executa um lote. Retorna a quantidade de tarefas executadas, com ou sem sucesso."""
+    lote = await reservar(db, quantidade)
+    for tarefa_db in lote:
+        await executar(db, tarefa_db)
+    return len(lote)
+
+async def estatisticas(db):
+    """Profundidade da fila por estado e por tipo, e há quantos segundos espera a tarefa disponível mais antiga."""
+    agora = datetime.now()
+    resultado = {PENDENTE: 0, EXECUTANDO: 0, FALHOU: 0, 'disponiveis': 0, 'espera_maxima': 0, 'tipos': {}}
+
+    for estado, tipo, quantidade in await db.execute(
+        select(Tarefas.estado, Tarefas.tipo, func.count()).group_by(Tarefas.estado, Tarefas.tipo)
+    ):
+        resultado[estado] = resultado.get(estado, 0) + quantidade
+        resultado['tipos'].setdefault(tipo, {})[estado] = quantidade
+
+    disponiveis_quantidade, mais_antiga = (await db.execute(
+        select(func.count(), func.min(Tarefas.disponivel_em))
+        .where(Tarefas.estado == PENDENTE, Tarefas.disponivel_em <= agora)
+    )).one()
+    resultado['disponiveis'] = disponiveis_quantidade
+    if mais_antiga is not None:
+        resultado['espera_maxima'] = round((agora - mais_antiga).total_seconds(), 3)
+
+    return resultado
@@ -0,0 +1,111 @@
+"""
+Tokens JWT de acesso, de renovação (refresh) e de recuperação de senha.
+
+Todos expiram (`exp`) e têm um identificador (`jti`) e um `tipo`, para que um token de
+renovação ou de recuperação não seja aceito como token de acesso. As claims já verificadas
+ficam em um LRU local ao processo até o token expirar, então requisições repetidas da mesma
+sessão não refazem a verificação da assinatura. Os tokens revogados (logout, renovação e
+recuperação de senha) ficam na tabela tokens_revogados até a data em que expirariam, então
+a revogação vale para todos os workers e sobrevive a reinícios. A consulta à tabela fica em
+cache por `jti`, no mesmo backend do cache de respostas (app.cache): o token revogado até expirar e o válido por
+TOKENS_REVOGACAO_TTL segundos. A revogação grava a entrada na hora, então no cache
+compartilhado entre os workers ela vale sem esperar esse tempo.
+"""
+import os
+import time
+import uuid
+from datetime import datetime
+from jose import jwt, JWTError
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv, find_dotenv
+from app.cache import CacheMemoria, criar_cache
+from app.models import TokensRevogados
+
+load_dotenv(find_dotenv())
+
+SECRET_KEY = os.getenv("SECRET_KEY")
+SECRET_ALGORITHM = os.getenv("SECRET_ALGORITHM")
+
+ACCESS_TOKEN_MINUTOS = int(os.getenv("ACCESS_TOKEN_MINUTOS", 60))
+REFRESH_TOKEN_DIAS = int(os.getenv("REFRESH_TOKEN_DIAS", 30))
+RECUPERACAO_TOKEN_HORAS = int(os.getenv("RECUPERACAO_TOKEN_HORAS", 20))
+TOKENS_CACHE_TAMANHO = int(os.getenv("TOKENS_CACHE_TAMANHO", 10000))
+TOKENS_REVOGACAO_TTL = int(os.getenv("TOKENS_REVOGACAO_TTL", 30))
+
+ACESSO = 'acesso'
+RENOVACAO = 'renovacao'
+RECUPERACAO = 'recuperacao'
+
+DURACOES = {
+    ACESSO: ACCESS_TOKEN_MINUTOS * 60,
+    RENOVACAO: REFRESH_TOKEN_DIAS * 24 * 60 * 60,
+    RECUPERACAO: RECUPERACAO_TOKEN_HORAS * 60 * 60,
+}
+
+# Chave: o próprio token. O TTL de cada item é o tempo que falta para o token expirar.
+tokens_verificados = CacheMemoria(TOKENS_CACHE_TAMANHO, DURACOES[ACESSO])
+# Chave: revogado:{jti}. Compartilhado entre os workers quando CACHE_COMPARTILHADO está configurado.
+revogacoes = criar_cache()
+
+class TokenInvalido(Exception):
+    pass
+
+def criar_token(email: str, id_usuario: int, tipo: str = ACESSO):
+    agora = int(time.time())
+    encode = {
+        'sub': email,
+        'id': id_usuario,
+        'tipo': tipo,
+        'jti': uuid.uuid4().hex,
+        'iat': agora,
+        'exp': agora + DURACOES[tipo],
+    }
+    return jwt.encode(encode, SECRET_KEY, algorithm=SECRET_ALGORITHM)
+
+async def verificar_token(db, token: str, tipo: str = ACESSO):
+    """Claims do token, se a assinatura for válida, ele não expirou, é do tipo pedido e não foi revogado."""
+    claims = tokens_verificados.get(token)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[SECRET_ALGORITHM], options={'require_exp': True})
+        except JWTError:
+            raise TokenInvalido()
+        if claims.get('sub') is None or claims.get('id') is None or claims.get('jti') is None:
+            raise TokenInvalido()
+        restante = claims['exp'] - time.time()
+        if restante > 0:
+            tokens_verificados.set(token, claims, restante)
+
+    if claims.get('tipo') != tipo or await token_revogado(db, claims):
+        raise TokenInvalido()
+
+    return claims
+
+def guardar_revogacao(claims: dict, revogado: bool):
+    restante = max(1, int(claims['exp'] - time.time()))
+    revogacoes.set(f"revogado:{claims['jti']}", revogado, restante if revogado else min(restante, TOKENS_REVOGACAO_TTL))
+
+async def revogar_token(db, claims: dict):
+    """
+    Grava a revogação e faz o commit. Retorna False se o token já estava revogado, o que
+    permite recusar o segundo uso de um token de uso único mesmo em requisições simultâneas.
+    """
+    #As revogações vencidas são apagadas aos poucos, a cada nova revogação
+    await db.execute(delete(TokensRevogados).where(TokensRevogados.expira < datetime.now()))
+    db.add(TokensRevogados(jti=claims['jti'], expira=datetime.fromtimestamp(claims['exp'])))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        guardar_revogacao(claims, True)
+        return False
+    guardar_revogacao(claims, True)
+    return True
+
+async def token_revogado(db, claims: dict):
+    revogado = revogacoes.get(f"revogado:{claims['jti']}")
+    if revogado is None:
+        revogado = (await db.scalar(select(TokensRevogados.jti).where(TokensRevogados.jti == claims['jti']))) is not None
+        guardar_revogacao(claims, revogado)
+    return revogado
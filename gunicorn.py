@@ -18,4 +18,17 @@ keepalive = 2
 debug = os.environ.get("debug", "false") == "true"
 reload = debug
 preload_app = False
-daemon = False
\ No newline at end of file
+daemon = False
+
+# Cache de respostas compartilhado entre os workers (app/cache.py)
+cache_compartilhado = os.environ.get("CACHE_COMPARTILHADO", "/tmp/compra-inteligente-cache.sqlite")
+if workers > 1 and not cache_compartilhado:
+    # Com o cache de cada processo, uma alteração só invalida o cache do worker que a recebeu
+    raise RuntimeError("CACHE_COMPARTILHADO é obrigatório com mais de um worker")
+raw_env = [f"CACHE_COMPARTILHADO={cache_compartilhado}"]
+
+def on_starting(server):
+    # Começa com o cache vazio a cada deploy
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(cache_compartilhado + sufixo):
+            os.remove(cache_compartilhado + sufixo)
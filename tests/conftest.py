@@ -0,0 +1,65 @@
+import pytest
+from datetime import datetime
+from faker import Faker
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base
+from app.main import app
+from app.database import get_async_db, SyncSessionAdapter
+
+SQLALCHEMY_DATABASE_URL = 'sqlite:///testedb.sqlite'
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async def override_get_db():
+    try:
+        db = SyncSessionAdapter(TestingSessionLocal())
+        yield db
+    finally:
+        await db.close()
+
+app.dependency_overrides[get_async_db] = override_get_db
+
+Base.metadata.create_all(bind=engine)
+
+client = TestClient(app)
+
+faker = Faker()
+
+def cadastrar_tokens():
+    """Cadastra um usuário novo e retorna a resposta do cadastro, com os tokens de acesso e de renovação."""
+    response = client.post(
+        "/auth/cadastro",
+        json = {
+            "nome": faker.name(),
+            "email": faker.unique.email(),
+            "senha": faker.password(),
+        },
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def cadastrar_usuario():
+    """Cadastra um usuário novo e retorna os headers com o token de acesso."""
+    return {"Authorization": f"Bearer {cadastrar_tokens()['access_token']}"}
+
+def cadastrar_despesa(headers, valor=10, vencimento=datetime(2024, 1, 10), pagamento=None, despesa=None, id_categoria=1):
+    """Cadastra uma despesa pela API. Sem descrição, usa uma palavra aleatória."""
+    response = client.post(
+        "/despesas/",
+        headers = headers,
+        json = {
+            "id_categoria": id_categoria,
+            "despesa": despesa or faker.word(),
+            "valor": valor,
+            "vencimento": vencimento.isoformat(),
+            "pagamento": pagamento.isoformat() if pagamento else '',
+        },
+    )
+    assert response.status_code == 200, response.text
+
+@pytest.fixture
+def headers():
+    return cadastrar_usuario()
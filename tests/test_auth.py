@@ -1,33 +1,12 @@
-from faker import Faker
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
-from sqlalchemy.pool import StaticPool
-from app.models import Base
-from app.main import app
-from app.database import get_db
+from jose import jwt
+from datetime import datetime
+from sqlalchemy import event, func, select
+from app import tokens as tokens_modulo
+from app.cache import CacheMemoria
+from app.models import TokensRevogados
+from tests.conftest import TestingSessionLocal, cadastrar_tokens, client, engine, faker
 from tests.log import log
 
-SQLALCHEMY_DATABASE_URL = 'sqlite:///testedb.sqlite'
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
-Base.metadata.create_all(bind=engine)
-
-client = TestClient(app)
-
-faker = Faker()
-
 usuario = {
     "nome": faker.name(),
     "email": faker.email(),
@@ -48,8 +27,7 @@ def test_cadastro():
     assert "access_token" in data
     access_token = data["access_token"]
 
-    client.headers.update({"Authorization": f"Bearer {access_token}"})
-    response = client.get("/conta/")
+    response = client.get("/conta/", headers={"Authorization": f"Bearer {access_token}"})
 
     log.info(response)
 
@@ -85,8 +63,7 @@ def test_login():
     assert "access_token" in data
     access_token = data["access_token"]
 
-    client.headers.update({"Authorization": f"Bearer {access_token}"})
-    response = client.get("/conta/")
+    response = client.get("/conta/", headers={"Authorization": f"Bearer {access_token}"})
 
     log.info(response)
 
@@ -105,4 +82,104 @@ def test_login_invalido():
             "senha": 'senha_invalida',
         },
     )
-    assert response.status_code == 401, response.text
\ No newline at end of file
+    assert response.status_code == 401, response.text
+
+def test_refresh():
+    tokens = cadastrar_tokens()
+    assert tokens["refresh_token"] and tokens["expires_in"] == tokens_modulo.DURACOES[tokens_modulo.ACESSO]
+
+    #O token de renovação não serve como token de acesso
+    response = client.get("/conta/", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    novos = response.json()
+    assert client.get("/conta/", headers={"Authorization": f"Bearer {novos['access_token']}"}).status_code == 200
+
+    #O token de renovação usado é revogado
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401, response.text
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+
+def test_logout():
+    tokens = cadastrar_tokens()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/conta/", headers=headers).status_code == 200
+
+    response = client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+
+    #As claims já estavam no cache do processo, mas a revogação é conferida em toda requisição
+    assert client.get("/conta/", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_token_expirado(monkeypatch):
+    monkeypatch.setitem(tokens_modulo.DURACOES, tokens_modulo.ACESSO, -10)
+    tokens = cadastrar_tokens()
+    response = client.get("/conta/", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 401, response.text
+
+    #Tokens antigos, sem exp, não são mais aceitos
+    token = jwt.encode({"sub": "a@b.com", "id": 1, "jti": "x", "tipo": "acesso"}, tokens_modulo.SECRET_KEY, algorithm=tokens_modulo.SECRET_ALGORITHM)
+    assert client.get("/conta/", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+def test_cache_de_claims(monkeypatch):
+    tokens = cadastrar_tokens()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    decodificacoes = []
+    decode = tokens_modulo.jwt.decode
+    monkeypatch.setattr(tokens_modulo.jwt, "decode", lambda *args, **kwargs: decodificacoes.append(1) or decode(*args, **kwargs))
+
+    #Somente a primeira requisição verifica a assinatura
+    for _ in range(5):
+        assert client.get("/conta/", headers=headers).status_code == 200
+    assert len(decodificacoes) == 1
+
+def test_revogacao_em_cache(monkeypatch):
+    headers = {"Authorization": f"Bearer {cadastrar_tokens()['access_token']}"}
+    monkeypatch.setattr(tokens_modulo, "revogacoes", CacheMemoria(10, 60))
+
+    consultas = []
+    def contar(conexao, cursor, sql, *args):
+        if 'tokens_revogados' in sql:
+            consultas.append(sql)
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        #Somente a primeira requisição consulta a tabela de revogações
+        for _ in range(3):
+            assert client.get("/conta/", headers=headers).status_code == 200
+        assert len(consultas) == 1
+
+        #O logout grava a revogação no cache, sem esperar o TTL
+        assert client.post("/auth/logout", headers=headers, json={}).status_code == 200
+        consultas.clear()
+        assert client.get("/conta/", headers=headers).status_code == 401
+        assert consultas == []
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+
+def test_revogacao_no_banco(monkeypatch):
+    tokens = cadastrar_tokens()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+
+    #Um processo que nunca viu o token, como outro worker do gunicorn, também o recusa
+    monkeypatch.setattr(tokens_modulo, "tokens_verificados", CacheMemoria(10, 60))
+    monkeypatch.setattr(tokens_modulo, "revogacoes", CacheMemoria(10, 60))
+    assert client.get("/conta/", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    with TestingSessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(TokensRevogados).where(TokensRevogados.expira < datetime.now())) == 0
+        assert db.scalar(select(func.count()).select_from(TokensRevogados)) >= 2
+
+def test_link_de_recuperacao_usado_uma_vez():
+    tokens = cadastrar_tokens()
+    claims = jwt.get_unverified_claims(tokens["access_token"])
+    token = tokens_modulo.criar_token(claims["sub"], claims["id"], tokens_modulo.RECUPERACAO)
+
+    assert client.post("/auth/recuperar/senha", json={"token": token, "senha": "nova-senha"}).status_code == 200
+    assert client.post("/auth/recuperar/senha", json={"token": token, "senha": "outra-senha"}).status_code == 401
+    assert client.post("/auth/login", json={"email": claims["sub"], "senha": "nova-senha"}).status_code == 200
@@ -0,0 +1,122 @@
+import asyncio
+from app.cache import CacheMemoria, CacheSQLite, agrupar_requisicoes, estatisticas_agrupamento
+
+def test_cache_memoria_lru():
+    cache = CacheMemoria(tamanho_maximo=2, ttl=60)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.estatisticas()['remocoes'] == 1
+
+def test_cache_memoria_ttl():
+    cache = CacheMemoria(tamanho_maximo=10, ttl=-1)
+
+    cache.set('a', 1)
+
+    assert cache.get('a') is None
+
+def test_cache_sqlite_compartilhado(tmp_path):
+    caminho = str(tmp_path / 'cache.sqlite')
+    worker_1 = CacheSQLite(caminho, tamanho_maximo=10, ttl=60)
+    worker_2 = CacheSQLite(caminho, tamanho_maximo=10, ttl=60)
+
+    worker_1.set('dashboard', {'valor': 10})
+    assert worker_2.get('dashboard') == {'valor': 10}
+
+    worker_2.delete('dashboard')
+    assert worker_1.get('dashboard') is None
+
+    worker_1.incr('versao:1')
+    assert worker_2.contador('versao:1') == 1
+
+def test_cache_sqlite_tamanho_maximo(tmp_path):
+    cache = CacheSQLite(str(tmp_path / 'cache.sqlite'), tamanho_maximo=2, ttl=60)
+
+    for i in range(CacheSQLite.LIMPEZA_A_CADA):
+        cache.set(f'chave:{i}', i, ttl=60 + i)
+
+    assert cache.estatisticas()['tamanho'] == 2
+    assert cache.get(f'chave:{CacheSQLite.LIMPEZA_A_CADA - 1}') == CacheSQLite.LIMPEZA_A_CADA - 1
+
+def test_agrupar_requisicoes():
+    execucoes = []
+
+    @agrupar_requisicoes
+    async def rota(usuario, ano):
+        execucoes.append(ano)
+        await asyncio.sleep(0.01)
+        return {'ano': ano}
+
+    async def requisicoes():
+        return await asyncio.gather(
+            *[rota(usuario={'id_usuario': 1}, ano=2023) for _ in range(5)],
+            rota(usuario={'id_usuario': 1}, ano=2022),
+            rota(usuario={'id_usuario': 2}, ano=2023),
+        )
+
+    agrupadas = estatisticas_agrupamento['agrupadas']
+    respostas = asyncio.run(requisicoes())
+
+    assert respostas == [{'ano': 2023}] * 5 + [{'ano': 2022}, {'ano': 2023}]
+    assert sorted(execucoes) == [2022, 2023, 2023]
+    assert estatisticas_agrupamento['agrupadas'] == agrupadas + 4
+
+def test_agrupar_requisicoes_erro():
+    @agrupar_requisicoes
+    async def rota(usuario):
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    async def requisicoes():
+        return await asyncio.gather(*[rota(usuario={'id_usuario': 1}) for _ in range(3)], return_exceptions=True)
+
+    respostas = asyncio.run(requisicoes())
+
+    assert all(isinstance(resposta, ValueError) for resposta in respostas)
+
+def test_agrupar_requisicoes_cancelamento():
+    execucoes = []
+
+    @agrupar_requisicoes
+    async def rota(usuario):
+        execucoes.append(1)
+        await asyncio.sleep(0.05)
+        return {'ok': True}
+
+    async def requisicoes():
+        primeira = asyncio.create_task(rota(usuario={'id_usuario': 1}))
+        await asyncio.sleep(0)
+        seguintes = [asyncio.create_task(rota(usuario={'id_usuario': 1})) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        #O cliente da primeira requisição desconectou; as que esperavam por ela não foram canceladas
+        primeira.cancel()
+        respostas = await asyncio.gather(*seguintes)
+        return primeira, respostas
+
+    primeira, respostas = asyncio.run(requisicoes())
+
+    assert primeira.cancelled()
+    assert respostas == [{'ok': True}] * 2
+    #Uma das que esperavam refez a execução e a outra esperou por ela
+    assert len(execucoes) == 2
+
+def test_cache_memoria_contadores_limitados():
+    cache = CacheMemoria(tamanho_maximo=2, ttl=60)
+
+    cache.incr('versao:1')
+    cache.incr('versao:1')
+    cache.incr('versao:2')
+    cache.incr('versao:3')
+
+    #O contador mais antigo saiu, mas não volta para uma versão que já foi invalidada
+    assert len(cache.contadores) == 2
+    assert cache.contador('versao:1') == 2
+    assert cache.incr('versao:1') == 3
+    assert cache.contador('versao:4') == 2
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.routers import chatgpt
+from tests.conftest import cadastrar_usuario, client, faker
+
+class Completions(BaseHTTPRequestHandler):
+    """Servidor local no lugar da API de chat completions."""
+    requisicoes = []
+    atraso = 0
+    simultaneas = 0
+    maximo_simultaneas = 0
+    trava = threading.Lock()
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with Completions.trava:
+            Completions.requisicoes.append(corpo)
+            Completions.simultaneas += 1
+            Completions.maximo_simultaneas = max(Completions.maximo_simultaneas, Completions.simultaneas)
+        time.sleep(Completions.atraso)
+        with Completions.trava:
+            Completions.simultaneas -= 1
+
+        entrada = corpo['messages'][1]['content']
+        despesas = [{'despesa': 'Padaria', 'valor': '12.50', 'id_categoria': 1, 'vencimento': '2024-01-10', 'pagamento': None}]
+        if 'nada' in entrada:
+            despesas = []
+        if 'nota' in entrada:
+            id_categoria = corpo['functions'][0]['parameters']['properties']['despesas']['items']['properties']['id_categoria']['description'].split('ID: ')[1].split(',')[0]
+            despesas = [
+                {'despesa': 'Conta de luz', 'valor': '120,00', 'id_categoria': int(id_categoria), 'vencimento': '2024-01-10T00:00:00', 'pagamento': None},
+                {'despesa': 'Conta de água', 'valor': '80.5', 'id_categoria': 999999, 'vencimento': '2024-01-10', 'pagamento': '2024-01-09'},
+                {'despesa': 'Internet', 'valor': 'noventa', 'id_categoria': int(id_categoria), 'vencimento': '2024-01-10', 'pagamento': None},
+            ]
+        argumentos = {'despesas': despesas}
+        resposta = json.dumps({
+            'id': 'chatcmpl-1',
+            'object': 'chat.completion',
+            'model': corpo['model'],
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': None, 'function_call': {'name': 'criar_despesas', 'arguments': json.dumps(argumentos)}},
+                'finish_reason': 'stop',
+            }],
+        }).encode()
+
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(resposta)))
+            self.end_headers()
+            self.wfile.write(resposta)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+servidor = ThreadingHTTPServer(('127.0.0.1', 0), Completions)
+threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+def configurar_servidor(monkeypatch):
+    monkeypatch.setenv('CHATGPT_SECRET', 'chave-de-teste')
+    monkeypatch.setattr(chatgpt, 'CHATGPT_API_BASE', f'http://127.0.0.1:{servidor.server_address[1]}/v1')
+    monkeypatch.setattr(Completions, 'atraso', 0)
+    #Requisições que expiraram em outro teste ainda podem estar no servidor
+    while Completions.simultaneas:
+        time.sleep(0.05)
+    Completions.requisicoes.clear()
+    Completions.maximo_simultaneas = 0
+
+def test_chatgpt(monkeypatch):
+    configurar_servidor(monkeypatch)
+    headers = cadastrar_usuario()
+    client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": "Padaria", "status": True})
+
+    response = client.post("/chatgpt/", headers=headers, json={"input": "Comprei pão e leite por doze reais"})
+    assert response.status_code == 200, response.text
+    assert response.json()["despesa"] == "Padaria"
+    assert response.json()["origem"] == "modelo"
+
+    requisicao = Completions.requisicoes[0]
+    assert requisicao["function_call"] == {"name": "criar_despesas"}
+    assert "Categoria: Padaria" in requisicao["functions"][0]["parameters"]["properties"]["despesas"]["items"]["properties"]["id_categoria"]["description"]
+
+    #Mesma entrada normalizada e mesmas categorias: resposta do cache
+    response = client.post("/chatgpt/", headers=headers, json={"input": "  COMPREI pao e leite  por doze reais "})
+    assert (response.json()["despesa"], response.json()["origem"]) == ("Padaria", "cache")
+    assert len(Completions.requisicoes) == 1
+
+    #Uma categoria nova muda o prompt e a chave do cache
+    client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": "Mercado", "status": True})
+    client.post("/chatgpt/", headers=headers, json={"input": "Comprei pão e leite por doze reais"})
+    assert len(Completions.requisicoes) == 2
+
+    response = client.post("/chatgpt/", headers=headers, json={"input": "nada para registrar"})
+    assert response.status_code == 400, response.text
+
+def test_chatgpt_interpretacao_local(monkeypatch):
+    configurar_servidor(monkeypatch)
+    headers = cadastrar_usuario()
+    for categoria in ("Alimentação", "Transporte", "Moradia"):
+        client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": categoria, "status": True})
+    categorias = {categoria["categoria"]: categoria["id_categoria"] for categoria in client.get("/categorias/", headers=headers).json()}
+    antes = client.get("/chatgpt/estatisticas", headers=headers).json()
+
+    hoje = date.today().isoformat()
+    response = client.post("/chatgpt/", headers=headers, json={"input": "mercado 85,90 hoje pago"})
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "despesa": "Mercado",
+        "valor": "85.90",
+        "id_categoria": categorias["Alimentação"],
+        "vencimento": f"{hoje}T00:00:00",
+        "pagamento": f"{hoje}T00:00:00",
+        "origem": "local",
+    }
+
+    response = client.post("/chatgpt/", headers=headers, json={"input": "Aluguel R$ 1.500,00 vence dia 10"})
+    despesa = response.json()
+    assert (despesa["despesa"], despesa["valor"], despesa["id_categoria"], despesa["pagamento"]) == ("Aluguel", "1500.00", categorias["Moradia"], None)
+    assert despesa["vencimento"][8:10] == "10"
+
+    #Dois valores: a frase é ambígua e vai para o modelo
+    response = client.post("/chatgpt/", headers=headers, json={"input": "uber 20 e mercado 50"})
+    assert response.json()["origem"] == "modelo"
+    assert len(Completions.requisicoes) == 1
+
+    depois = client.get("/chatgpt/estatisticas", headers=headers).json()
+    assert (depois["local"] - antes["local"], depois["modelo"] - antes["modelo"]) == (2, 1)
+
+def test_chatgpt_varias_despesas(monkeypatch):
+    configurar_servidor(monkeypatch)
+    headers = cadastrar_usuario()
+    client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": "Moradia", "status": True})
+    id_categoria = client.get("/categorias/", headers=headers).json()[0]["id_categoria"]
+
+    #Uma única chamada ao modelo para a nota inteira; itens inválidos não são gravados
+    response = client.post("/chatgpt/despesas", headers=headers, params={"gravar": True}, json={"input": "nota: luz 120, água 80,50 paga ontem, internet noventa"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert (len(data["despesas"]), data["origem"], len(data["id_despesas"])) == (3, "modelo", 2)
+    assert data["erros"] == [{"posicao": 2, "erro": "Valor inválido: 'noventa'"}]
+    assert len(Completions.requisicoes) == 1
+
+    despesas = {despesa["id_despesa"]: despesa for despesa in client.get("/despesas/", headers=headers).json()["despesas"]}
+    assert sorted(despesas) == data["id_despesas"]
+    luz, agua = (despesas[id_despesa] for id_despesa in data["id_despesas"])
+    assert (luz["despesa"], luz["id_categoria"], luz["pagamento"]) == ("Conta de luz", id_categoria, "")
+    #Categoria inexistente no usuário fica vazia
+    assert (agua["despesa"], agua["id_categoria"], agua["pagamento"][:10]) == ("Conta de água", None, "09/01/2024")
+
+    #Sem gravar, só a interpretação (agora do cache)
+    response = client.post("/chatgpt/despesas", headers=headers, json={"input": "nota: luz 120, água 80,50 paga ontem, internet noventa"})
+    assert response.json()["origem"] == "cache" and "id_despesas" not in response.json()
+
+def test_chatgpt_lista_local(monkeypatch):
+    configurar_servidor(monkeypatch)
+    headers = cadastrar_usuario()
+    for categoria in ("Alimentação", "Transporte"):
+        client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": categoria, "status": True})
+
+    response = client.post("/chatgpt/despesas", headers=headers, params={"gravar": True}, json={"input": "mercado 85,90 pago; uber 20 ontem\ngasolina 150"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["origem"] == "local"
+    assert [despesa["despesa"] for despesa in data["despesas"]] == ["Mercado", "Uber", "Gasolina"]
+    assert len(data["id_despesas"]) == 3
+    assert Completions.requisicoes == []
+    assert client.get("/despesas/", headers=headers).json()["total"] == 3
+
+def test_chatgpt_timeout(monkeypatch):
+    configurar_servidor(monkeypatch)
+    monkeypatch.setattr(Completions, 'atraso', 1)
+    monkeypatch.setattr(chatgpt, 'CHATGPT_TIMEOUT', 0.2)
+    headers = cadastrar_usuario()
+
+    response = client.post("/chatgpt/", headers=headers, json={"input": f"Despesa demorada {faker.uuid4()}"})
+    assert response.status_code == 504, response.text
+
+def test_chatgpt_concorrencia(monkeypatch):
+    configurar_servidor(monkeypatch)
+    monkeypatch.setattr(Completions, 'atraso', 0.2)
+    monkeypatch.setattr(chatgpt, 'CHATGPT_CONCORRENCIA', 2)
+
+    async def chamar_varias():
+        return await asyncio.gather(*(chatgpt.chatgpt(f'Compra {numero}', ((1, 'Padaria'),)) for numero in range(6)))
+
+    despesas = asyncio.run(chamar_varias())
+    assert len(despesas) == 6
+    assert Completions.maximo_simultaneas == 2
+
+    #Sem vaga dentro do tempo de espera, a requisição é recusada
+    monkeypatch.setattr(chatgpt, 'CHATGPT_CONCORRENCIA', 1)
+    monkeypatch.setattr(chatgpt, 'CHATGPT_ESPERA', 0.05)
+
+    async def chamar_com_espera_curta():
+        return await asyncio.gather(*(chatgpt.chatgpt(f'Compra {numero}', ((1, 'Padaria'),)) for numero in range(2)), return_exceptions=True)
+
+    resultados = asyncio.run(chamar_com_espera_curta())
+    assert [getattr(resultado, 'status_code', 200) for resultado in resultados] == [200, 503]
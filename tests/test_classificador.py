@@ -0,0 +1,113 @@
+import asyncio
+from app import classificador
+from app.classificador import Classificador, classificadores, reconstruir
+from app.database import SyncSessionAdapter
+from tests.conftest import TestingSessionLocal, cadastrar_despesa, cadastrar_usuario, client, faker
+
+def cadastrar_usuario_categorias():
+    headers = cadastrar_usuario()
+    id_usuario = client.get("/conta/", headers=headers).json()["id_usuario"]
+
+    for categoria in ("Alimentação", "Transporte", "Streaming"):
+        client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": categoria, "status": True})
+    categorias = {categoria["categoria"]: categoria["id_categoria"] for categoria in client.get("/categorias/", headers=headers).json()}
+    return headers, id_usuario, categorias
+
+def sugestoes(headers, despesa):
+    response = client.get("/categorias/sugestao", headers=headers, params={"despesa": despesa})
+    assert response.status_code == 200, response.text
+    return [sugestao["id_categoria"] for sugestao in response.json()["sugestoes"]]
+
+def test_classificador():
+    modelo = Classificador()
+    for descricao, id_categoria in (("Mercado Extra", 1), ("Padaria do João", 1), ("Uber para o centro", 2), ("Posto Ipiranga gasolina", 2), ("Netflix", 3)):
+        modelo.aprender(descricao, id_categoria)
+
+    assert modelo.sugerir("mercado")[0][0] == 1
+    assert modelo.sugerir("Gasolina no posto")[0][0] == 2
+    assert modelo.sugerir("NETFLIX")[0] == (3, modelo.sugerir("netflix")[0][1])
+    assert modelo.sugerir("palavra desconhecida") == []
+    assert abs(sum(confianca for _, confianca in modelo.sugerir("uber", limite=10)) - 1) < 1e-9
+
+    #Retirar a despesa desfaz o aprendizado
+    modelo.aprender("Netflix", 3, -1)
+    assert modelo.sugerir("netflix") == []
+    assert 3 not in modelo.despesas
+
+def test_classificador_limite_de_termos(monkeypatch):
+    monkeypatch.setattr(classificador, 'CLASSIFICADOR_TERMOS', 50)
+    modelo = Classificador()
+    for numero in range(200):
+        modelo.aprender("mercado", 1)
+        modelo.aprender(f"compra avulsa {faker.unique.word()}", 2)
+
+    assert len(modelo.contagens) <= 50
+    #Os termos frequentes sobrevivem à poda
+    assert modelo.sugerir("mercado")[0][0] == 1
+    assert all(quantidade >= 0 for quantidade in modelo.termos_categoria.values())
+
+def test_sugestao(monkeypatch):
+    headers, id_usuario, categorias = cadastrar_usuario_categorias()
+    cadastrar_despesa(headers, despesa="Mercado Extra", id_categoria=categorias["Alimentação"])
+    cadastrar_despesa(headers, despesa="Uber aeroporto", id_categoria=categorias["Transporte"])
+
+    assert sugestoes(headers, "mercado")[0] == categorias["Alimentação"]
+    modelo = classificadores[id_usuario]
+
+    #Despesas novas, editadas e removidas atualizam o classificador já carregado, sem remontar
+    async def nao_reconstruir(*args, **kwargs):
+        raise AssertionError("classificador remontado")
+    monkeypatch.setattr(classificador, 'reconstruir', nao_reconstruir)
+
+    cadastrar_despesa(headers, despesa="Netflix", id_categoria=categorias["Streaming"])
+    assert sugestoes(headers, "netflix")[0] == categorias["Streaming"]
+
+    id_despesa = client.get("/despesas/", headers=headers, params={"pesquisa": "netflix"}).json()["despesas"][0]["id_despesa"]
+    response = client.put(f"/despesas/{id_despesa}", headers=headers, json={
+        "id_categoria": categorias["Alimentação"], "despesa": "Netflix", "valor": 10, "vencimento": "2024-01-10T00:00:00", "pagamento": "",
+    })
+    assert response.status_code == 200, response.text
+    assert sugestoes(headers, "netflix")[0] == categorias["Alimentação"]
+
+    client.delete(f"/despesas/{id_despesa}", headers=headers)
+    assert sugestoes(headers, "netflix") == []
+    assert classificadores[id_usuario] is modelo
+
+def test_sugestao_parcelas_e_importacao():
+    headers, id_usuario, categorias = cadastrar_usuario_categorias()
+    response = client.post("/despesas/parceladas", headers=headers, json={
+        "id_categoria": categorias["Transporte"], "despesa": "Bicicleta", "valor": 1200,
+        "parcelas": 3, "data_primeiro_vencimento": "01-2024", "dia_vencimento": 10,
+    })
+    assert response.status_code == 200, response.text
+    assert sugestoes(headers, "bicicleta nova") == [categorias["Transporte"]]
+
+    #A importação descarta o classificador, que é remontado com as linhas importadas
+    client.post(
+        "/despesas/importar",
+        headers = headers,
+        params = {"id_categoria": categorias["Alimentação"]},
+        files = {"arquivo": ("extrato.csv", b"data;descricao;valor\n05/01/2024;Hortifruti;10,00\n", "text/csv")},
+    )
+    assert id_usuario not in classificadores
+    assert sugestoes(headers, "hortifruti")[0] == categorias["Alimentação"]
+
+def test_reconstruir_todos():
+    headers, id_usuario, categorias = cadastrar_usuario_categorias()
+    cadastrar_despesa(headers, despesa="Spotify", id_categoria=categorias["Streaming"])
+    outro_headers, outro_usuario, outras_categorias = cadastrar_usuario_categorias()
+    cadastrar_despesa(outro_headers, despesa="Spotify", id_categoria=outras_categorias["Alimentação"])
+
+    classificadores.clear()
+
+    async def reconstruir_todos():
+        db = SyncSessionAdapter(TestingSessionLocal())
+        try:
+            await reconstruir(db)
+        finally:
+            await db.close()
+
+    asyncio.run(reconstruir_todos())
+
+    assert classificadores[id_usuario].sugerir("spotify")[0][0] == categorias["Streaming"]
+    assert classificadores[outro_usuario].sugerir("spotify")[0][0] == outras_categorias["Alimentação"]
@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import select
+from app.database import SyncSessionAdapter
+from app.models import Despesas, ResumoMensal
+from app.resumo import atualizar_resumo, reconstruir_resumo
+from tests.conftest import TestingSessionLocal, cadastrar_despesa, client
+
+hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def test_cards(headers):
+    mes_anterior = hoje.replace(day=1) - timedelta(days=1)
+
+    cadastrar_despesa(headers, 10, mes_anterior)
+    cadastrar_despesa(headers, 20, mes_anterior, pagamento=mes_anterior)
+    cadastrar_despesa(headers, 30, hoje)
+    cadastrar_despesa(headers, 40, hoje, pagamento=hoje)
+
+    response = client.get("/dashboard/cards", headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+
+    assert data["despesas_atrasadas"] == 1
+    assert data["despesas_pendentes"] == 1
+    assert data["despesas_mes_atual"] == 2
+    assert data["despesas_mes_anterior"] == 2
+    assert data["valor_atrasadas"] == 10
+    assert data["valor_pendentes"] == 30
+    assert data["valor_mes_atual"] == 70
+    assert data["valor_mes_anterior"] == 30
+
+def test_line_ano(headers):
+    cadastrar_despesa(headers, 10, datetime(2021, 1, 1))
+    cadastrar_despesa(headers, 15, datetime(2021, 1, 31, 12))
+    cadastrar_despesa(headers, 20, datetime(2021, 12, 31))
+    cadastrar_despesa(headers, 99, datetime(2022, 1, 1))
+
+    response = client.get("/dashboard/line_ano", headers=headers, params={"ano": 2021})
+    assert response.status_code == 200, response.text
+    data = response.json()
+
+    assert data["valores_por_mes"] == [25, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 20]
+    assert data["despesas_qtd_ano"] == 3
+
+    response = client.get(
+        "/dashboard/line_ano",
+        headers=headers,
+        params={"inicio": "01/01/2021", "fim": "10/01/2021", "granularidade": "semana"}
+    )
+    assert response.status_code == 200, response.text
+    periodos = response.json()["periodos"]
+
+    assert [periodo["periodo"] for periodo in periodos] == ["2020-12-28", "2021-01-04"]
+    assert periodos[0]["valor"] == 10
+    assert periodos[0]["quantidade"] == 1
+
+def test_line_ano_periodo_invalido(headers):
+    def line_ano(**params):
+        return client.get("/dashboard/line_ano", headers=headers, params=params).status_code
+
+    assert line_ano(inicio="xx", fim="01/01/2020") == 400
+    assert line_ano(inicio="01/01/2020") == 400
+    assert line_ano(fim="01/01/2020") == 400
+    assert line_ano(inicio="01/01/1900", fim="31/12/2999", granularidade="dia") == 400
+    assert line_ano(inicio="01/01/2020", fim="31/12/2020", granularidade="dia") == 200
+    assert line_ano(inicio="01/01/2000", fim="31/12/2019", granularidade="mes") == 200
+    assert line_ano(inicio="01/01/2000", fim="01/01/2020", granularidade="mes") == 400
+
+def listar_resumo(id_usuario):
+    with TestingSessionLocal() as db:
+        resumos = db.scalars(select(ResumoMensal).filter(ResumoMensal.id_usuario == id_usuario, ResumoMensal.quantidade > 0)).all()
+        return sorted(
+            (resumo.mes, resumo.id_categoria, resumo.quantidade, float(resumo.valor), resumo.quantidade_paga, float(resumo.valor_pago))
+            for resumo in resumos
+        )
+
+def test_resumo_mensal(headers):
+    id_usuario = client.get("/conta/", headers=headers).json()["id_usuario"]
+
+    cadastrar_despesa(headers, 10, datetime(2021, 3, 5))
+    cadastrar_despesa(headers, 20, datetime(2021, 3, 20), pagamento=datetime(2021, 3, 20))
+    response = client.post(
+        "/despesas/parceladas",
+        headers = headers,
+        json = {
+            "id_categoria": 2,
+            "despesa": "Geladeira",
+            "valor": 300,
+            "parcelas": 3,
+            "data_primeiro_vencimento": "03-2021",
+            "dia_vencimento": 31,
+        },
+    )
+    assert response.status_code == 200, response.text
+
+    with TestingSessionLocal() as db:
+        ids = db.scalars(select(Despesas.id_despesa).filter(Despesas.id_usuario == id_usuario).order_by(Despesas.id_despesa)).all()
+
+    client.patch(f"/despesas/pagamento/{ids[0]}", headers=headers, json={"pagamento": "2021-03-06"})
+    client.put(
+        f"/despesas/{ids[1]}",
+        headers = headers,
+        json = {"id_categoria": 3, "despesa": "Luz", "valor": 25, "vencimento": "2021-04-01", "pagamento": ""},
+    )
+    client.delete(f"/despesas/{ids[4]}", headers=headers)
+
+    incremental = listar_resumo(id_usuario)
+
+    with TestingSessionLocal() as db:
+        reconstruir_resumo(db, id_usuario)
+
+    assert incremental == listar_resumo(id_usuario)
+    assert incremental == [
+        (datetime(2021, 3, 1), 1, 1, 10.0, 1, 10.0),
+        (datetime(2021, 3, 1), 2, 1, 100.0, 0, 0.0),
+        (datetime(2021, 4, 1), 2, 1, 100.0, 0, 0.0),
+        (datetime(2021, 4, 1), 3, 1, 25.0, 0, 0.0),
+    ]
+
+def test_resumo_sem_categoria(headers):
+    id_usuario = client.get("/conta/", headers=headers).json()["id_usuario"]
+    chave = (id_usuario, datetime(2021, 5, 1), None)
+
+    async def somar(valor):
+        db = SyncSessionAdapter(TestingSessionLocal())
+        try:
+            await atualizar_resumo(db, adicionadas=[(chave, (1, Decimal(valor), 0, Decimal(0)))])
+            await db.commit()
+        finally:
+            await db.close()
+
+    #Duas primeiras escritas da mesma chave sem categoria somam na mesma linha
+    asyncio.run(somar(10))
+    asyncio.run(somar(5))
+
+    assert listar_resumo(id_usuario) == [(datetime(2021, 5, 1), None, 2, 15.0, 0, 0.0)]
+
+def test_cache_invalidado_na_escrita(headers):
+    cadastrar_despesa(headers, 10, hoje)
+    primeira = client.get("/dashboard/cards", headers=headers).json()
+
+    acertos = client.get("/dashboard/cache", headers=headers).json()["acertos"]
+    assert client.get("/dashboard/cards", headers=headers).json() == primeira
+    assert client.get("/dashboard/cache", headers=headers).json()["acertos"] == acertos + 1
+
+    cadastrar_despesa(headers, 5, hoje)
+    data = client.get("/dashboard/cards", headers=headers).json()
+
+    assert data["despesas_mes_atual"] == primeira["despesas_mes_atual"] + 1
+    assert data["valor_mes_atual"] == primeira["valor_mes_atual"] + 5
+
+def test_overview(headers):
+    mes_anterior = hoje.replace(day=1) - timedelta(days=1)
+
+    cadastrar_despesa(headers, 10, mes_anterior)
+    cadastrar_despesa(headers, 20, hoje, pagamento=hoje)
+    cadastrar_despesa(headers, 30, hoje + timedelta(days=40))
+
+    response = client.get("/dashboard/overview", headers=headers)
+    assert response.status_code == 200, response.text
+    overview = response.json()
+
+    assert overview["cards"] == client.get("/dashboard/cards", headers=headers).json()
+    assert overview["line_ano"] == client.get("/dashboard/line_ano", headers=headers).json()
+    assert overview["pie_mes"] == client.get("/dashboard/pie_mes", headers=headers).json()
+    assert overview["pie_ano"] == client.get("/dashboard/pie_ano", headers=headers).json()
+
+    response = client.get("/dashboard/overview", headers=headers, params={"fields": "pie_mes,line_ano"})
+    assert response.status_code == 200, response.text
+    assert set(response.json()) == {"pie_mes", "line_ano"}
+
+    response = client.get("/dashboard/overview", headers=headers, params={"fields": "invalido"})
+    assert response.status_code == 400, response.text
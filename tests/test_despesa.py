@@ -0,0 +1,153 @@
+import calendar
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from app.models import Despesas, ResumoMensal
+from app.routers import despesa as router_despesa
+from tests.conftest import TestingSessionLocal, cadastrar_despesa, client, engine
+
+def test_paginacao_cursor(headers):
+    vencimento = datetime(2022, 5, 10)
+    for i in range(7):
+        #Vencimentos repetidos para exercitar o desempate pelo id_despesa
+        cadastrar_despesa(headers, 10, vencimento + timedelta(days=i // 2), pagamento=vencimento if i % 2 else None, despesa=f"Despesa {i}")
+
+    vistos = []
+    cursor = ''
+    while True:
+        response = client.get("/despesas/", headers=headers, params={"limit": 3, "cursor": cursor})
+        assert response.status_code == 200, response.text
+        data = response.json()
+
+        assert data["total"] == 7
+        assert data["valor_total"] == "R$ 70,00"
+        assert data["valor_pago"] == "R$ 30,00"
+        assert data["valor_aberto"] == "R$ 40,00"
+
+        vistos += [despesa["id_despesa"] for despesa in data["despesas"]]
+        cursor = data["proximo_cursor"]
+        if cursor is None:
+            break
+
+    todos = client.get("/despesas/", headers=headers, params={"limit": 100}).json()["despesas"]
+
+    assert vistos == [despesa["id_despesa"] for despesa in todos]
+    assert len(set(vistos)) == 7
+
+def test_paginacao_sem_totais(headers):
+    cadastrar_despesa(headers, 10, datetime(2022, 5, 10), despesa="Luz")
+
+    data = client.get("/despesas/", headers=headers, params={"totais": False}).json()
+
+    assert len(data["despesas"]) == 1
+    assert data["total"] is None
+
+    response = client.get("/despesas/", headers=headers, params={"cursor": "invalido"})
+    assert response.status_code == 400, response.text
+
+def test_pesquisa(headers):
+    cadastrar_despesa(headers, 85.90, datetime(2022, 5, 10), despesa="Pão de Açúcar")
+    cadastrar_despesa(headers, 120, datetime(2022, 5, 11), despesa="Conta de luz")
+    cadastrar_despesa(headers, 1234.56, datetime(2022, 5, 12), despesa="Farmácia 100%")
+
+    def pesquisar(pesquisa):
+        data = client.get("/despesas/", headers=headers, params={"pesquisa": pesquisa}).json()
+        return sorted(despesa["despesa"] for despesa in data["despesas"])
+
+    assert pesquisar("acucar") == ["Pão de Açúcar"]
+    assert pesquisar("PAO açu") == ["Pão de Açúcar"]
+    assert pesquisar("luz 120") == ["Conta de luz"]
+    assert pesquisar("R$ 85,90") == ["Pão de Açúcar"]
+    assert pesquisar("1.234,56") == ["Farmácia 100%"]
+    assert pesquisar("100%") == ["Farmácia 100%"]
+    assert pesquisar("50 a 200") == ["Conta de luz", "Pão de Açúcar"]
+    assert pesquisar("85,91") == []
+
+def test_parcelas_em_lote(headers):
+    comandos = []
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', registrar)
+    try:
+        response = client.post(
+            "/despesas/parceladas",
+            headers = headers,
+            json = {
+                "id_categoria": 1,
+                "despesa": "Financiamento Imóvel",
+                "valor": 360000,
+                "parcelas": 360,
+                "data_primeiro_vencimento": "01-2024",
+                "dia_vencimento": 31,
+            },
+        )
+    finally:
+        event.remove(Engine, 'before_cursor_execute', registrar)
+
+    assert response.status_code == 200, response.text
+    ids = response.json()["id_despesas"]
+    assert len(ids) == 360
+    #O SQLite não garante a ordem do RETURNING em lote, então o SQLAlchemy envia um INSERT por parcela
+    assert len([comando for comando in comandos if comando.startswith('INSERT INTO despesas')]) == (360 if engine.dialect.name == 'sqlite' else 1)
+
+    with TestingSessionLocal() as db:
+        despesas = db.execute(
+            select(Despesas.id_despesa, Despesas.despesa, Despesas.despesa_busca, Despesas.vencimento)
+            .filter(Despesas.id_despesa.in_(ids))
+            .order_by(Despesas.vencimento)
+        ).all()
+        meses_resumo = db.scalar(select(func.count()).select_from(ResumoMensal).filter(ResumoMensal.id_usuario == db.get(Despesas, ids[0]).id_usuario))
+
+    assert [despesa.id_despesa for despesa in despesas] == ids
+    assert despesas[0].despesa_busca == 'financiamento imovel - 1 de 360'
+    assert despesas[-1].despesa == 'Financiamento Imóvel - 360 de 360'
+    #Dia 31 ou o último dia dos meses mais curtos, sem acumular o ajuste de um mês para o outro
+    for despesa in despesas:
+        vencimento = despesa.vencimento
+        assert vencimento.day == min(31, calendar.monthrange(vencimento.year, vencimento.month)[1])
+    assert (despesas[0].vencimento, despesas[1].vencimento, despesas[2].vencimento) == (datetime(2024, 1, 31), datetime(2024, 2, 29), datetime(2024, 3, 31))
+    assert despesas[-1].vencimento == datetime(2053, 12, 31)
+    assert meses_resumo == 360
+
+def test_parcelado_sem_returning(headers, monkeypatch):
+    #Bancos sem INSERT ... RETURNING (MySQL) gravam as parcelas pela sessão
+    dialeto_sem_returning = SimpleNamespace(insert_returning=False)
+    async def sem_returning(db):
+        return dialeto_sem_returning
+    monkeypatch.setattr(router_despesa, 'dialeto', sem_returning)
+    response = client.post(
+        "/despesas/parceladas",
+        headers = headers,
+        json = {
+            "id_categoria": 1,
+            "despesa": "Geladeira",
+            "valor": 3000,
+            "parcelas": 3,
+            "data_primeiro_vencimento": "05-2024",
+            "dia_vencimento": 10,
+        },
+    )
+
+    assert response.status_code == 200, response.text
+    ids = response.json()["id_despesas"]
+    with TestingSessionLocal() as db:
+        despesas = [db.get(Despesas, id_despesa) for id_despesa in ids]
+
+    assert [despesa.despesa for despesa in despesas] == ['Geladeira - 1 de 3', 'Geladeira - 2 de 3', 'Geladeira - 3 de 3']
+    assert [despesa.vencimento for despesa in despesas] == [datetime(2024, 5, 10), datetime(2024, 6, 10), datetime(2024, 7, 10)]
+
+def test_parcelas_invalidas(headers):
+    parcelada = {
+        "id_categoria": 1,
+        "despesa": "Carro",
+        "valor": 1000,
+        "parcelas": 361,
+        "data_primeiro_vencimento": "01-2024",
+        "dia_vencimento": 10,
+    }
+
+    assert client.post("/despesas/parceladas", headers=headers, json=parcelada).status_code == 422
+    assert client.post("/despesas/parceladas", headers=headers, json={**parcelada, "parcelas": 2, "dia_vencimento": 32}).status_code == 422
+    assert client.post("/despesas/parceladas", headers=headers, json={**parcelada, "parcelas": 2, "data_primeiro_vencimento": "2024-01"}).status_code == 400
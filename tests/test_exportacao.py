@@ -0,0 +1,90 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from app import exportacao
+from tests.conftest import cadastrar_despesa, cadastrar_usuario, client
+
+def cadastrar_usuario_categoria():
+    headers = cadastrar_usuario()
+
+    client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": "Mercado", "status": True})
+    id_categoria = client.get("/categorias/", headers=headers).json()[0]["id_categoria"]
+    return headers, id_categoria
+
+def cadastrar_despesas(headers, id_categoria):
+    cadastrar_despesa(headers, 12.5, datetime(2022, 1, 5), pagamento=datetime(2022, 1, 5), despesa="Padaria", id_categoria=id_categoria)
+    cadastrar_despesa(headers, 1500, datetime(2022, 1, 10), despesa="Aluguel; janeiro", id_categoria=id_categoria)
+    cadastrar_despesa(headers, 80.9, datetime(2022, 2, 3), despesa="Feira", id_categoria=id_categoria)
+
+    response = client.post("/recorrencias/", headers=headers, json={
+        "id_categoria": id_categoria, "despesa": "Internet", "valor": 99.9,
+        "data_primeiro_vencimento": "01-2022", "dia_vencimento": 20, "parcelas": 2,
+    })
+    assert response.status_code == 200, response.text
+
+def test_exportar_csv():
+    headers, id_categoria = cadastrar_usuario_categoria()
+    cadastrar_despesas(headers, id_categoria)
+
+    response = client.get("/despesas/exportar", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-disposition"] == 'attachment; filename="despesas.csv"'
+
+    linhas = list(csv.reader(io.StringIO(response.text), delimiter=';'))
+    assert tuple(linhas[0]) == exportacao.COLUNAS
+    assert [(linha[0], linha[1], linha[2][:10], linha[3][:10], linha[4]) for linha in linhas[1:]] == [
+        ("Internet - 2 de 2", "99,90", "2022-02-20", "", "Mercado"),
+        ("Feira", "80,90", "2022-02-03", "", "Mercado"),
+        ("Internet - 1 de 2", "99,90", "2022-01-20", "", "Mercado"),
+        ("Aluguel; janeiro", "1500,00", "2022-01-10", "", "Mercado"),
+        ("Padaria", "12,50", "2022-01-05", "2022-01-05", "Mercado"),
+    ]
+
+    #O arquivo exportado pode ser importado de volta
+    outro_headers, outra_categoria = cadastrar_usuario_categoria()
+    response = client.post(
+        "/despesas/importar",
+        headers = outro_headers,
+        params = {"id_categoria": outra_categoria},
+        files = {"arquivo": ("despesas.csv", response.content, "text/csv")},
+    )
+    assert response.status_code == 200, response.text
+    assert (response.json()["importadas"], response.json()["erros"]) == (5, 0)
+    assert client.get("/despesas/", headers=outro_headers).json()["total"] == 5
+
+def test_exportar_ndjson_com_filtros():
+    headers, id_categoria = cadastrar_usuario_categoria()
+    cadastrar_despesas(headers, id_categoria)
+
+    response = client.get("/despesas/exportar", headers=headers, params={
+        "formato": "ndjson", "inicio": "01/01/2022", "fim": "31/01/2022", "pendente": True,
+    })
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    registros = [json.loads(linha) for linha in response.text.splitlines()]
+    assert [(registro["despesa"], registro["valor"], registro["pagamento"]) for registro in registros] == [
+        ("Internet - 1 de 2", "99.90", None),
+        ("Aluguel; janeiro", "1500.00", None),
+    ]
+    assert registros[0]["id_recorrencia"] is not None and registros[0]["parcela"] == 1
+    assert registros[1]["id_despesa"] is not None
+
+    assert client.get("/despesas/exportar", headers=headers, params={"formato": "xml"}).status_code == 422
+
+def test_exportar_gzip(monkeypatch):
+    #Blocos pequenos forçam vários pedaços na resposta
+    monkeypatch.setattr(exportacao, 'TAMANHO_BLOCO', 64)
+    headers, id_categoria = cadastrar_usuario_categoria()
+    cadastrar_despesas(headers, id_categoria)
+
+    response = client.get("/despesas/exportar", headers=headers, params={"gzip": True, "pesquisa": "feira"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"] == 'attachment; filename="despesas.csv.gz"'
+
+    texto = gzip.decompress(response.content).decode()
+    assert texto.splitlines()[1].startswith("Feira;80,90;2022-02-03")
+    assert len(texto.splitlines()) == 2
@@ -0,0 +1,129 @@
+from sqlalchemy import select
+from app import importacao
+from app.models import Despesas
+from app.routers import despesa
+from tests.conftest import TestingSessionLocal, cadastrar_usuario, client
+
+def cadastrar_usuario_id():
+    headers = cadastrar_usuario()
+    return headers, client.get("/conta/", headers=headers).json()["id_usuario"]
+
+def listar_despesas(id_usuario):
+    with TestingSessionLocal() as db:
+        return db.execute(
+            select(Despesas.despesa, Despesas.despesa_busca, Despesas.valor, Despesas.vencimento, Despesas.pagamento, Despesas.id_categoria)
+            .filter(Despesas.id_usuario == id_usuario)
+            .order_by(Despesas.id_despesa)
+        ).all()
+
+def test_importar_csv(monkeypatch):
+    monkeypatch.setattr(despesa, 'LOTE_IMPORTACAO', 2)
+    headers, id_usuario = cadastrar_usuario_id()
+
+    client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": "Alimentação", "status": True})
+    id_categoria = client.get("/categorias/", headers=headers).json()[0]["id_categoria"]
+
+    csv = (
+        "Data;Descrição;Valor;Categoria;Data Pagamento\n"
+        "05/01/2022;Padaria São João;-12,50;alimentacao;05/01/2022\n"
+        "06/01/2022;Aluguel;\"1.500,00\";Moradia;\n"
+        "\n"
+        "32/01/2022;Data errada;10,00;;\n"
+        "07/01/2022;Valor errado;dez;;\n"
+        "2022-01-08;Mercado;R$ 89,90;ALIMENTAÇÃO;2022-01-09\n"
+    )
+    response = client.post(
+        "/despesas/importar",
+        headers = headers,
+        params = {"id_categoria": 99},
+        files = {"arquivo": ("extrato.csv", csv.encode(), "text/csv")},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+
+    assert (data["linhas"], data["importadas"], data["erros"], data["concluida"]) == (5, 3, 2, True)
+    assert [erro["linha"] for erro in data["detalhes_erros"]] == [5, 6]
+    assert "Data inválida" in data["detalhes_erros"][0]["erro"]
+
+    despesas = listar_despesas(id_usuario)
+    assert [(despesa.despesa, float(despesa.valor), despesa.id_categoria) for despesa in despesas] == [
+        ("Padaria São João", 12.5, id_categoria),
+        ("Aluguel", 1500.0, 99),
+        ("Mercado", 89.9, id_categoria),
+    ]
+    assert despesas[0].despesa_busca == "padaria sao joao"
+    assert despesas[1].pagamento is None
+    assert despesas[2].pagamento.day == 9
+
+    assert client.get("/despesas/importar/progresso", headers=headers).json()["importadas"] == 3
+    assert client.get("/dashboard/line_ano", headers=headers, params={"ano": 2022}).json()["valores_por_mes"][0] == 1602.4
+
+def test_importar_ofx(monkeypatch):
+    #Blocos pequenos cortam as tags no meio, como acontece em arquivos grandes
+    monkeypatch.setattr(importacao, 'TAMANHO_BLOCO', 7)
+    headers, id_usuario = cadastrar_usuario_id()
+
+    ofx = (
+        "OFXHEADER:100\nDATA:OFXSGML\nENCODING:USASCII\nCHARSET:1252\n\n"
+        "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20230310120000[-3:BRT]<TRNAMT>-45.90<FITID>1<MEMO>Farmácia</STMTTRN>"
+        "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20230311<TRNAMT>1000.00<FITID>2<MEMO>Salário</STMTTRN>\n"
+        "<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20230312\n<TRNAMT>-7.00\n<FITID>3\n<NAME>Ônibus\n</STMTTRN>\n"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>ontem<TRNAMT>-1.00<MEMO>Sem data</STMTTRN>"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+    )
+    response = client.post(
+        "/despesas/importar",
+        headers = headers,
+        files = {"arquivo": ("extrato.ofx", ofx.encode('cp1252'), "application/x-ofx")},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+
+    assert (data["linhas"], data["importadas"], data["ignoradas"], data["erros"]) == (4, 2, 1, 1)
+    assert data["detalhes_erros"][0]["linha"] == 4
+
+    despesas = listar_despesas(id_usuario)
+    assert [(despesa.despesa, float(despesa.valor), despesa.vencimento.day) for despesa in despesas] == [("Farmácia", 45.9, 10), ("Ônibus", 7.0, 12)]
+    assert despesas[0].pagamento == despesas[0].vencimento
+
+def test_importar_arquivo_invalido():
+    headers, id_usuario = cadastrar_usuario_id()
+
+    response = client.post(
+        "/despesas/importar",
+        headers = headers,
+        files = {"arquivo": ("extrato.csv", b"nome,quantia\nabc,1\n", "text/csv")},
+    )
+    assert response.status_code == 400, response.text
+    assert listar_despesas(id_usuario) == []
+
+    #O progresso termina como falha em vez de continuar em andamento
+    progresso = client.get("/despesas/importar/progresso", headers=headers).json()
+    assert (progresso["concluida"], progresso["falhou"], progresso["importadas"]) == (True, True, 0)
+
+def test_importar_codificacao_desconhecida():
+    headers, id_usuario = cadastrar_usuario_id()
+
+    response = client.post(
+        "/despesas/importar",
+        headers = headers,
+        params = {"codificacao": "nope"},
+        files = {"arquivo": ("extrato.csv", b"despesa,valor,vencimento\nabc,1,01/01/2024\n", "text/csv")},
+    )
+    assert response.status_code == 400, response.text
+    assert "nope" in response.json()["detail"]
+    assert listar_despesas(id_usuario) == []
+
+def test_importar_arquivo_grande():
+    headers, id_usuario = cadastrar_usuario_id()
+
+    linhas = "".join(f"{dia % 28 + 1:02d}/{dia % 12 + 1:02d}/2020,Compra {dia},{dia % 100 + 1}.50\n" for dia in range(5000))
+    response = client.post(
+        "/despesas/importar",
+        headers = headers,
+        files = {"arquivo": ("extrato.csv", ("data,descricao,valor\n" + linhas).encode(), "text/csv")},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["importadas"] == 5000
+    assert len(listar_despesas(id_usuario)) == 5000
@@ -0,0 +1,45 @@
+from datetime import datetime
+from app.interpretacao import interpretar_despesa, interpretar_despesas
+
+CATEGORIAS = [(1, 'Contas a Pagar'), (2, 'Alimentação'), (3, 'Transporte'), (4, 'Saúde'), (8, 'Moradia'), (12, 'Streaming'), (20, 'Pet')]
+HOJE = datetime(2024, 5, 15)
+
+def interpretar(texto):
+    return interpretar_despesa(texto, CATEGORIAS, HOJE)
+
+def test_interpretar_despesa():
+    assert interpretar("Paguei 12,50 na padaria São João") == {
+        'despesa': 'Padaria São João',
+        'valor': '12.50',
+        'id_categoria': 2,
+        'vencimento': '2024-05-15T00:00:00',
+        'pagamento': '2024-05-15T00:00:00',
+    }
+    assert interpretar("conta de luz 120 vence dia 10")["vencimento"] == '2024-05-10T00:00:00'
+    assert interpretar("uber R$ 23,40 ontem")["vencimento"] == '2024-05-14T00:00:00'
+    assert interpretar("aluguel 1500 a pagar amanhã")["pagamento"] is None
+    assert interpretar("farmácia 45 não pago")["pagamento"] is None
+
+    #Categorias do usuário pelo nome, inclusive as que não são padrão
+    despesa = interpretar("ração pet 1.250,00 pago 10/05/24")
+    assert (despesa['despesa'], despesa['valor'], despesa['id_categoria']) == ('Ração pet', '1250.00', 20)
+    assert despesa['pagamento'] == despesa['vencimento'] == '2024-05-10T00:00:00'
+
+def test_interpretar_despesa_ambigua():
+    assert interpretar("2 pizzas 50") is None
+    assert interpretar("almoço 30 e jantar 40") is None
+    assert interpretar("comprei algo 10") is None
+    assert interpretar("mercado") is None
+    assert interpretar("mercado 50 hoje dia 20") is None
+    assert interpretar("mercado 50 dia 31/02") is None
+    assert interpretar("uber e mercado 50") is None
+    assert interpretar("mercado 50 pago mas ainda pendente") is None
+
+def test_interpretar_lista():
+    despesas = interpretar_despesas("mercado 85,90; uber 20 ontem\ngasolina 150, aluguel 1.500,00 dia 10", CATEGORIAS, HOJE)
+    assert [(despesa['despesa'], despesa['valor']) for despesa in despesas] == [
+        ('Mercado', '85.90'), ('Uber', '20.00'), ('Gasolina', '150.00'), ('Aluguel', '1500.00'),
+    ]
+    #Um item não interpretado manda a lista inteira para o modelo
+    assert interpretar_despesas("mercado 85,90, pão e leite", CATEGORIAS, HOJE) is None
+    assert interpretar_despesas(" ; ", CATEGORIAS, HOJE) is None
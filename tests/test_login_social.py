@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from sqlalchemy import select
+from app import login_social
+from app.login_social import resumo_token
+from app.models import LoginSocial
+from tests.conftest import TestingSessionLocal, client, faker
+
+def gerar_chave(kid):
+    privada = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = privada.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    publica = privada.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return pem, {**jwk.construct(publica, 'RS256').to_dict(), 'kid': kid, 'use': 'sig'}
+
+class Provedor(BaseHTTPRequestHandler):
+    """Substituto local do endpoint de chaves do Google e da Graph API do Facebook."""
+    chaves = []
+    requisicoes = []
+    usuarios_facebook = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        Provedor.requisicoes.append(url.path)
+        if url.path == '/certs':
+            self.responder(200, {'keys': Provedor.chaves}, {'Cache-Control': 'public, max-age=3600'})
+        elif url.path == '/me':
+            usuario = Provedor.usuarios_facebook.get(parse_qs(url.query)['access_token'][0])
+            if usuario:
+                self.responder(200, usuario)
+            else:
+                self.responder(400, {'error': {'message': 'Invalid OAuth access token'}})
+        else:
+            self.responder(404, {})
+
+    def responder(self, codigo, corpo, headers={}):
+        dados = json.dumps(corpo).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        for nome, valor in headers.items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+servidor = ThreadingHTTPServer(('127.0.0.1', 0), Provedor)
+threading.Thread(target=servidor.serve_forever, daemon=True).start()
+URL_PROVEDOR = f'http://127.0.0.1:{servidor.server_address[1]}'
+
+chave_privada, chave_publica = gerar_chave('chave-1')
+Provedor.chaves = [chave_publica]
+
+def configurar_provedor(monkeypatch):
+    monkeypatch.setattr(login_social, 'GOOGLE_CERTS_URL', f'{URL_PROVEDOR}/certs')
+    monkeypatch.setattr(login_social, 'FACEBOOK_GRAPH_URL', URL_PROVEDOR)
+    monkeypatch.setattr(login_social, 'GOOGLE_CLIENT_IDS', ['cliente-app'])
+    monkeypatch.setattr(login_social, 'chaves_google', login_social.ChavesGoogle())
+    Provedor.requisicoes.clear()
+
+def token_google(email, chave=chave_privada, kid='chave-1', **claims):
+    agora = int(time.time())
+    return jwt.encode({
+        'iss': 'https://accounts.google.com',
+        'aud': 'cliente-app',
+        'sub': email,
+        'email': email,
+        'email_verified': True,
+        'name': 'Usuário Google',
+        'iat': agora,
+        'exp': agora + 3600,
+        **claims,
+    }, chave, algorithm='RS256', headers={'kid': kid})
+
+def login_google(token):
+    return client.post("/auth/social", json={"token": token, "provedor": "google"})
+
+def test_login_google(monkeypatch):
+    configurar_provedor(monkeypatch)
+    email = faker.unique.email()
+
+    response = login_google(token_google(email))
+    assert response.status_code == 200, response.text
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/conta/", headers=headers).json()["email"] == email
+
+    #As chaves ficam em cache: o segundo login não acessa o provedor
+    assert login_google(token_google(email)).status_code == 200
+    assert Provedor.requisicoes == ['/certs']
+
+def test_login_google_invalido(monkeypatch):
+    configurar_provedor(monkeypatch)
+    email = faker.unique.email()
+    outra_chave, _ = gerar_chave('chave-1')
+
+    assert login_google(token_google(email, chave=outra_chave)).status_code == 401
+    assert login_google(token_google(email, aud='outro-cliente')).status_code == 401
+    assert login_google(token_google(email, iss='https://example.com')).status_code == 401
+    assert login_google(token_google(email, exp=int(time.time()) - 10)).status_code == 401
+    assert login_google(token_google(email, email_verified=False)).status_code == 401
+    assert login_google('token-opaco').status_code == 401
+
+def test_login_google_rotacao_de_chaves(monkeypatch):
+    configurar_provedor(monkeypatch)
+    monkeypatch.setattr(login_social, 'CHAVES_INTERVALO_MINIMO', 0)
+    assert login_google(token_google(faker.unique.email())).status_code == 200
+
+    nova_privada, nova_publica = gerar_chave('chave-2')
+    monkeypatch.setattr(Provedor, 'chaves', [chave_publica, nova_publica])
+
+    assert login_google(token_google(faker.unique.email(), chave=nova_privada, kid='chave-2')).status_code == 200
+    assert Provedor.requisicoes == ['/certs', '/certs']
+
+def test_login_facebook(monkeypatch):
+    configurar_provedor(monkeypatch)
+    email = faker.unique.email()
+    monkeypatch.setitem(Provedor.usuarios_facebook, 'token-facebook', {'id': '1', 'name': 'Usuário Facebook', 'email': email})
+
+    response = client.post("/auth/social", json={"token": "token-facebook", "provedor": "facebook"})
+    assert response.status_code == 200, response.text
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/conta/", headers=headers).json()["email"] == email
+
+    #O mesmo token é encontrado pelo resumo, sem acessar o provedor de novo
+    response = client.post("/auth/social", json={"token": "token-facebook", "provedor": "Facebook"})
+    assert response.status_code == 200, response.text
+    assert Provedor.requisicoes == ['/me']
+
+    with TestingSessionLocal() as db:
+        login = db.scalars(select(LoginSocial).filter(LoginSocial.token_hash == resumo_token('token-facebook'))).one()
+    assert login.provedor == 'facebook'
+
+    response = client.post("/auth/social", json={"token": "token-invalido", "provedor": "facebook"})
+    assert response.status_code == 401, response.text
+    assert client.post("/auth/social", json={"token": "token", "provedor": "twitter"}).status_code == 400
+
+def test_provedor_indisponivel(monkeypatch):
+    configurar_provedor(monkeypatch)
+    monkeypatch.setattr(login_social, 'GOOGLE_CERTS_URL', 'http://127.0.0.1:1/certs')
+
+    response = login_google(token_google(faker.unique.email()))
+    assert response.status_code == 503, response.text
+
+def test_login_google_sem_cliente_configurado(monkeypatch):
+    configurar_provedor(monkeypatch)
+    monkeypatch.setattr(login_social, 'GOOGLE_CLIENT_IDS', [])
+
+    #Sem a lista de clientes o token não é aceito, qualquer que seja o `aud`
+    response = login_google(token_google(faker.unique.email()))
+    assert response.status_code == 503
+    assert Provedor.requisicoes == []
+
+def test_login_google_varios_clientes(monkeypatch):
+    configurar_provedor(monkeypatch)
+    monkeypatch.setattr(login_social, 'GOOGLE_CLIENT_IDS', ['cliente-web', 'cliente-app'])
+
+    assert login_google(token_google(faker.unique.email())).status_code == 200
+    assert login_google(token_google(faker.unique.email(), aud='outro-cliente')).status_code == 401
@@ -0,0 +1,118 @@
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+from app.login_social import resumo_token
+from app.migrations import configuracao
+from app.models import Base
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///testemigracoes.sqlite"
+
+def test_migracoes_criam_o_esquema_dos_models():
+    config = configuracao(SQLALCHEMY_DATABASE_URL)
+    command.downgrade(config, 'base')
+    command.upgrade(config, 'head')
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.connect() as conexao:
+        diferencas = compare_metadata(MigrationContext.configure(conexao), Base.metadata)
+        indices = {indice['name'] for indice in inspect(conexao).get_indexes('despesas')}
+    engine.dispose()
+
+    assert diferencas == []
+    assert {'ix_despesas_usuario_vencimento', 'ix_despesas_usuario_pagamento'} <= indices
+
+def test_migracoes_revertem():
+    config = configuracao(SQLALCHEMY_DATABASE_URL)
+    command.upgrade(config, 'head')
+    command.downgrade(config, 'base')
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    tabelas = inspect(engine).get_table_names()
+    engine.dispose()
+
+    assert tabelas == ['alembic_version']
+
+def test_migracao_resume_tokens_do_login_social():
+    config = configuracao(SQLALCHEMY_DATABASE_URL)
+    command.downgrade(config, 'base')
+    command.upgrade(config, '0005')
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conexao:
+        conexao.execute(text("INSERT INTO usuarios (id_usuario, nome, email, senha, limite_gastos, status, criado) VALUES (1, 'a', 'a@b.com', '', 0, 1, '2024-01-01')"))
+        conexao.execute(text(
+            "INSERT INTO login_social (id_login_social, id_usuario, token, provedor) VALUES "
+            "(1, 1, 'token-a', 'google'), (2, 1, 'token-b', 'facebook'), (3, 1, 'token-a', 'google'), (4, 1, 'token-a', 'facebook')"
+        ))
+
+    command.upgrade(config, 'head')
+    with engine.connect() as conexao:
+        linhas = conexao.execute(text("SELECT id_login_social, provedor, token_hash FROM login_social ORDER BY id_login_social")).all()
+        colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('login_social')}
+    engine.dispose()
+
+    assert 'token' not in colunas
+    assert linhas == [
+        (2, 'facebook', resumo_token('token-b')),
+        (3, 'google', resumo_token('token-a')),
+        (4, 'facebook', resumo_token('token-a')),
+    ]
+
+def test_migracoes_preenchem_resumo_e_busca():
+    config = configuracao(SQLALCHEMY_DATABASE_URL)
+    command.downgrade(config, 'base')
+    command.upgrade(config, '0001')
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conexao:
+        conexao.execute(text("INSERT INTO usuarios (id_usuario, nome, email, senha, limite_gastos, status, criado) VALUES (1, 'a', 'a@b.com', '', 0, 1, '2024-01-01')"))
+        conexao.execute(text(
+            "INSERT INTO despesas (id_despesa, id_usuario, id_categoria, despesa, valor, vencimento, pagamento) VALUES "
+            "(1, 1, NULL, 'Farmácia  São João', 10.50, '2024-03-05 00:00:00', '2024-03-05 00:00:00'), "
+            "(2, 1, NULL, 'Ônibus', 4.25, '2024-03-20 00:00:00', NULL), "
+            "(3, 1, NULL, 'Aluguel', 900, '2024-04-10 00:00:00', NULL)"
+        ))
+
+    #As revisões antigas usam as próprias definições, sem os models e helpers atuais
+    command.upgrade(config, 'head')
+    with engine.connect() as conexao:
+        resumo = conexao.execute(text(
+            "SELECT mes, quantidade, valor, quantidade_paga, valor_pago FROM resumo_mensal ORDER BY mes"
+        )).all()
+        busca = conexao.execute(text("SELECT despesa_busca FROM despesas ORDER BY id_despesa")).scalars().all()
+    engine.dispose()
+
+    assert [(str(mes)[:10], quantidade, float(valor), quantidade_paga, float(valor_pago)) for mes, quantidade, valor, quantidade_paga, valor_pago in resumo] == [
+        ('2024-03-01', 2, 14.75, 1, 10.5),
+        ('2024-04-01', 1, 900.0, 0, 0.0),
+    ]
+    assert busca == ['farmacia sao joao', 'onibus', 'aluguel']
+
+def test_migracao_junta_resumo_sem_categoria():
+    config = configuracao(SQLALCHEMY_DATABASE_URL)
+    command.downgrade(config, 'base')
+    command.upgrade(config, '0008')
+
+    #A restrição antiga não impedia linhas repetidas com id_categoria nulo
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conexao:
+        conexao.execute(text("INSERT INTO usuarios (id_usuario, nome, email, senha, limite_gastos, status, criado) VALUES (1, 'a', 'a@b.com', '', 0, 1, '2024-01-01')"))
+        conexao.execute(text(
+            "INSERT INTO resumo_mensal (id_resumo, id_usuario, id_categoria, mes, quantidade, valor, quantidade_paga, valor_pago) VALUES "
+            "(1, 1, NULL, '2024-03-01 00:00:00', 1, 10, 1, 10), "
+            "(2, 1, NULL, '2024-03-01 00:00:00', 2, 5, 0, 0), "
+            "(3, 1, 1, '2024-03-01 00:00:00', 1, 7, 0, 0)"
+        ))
+
+    command.upgrade(config, 'head')
+    with engine.connect() as conexao:
+        resumo = conexao.execute(text(
+            "SELECT id_resumo, id_categoria, categoria_chave, quantidade, valor, quantidade_paga, valor_pago FROM resumo_mensal ORDER BY id_resumo"
+        )).all()
+    engine.dispose()
+
+    assert [(*linha[:4], float(linha[4]), linha[5], float(linha[6])) for linha in resumo] == [
+        (1, None, 0, 3, 15.0, 1, 10.0),
+        (3, 1, 1, 1, 7.0, 0, 0.0),
+    ]
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import event, func, select
+from app.models import Despesas
+from tests.conftest import TestingSessionLocal, cadastrar_despesa, client, engine
+
+hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def cadastrar_recorrencia(headers, despesa, valor, primeiro_mes, dia_vencimento, parcelas=None, id_categoria=1):
+    response = client.post(
+        "/recorrencias/",
+        headers = headers,
+        json = {
+            "id_categoria": id_categoria,
+            "despesa": despesa,
+            "valor": valor,
+            "data_primeiro_vencimento": primeiro_mes.strftime("%m-%Y"),
+            "dia_vencimento": dia_vencimento,
+            "parcelas": parcelas,
+        },
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id_recorrencia"]
+
+def contar_despesas():
+    with TestingSessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(Despesas))
+
+def test_parcelas_expandidas_no_periodo(headers):
+    despesas_antes = contar_despesas()
+    id_recorrencia = cadastrar_recorrencia(headers, "Notebook", 100, datetime(2021, 1, 1), 31, parcelas=12)
+    assert contar_despesas() == despesas_antes
+
+    response = client.get("/despesas/", headers=headers, params={"inicio": "01/02/2021", "fim": "30/04/2021"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+
+    assert [despesa["vencimento"] for despesa in data["despesas"]] == ["30/04/2021 00:00:00", "31/03/2021 00:00:00", "28/02/2021 00:00:00"]
+    assert [despesa["despesa"] for despesa in data["despesas"]][-1] == "Notebook - 2 de 12"
+    assert data["total"] == 3
+
+    client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/2", headers=headers, json={"pagamento": "2021-02-27"})
+    client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/3", headers=headers, json={"valor": 80})
+    client.delete(f"/recorrencias/{id_recorrencia}/ocorrencias/12", headers=headers)
+
+    response = client.get("/despesas/", headers=headers, params={"inicio": "01/02/2021", "fim": "30/04/2021", "pendente": True})
+    assert [despesa["parcela"] for despesa in response.json()["despesas"]] == [4, 3]
+
+    response = client.get("/despesas/", headers=headers, params={"pesquisa": "notebook 80"})
+    assert [despesa["parcela"] for despesa in response.json()["despesas"]] == [3]
+
+    response = client.get("/dashboard/line_ano", headers=headers, params={"ano": 2021})
+    assert response.json()["valores_por_mes"] == [100, 100, 80, 100, 100, 100, 100, 100, 100, 100, 100, 0]
+    assert response.json()["despesas_qtd_ano"] == 11
+
+    assert client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/13", headers=headers, json={"valor": 1}).status_code == 404
+
+def test_paginacao_com_recorrencias(headers):
+    for dia in (5, 15, 25):
+        cadastrar_despesa(headers, 50, datetime(2022, 3, dia), despesa="Mercado")
+    cadastrar_recorrencia(headers, "Aluguel", 1000, datetime(2022, 1, 1), 15)
+
+    vistos = []
+    cursor = ''
+    while True:
+        response = client.get("/despesas/", headers=headers, params={"inicio": "01/01/2022", "fim": "30/04/2022", "limit": 2, "cursor": cursor})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        vistos.extend((despesa["vencimento"], despesa["despesa"]) for despesa in data["despesas"])
+        cursor = data["proximo_cursor"]
+        if cursor is None:
+            break
+
+    assert data["total"] == 7
+    assert data["valor_total"] == "R$ 4150,00"
+    assert vistos == [
+        ("15/04/2022 00:00:00", "Aluguel"),
+        ("25/03/2022 00:00:00", "Mercado"),
+        ("15/03/2022 00:00:00", "Mercado"),
+        ("15/03/2022 00:00:00", "Aluguel"),
+        ("05/03/2022 00:00:00", "Mercado"),
+        ("15/02/2022 00:00:00", "Aluguel"),
+        ("15/01/2022 00:00:00", "Aluguel"),
+    ]
+
+    #Com ocorrências o skip não é aceito; a primeira página sem cursor continua valendo
+    response = client.get("/despesas/", headers=headers, params={"inicio": "01/01/2022", "fim": "30/04/2022", "skip": 5, "limit": 5})
+    assert response.status_code == 400
+    response = client.get("/despesas/", headers=headers, params={"inicio": "01/01/2022", "fim": "30/04/2022", "limit": 2})
+    assert [despesa["despesa"] for despesa in response.json()["despesas"]] == ["Aluguel", "Mercado"]
+
+def test_dashboards_com_conta_mensal(headers):
+    client.post("/categorias/", headers=headers, json={"id_icone": 1, "categoria": "Internet", "status": True})
+    id_categoria = client.get("/categorias/", headers=headers).json()[0]["id_categoria"]
+
+    inicio = hoje.replace(day=1) - relativedelta(months=2)
+    id_recorrencia = cadastrar_recorrencia(headers, "Internet", 100, inicio, 31, id_categoria=id_categoria)
+    client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/1", headers=headers, json={"pagamento": inicio.isoformat()})
+
+    cards = client.get("/dashboard/cards", headers=headers).json()
+
+    #Sem fim, a conta mensal vai até o mês atual: uma paga, uma atrasada e a do mês atual
+    assert cards["despesas_mes_anterior"] == 1
+    assert cards["despesas_mes_atual"] == 1
+    assert cards["despesas_atrasadas"] + cards["despesas_pendentes"] == 2
+    assert cards["valor_atrasadas"] + cards["valor_pendentes"] == 200
+
+    overview = client.get("/dashboard/overview", headers=headers).json()
+    assert overview["cards"] == cards
+    assert overview["line_ano"] == client.get("/dashboard/line_ano", headers=headers).json()
+    assert overview["pie_mes"] == client.get("/dashboard/pie_mes", headers=headers).json()
+    assert overview["pie_ano"] == client.get("/dashboard/pie_ano", headers=headers).json()
+    assert overview["pie_mes"]["despesas_mes"] == [{"categoria": "Internet", "valor": 100}]
+
+    response = client.patch(f"/recorrencias/{id_recorrencia}/encerrar", headers=headers, json={"ultimo_vencimento": inicio.strftime("%m-%Y")})
+    assert response.status_code == 200, response.text
+
+    cards = client.get("/dashboard/cards", headers=headers).json()
+    assert cards["despesas_mes_atual"] == 0
+    assert cards["despesas_atrasadas"] == 0
+
+    response = client.get("/recorrencias/", headers=headers)
+    assert response.json()[0]["fim"] == (inicio + relativedelta(months=1)).strftime("%m-%Y")
+
+    assert client.delete(f"/recorrencias/{id_recorrencia}", headers=headers).status_code == 200
+    assert client.get("/recorrencias/", headers=headers).json() == []
+
+def test_cards_com_regras_antigas(headers):
+    #Conta mensal de três anos atrás com uma parcela paga, uma removida e uma com valor alterado
+    inicio = hoje.replace(day=1) - relativedelta(months=36)
+    id_recorrencia = cadastrar_recorrencia(headers, "Aluguel", 100, inicio, 1)
+    client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/1", headers=headers, json={"pagamento": inicio.isoformat()})
+    client.delete(f"/recorrencias/{id_recorrencia}/ocorrencias/2", headers=headers)
+    client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/3", headers=headers, json={"valor": 150})
+    #Parcelamento que começa no mês seguinte
+    cadastrar_recorrencia(headers, "Carro", 30, hoje.replace(day=1) + relativedelta(months=1), 10, parcelas=24)
+
+    cards = client.get("/dashboard/cards", headers=headers).json()
+
+    assert cards["despesas_mes_atual"] == 1
+    assert cards["despesas_mes_anterior"] == 1
+    assert cards["despesas_atrasadas"] + cards["despesas_pendentes"] == 34 + 1 + 24
+    assert cards["valor_atrasadas"] + cards["valor_pendentes"] == 3450 + 100 + 720
+    assert client.get("/dashboard/overview", headers=headers).json()["cards"] == cards
+
+def contar_consultas(funcao):
+    consultas = []
+    def contar(conexao, cursor, sql, *args):
+        consultas.append(sql)
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        funcao()
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+    return consultas
+
+def test_cards_le_as_regras_uma_vez(headers):
+    #Aquece a verificação do token para contar só as consultas dos cards
+    client.get("/conta/", headers=headers)
+
+    consultas = contar_consultas(lambda: client.get("/dashboard/cards", headers=headers))
+    assert len(consultas) == 3
+    assert not any('ocorrencias_recorrencia' in sql for sql in consultas)
+
+    id_recorrencia = cadastrar_recorrencia(headers, "Aluguel", 100, hoje.replace(day=1) - relativedelta(months=24), 1)
+    client.patch(f"/recorrencias/{id_recorrencia}/ocorrencias/1", headers=headers, json={"pagamento": hoje.isoformat()})
+
+    consultas = contar_consultas(lambda: client.get("/dashboard/cards", headers=headers))
+    assert len(consultas) == 4
+    assert sum('FROM recorrencias' in sql for sql in consultas) == 1
@@ -0,0 +1,182 @@
+import asyncio
+import email
+import socketserver
+import threading
+from email import policy
+from sqlalchemy import delete, select
+from app import send_email, tarefas
+from app.models import Tarefas
+from app.database import SyncSessionAdapter
+from tests.conftest import TestingSessionLocal, client, faker
+
+class ServidorSmtp(socketserver.StreamRequestHandler):
+    """Substituto local de um servidor SMTP com AUTH PLAIN, sem TLS."""
+    mensagens = []
+    conexoes = 0
+    logins = 0
+    falhas = 0
+
+    def handle(self):
+        ServidorSmtp.conexoes += 1
+        self.responder('220 localhost ESMTP')
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode().strip().upper()
+            if comando.startswith(('EHLO', 'HELO')):
+                self.responder('250-localhost', '250-AUTH PLAIN', '250 8BITMIME')
+            elif comando.startswith('AUTH'):
+                ServidorSmtp.logins += 1
+                self.responder('235 2.7.0 Authentication successful')
+            elif comando.startswith('MAIL'):
+                #Falha temporária simulada, como um servidor sobrecarregado
+                if ServidorSmtp.falhas:
+                    ServidorSmtp.falhas -= 1
+                    self.responder('451 4.3.0 Try again later')
+                else:
+                    self.responder('250 OK')
+            elif comando.startswith('RCPT'):
+                self.responder('250 OK')
+            elif comando == 'DATA':
+                self.responder('354 End data with <CR><LF>.<CR><LF>')
+                dados = b''
+                while not dados.endswith(b'\r\n.\r\n'):
+                    dados += self.rfile.readline()
+                ServidorSmtp.mensagens.append(dados[:-3].replace(b'\r\n..', b'\r\n.'))
+                self.responder('250 OK')
+            elif comando == 'QUIT':
+                self.responder('221 Bye')
+                return
+            else:
+                self.responder('250 OK')
+
+    def responder(self, *linhas):
+        self.wfile.write(''.join(f'{linha}\r\n' for linha in linhas).encode())
+
+class Servidor(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+
+servidor = Servidor(('127.0.0.1', 0), ServidorSmtp)
+threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+def configurar_servidor(monkeypatch):
+    monkeypatch.setattr(send_email, 'MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setattr(send_email, 'MAIL_PORT', servidor.server_address[1])
+    monkeypatch.setattr(send_email, 'MAIL_STARTTLS', False)
+    monkeypatch.setattr(send_email, 'MAIL_USERNAME', 'remetente@example.com')
+    monkeypatch.setattr(send_email, 'MAIL_PASSWORD', 'senha')
+    monkeypatch.setattr(send_email, 'despachante', send_email.DespachanteEmail())
+    monkeypatch.setattr(tarefas, 'TAREFAS_ESPERA_TENTATIVA', 0)
+    monkeypatch.setattr(ServidorSmtp, 'mensagens', [])
+    monkeypatch.setattr(ServidorSmtp, 'conexoes', 0)
+    monkeypatch.setattr(ServidorSmtp, 'logins', 0)
+    with TestingSessionLocal() as db:
+        db.execute(delete(Tarefas))
+        db.commit()
+
+def executar_worker():
+    """Executa as tarefas disponíveis em um único event loop, como o worker.py."""
+    async def executar():
+        db = SyncSessionAdapter(TestingSessionLocal())
+        try:
+            return await tarefas.processar(db)
+        finally:
+            await db.close()
+            await send_email.despachante.fechar()
+    return asyncio.run(executar())
+
+def cadastrar():
+    usuario = {"nome": faker.name(), "email": faker.unique.email(), "senha": faker.password()}
+    assert client.post("/auth/cadastro", json=usuario).status_code == 200
+    return usuario
+
+def recuperar_senha(usuario):
+    response = client.post("/auth/recuperar/mail", json={"email": usuario["email"]})
+    assert response.status_code == 200, response.text
+
+def ler_mensagem(dados):
+    mensagem = email.message_from_bytes(dados, policy=policy.default)
+    return mensagem['To'], mensagem.get_body().get_content()
+
+def test_recuperar_senha_pela_fila(monkeypatch):
+    configurar_servidor(monkeypatch)
+
+    usuarios = [cadastrar() for _ in range(3)]
+    for usuario in usuarios:
+        recuperar_senha(usuario)
+
+    #A rota só grava a tarefa; nada é enviado antes do worker
+    assert ServidorSmtp.mensagens == []
+    with TestingSessionLocal() as db:
+        fila = db.scalars(select(Tarefas)).all()
+    assert [(tarefa.tipo, tarefa.prioridade) for tarefa in fila] == [('email', tarefas.PRIORIDADE_ALTA)] * 3
+
+    assert executar_worker() == 3
+
+    #Uma conexão e um login para todas as mensagens
+    assert len(ServidorSmtp.mensagens) == 3
+    assert ServidorSmtp.conexoes == 1
+    assert ServidorSmtp.logins == 1
+    assert send_email.despachante.enviados == 3
+
+    for usuario, dados in zip(usuarios, ServidorSmtp.mensagens):
+        destinatario, html = ler_mensagem(dados)
+        assert destinatario == usuario["email"]
+        assert usuario["nome"].split()[0] in html
+        assert '?token=' in html
+
+    with TestingSessionLocal() as db:
+        assert db.scalars(select(Tarefas)).all() == []
+
+def test_template_escapado():
+    html = send_email.TEMPLATES_EMAIL['recuperar-senha.html'].render(nome='<b>Ana</b>', reset_link='http://x?a=1&b=2')
+    assert '&lt;b&gt;Ana&lt;/b&gt;' in html
+    assert 'http://x?a=1&amp;b=2' in html
+
+def test_falha_temporaria_repetida(monkeypatch):
+    configurar_servidor(monkeypatch)
+    monkeypatch.setattr(ServidorSmtp, 'falhas', 1)
+
+    recuperar_senha(cadastrar())
+    executar_worker()
+
+    #A primeira tentativa falhou e a tarefa voltou para a fila
+    assert ServidorSmtp.mensagens == []
+    with TestingSessionLocal() as db:
+        tarefa_db = db.scalars(select(Tarefas)).one()
+    assert (tarefa_db.estado, tarefa_db.tentativas) == (tarefas.PENDENTE, 1)
+    assert '451' in tarefa_db.erro
+
+    executar_worker()
+    assert len(ServidorSmtp.mensagens) == 1
+    assert ServidorSmtp.conexoes == 2
+
+def test_falha_definitiva(monkeypatch):
+    configurar_servidor(monkeypatch)
+    monkeypatch.setattr(tarefas, 'TAREFAS_TENTATIVAS', 2)
+    monkeypatch.setattr(ServidorSmtp, 'falhas', 2)
+
+    recuperar_senha(cadastrar())
+    executar_worker()
+    executar_worker()
+
+    assert ServidorSmtp.mensagens == []
+    with TestingSessionLocal() as db:
+        tarefa_db = db.scalars(select(Tarefas)).one()
+    assert (tarefa_db.estado, tarefa_db.tentativas) == (tarefas.FALHOU, 2)
+
+def test_template_fora_da_lista(monkeypatch):
+    configurar_servidor(monkeypatch)
+    with TestingSessionLocal() as db:
+        tarefas.enfileirar(db, 'email', {'assunto': 'x', 'para': 'a@b.com', 'template': '../main.py', 'contexto': {}})
+        db.commit()
+
+    executar_worker()
+
+    #Não adianta repetir: a tarefa falha na primeira tentativa
+    assert ServidorSmtp.mensagens == []
+    with TestingSessionLocal() as db:
+        tarefa_db = db.scalars(select(Tarefas)).one()
+    assert (tarefa_db.estado, tarefa_db.tentativas) == (tarefas.FALHOU, 1)
+    assert 'não permitido' in tarefa_db.erro
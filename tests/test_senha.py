@@ -0,0 +1,19 @@
+import asyncio
+from passlib.context import CryptContext
+from app.senha import BCRYPT_ROUNDS, gerar_hash, verificar_senha
+
+def test_verificar_senha():
+    senha_hash = asyncio.run(gerar_hash('senha'))
+
+    assert asyncio.run(verificar_senha('senha', senha_hash)) == (True, None)
+    assert asyncio.run(verificar_senha('errada', senha_hash)) == (False, None)
+    assert asyncio.run(verificar_senha('senha', '')) == (False, None)
+
+def test_rehash_custo_diferente():
+    custo_antigo = 4 if BCRYPT_ROUNDS != 4 else 5
+    senha_hash = CryptContext(schemes=['bcrypt'], bcrypt__rounds=custo_antigo).hash('senha')
+
+    valida, novo_hash = asyncio.run(verificar_senha('senha', senha_hash))
+
+    assert valida
+    assert novo_hash.startswith(f'$2b${BCRYPT_ROUNDS:02d}$')
@@ -0,0 +1,173 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+from app import tarefas
+from app.models import ResumoMensal, Tarefas
+from app.database import SyncSessionAdapter
+from tests.conftest import TestingSessionLocal, cadastrar_despesa, client, faker
+
+executadas = []
+
+@tarefas.tarefa('teste')
+async def tarefa_teste(db, dados):
+    if dados.get('falhar'):
+        raise RuntimeError('falha simulada')
+    executadas.append(dados['nome'])
+
+def limpar_fila():
+    executadas.clear()
+    with TestingSessionLocal() as db:
+        db.execute(delete(Tarefas))
+        db.commit()
+
+def enfileirar(*tarefas_fila):
+    with TestingSessionLocal() as db:
+        for tipo, dados, opcoes in tarefas_fila:
+            tarefas.enfileirar(db, tipo, dados, **opcoes)
+        db.commit()
+
+def com_sessao(funcao, *args):
+    async def executar():
+        db = SyncSessionAdapter(TestingSessionLocal())
+        try:
+            return await funcao(db, *args)
+        finally:
+            await db.close()
+    return asyncio.run(executar())
+
+def buscar_fila():
+    with TestingSessionLocal() as db:
+        return db.scalars(select(Tarefas).order_by(Tarefas.id_tarefa)).all()
+
+def test_prioridade_e_lote():
+    limpar_fila()
+    enfileirar(
+        ('teste', {'nome': 'normal'}, {}),
+        ('teste', {'nome': 'baixa'}, {'prioridade': tarefas.PRIORIDADE_BAIXA}),
+        ('teste', {'nome': 'alta'}, {'prioridade': tarefas.PRIORIDADE_ALTA}),
+        ('teste', {'nome': 'depois'}, {'atraso': 3600}),
+    )
+
+    assert com_sessao(tarefas.processar, 2) == 2
+    assert executadas == ['alta', 'normal']
+
+    #A tarefa com atraso ainda não está disponível
+    assert com_sessao(tarefas.processar, 10) == 1
+    assert executadas == ['alta', 'normal', 'baixa']
+    assert [tarefa.dados for tarefa in buscar_fila()] == ['{"nome": "depois"}']
+
+def test_repeticao_com_espera(monkeypatch):
+    limpar_fila()
+    monkeypatch.setattr(tarefas, 'TAREFAS_ESPERA_TENTATIVA', 60)
+    enfileirar(('teste', {'falhar': True}, {'tentativas': 3}))
+
+    com_sessao(tarefas.processar, 10)
+    tarefa_db, = buscar_fila()
+    assert (tarefa_db.estado, tarefa_db.tentativas, tarefa_db.reserva) == (tarefas.PENDENTE, 1, None)
+    assert 'falha simulada' in tarefa_db.erro
+    assert timedelta(seconds=55) < tarefa_db.disponivel_em - datetime.now() <= timedelta(seconds=60)
+
+    #Antes da espera a tarefa não é executada de novo
+    assert com_sessao(tarefas.processar, 10) == 0
+
+    monkeypatch.setattr(tarefas, 'TAREFAS_ESPERA_TENTATIVA', 0)
+    with TestingSessionLocal() as db:
+        db.execute(update(Tarefas).values(disponivel_em=datetime.now()))
+        db.commit()
+    com_sessao(tarefas.processar, 10)
+    com_sessao(tarefas.processar, 10)
+
+    tarefa_db, = buscar_fila()
+    assert (tarefa_db.estado, tarefa_db.tentativas) == (tarefas.FALHOU, 3)
+    assert com_sessao(tarefas.processar, 10) == 0
+
+def test_espera_exponencial(monkeypatch):
+    monkeypatch.setattr(tarefas, 'TAREFAS_ESPERA_TENTATIVA', 10)
+    monkeypatch.setattr(tarefas, 'TAREFAS_ESPERA_MAXIMA', 60)
+    assert [tarefas.espera_tentativa(tentativa) for tentativa in range(1, 6)] == [10, 20, 40, 60, 60]
+
+def test_tipo_desconhecido_falha_sem_repetir():
+    limpar_fila()
+    enfileirar(('inexistente', {}, {}))
+
+    com_sessao(tarefas.processar, 10)
+    tarefa_db, = buscar_fila()
+    assert (tarefa_db.estado, tarefa_db.tentativas) == (tarefas.FALHOU, 1)
+
+def test_reservas_nao_se_sobrepoem():
+    limpar_fila()
+    enfileirar(*[('teste', {'nome': str(i)}, {}) for i in range(5)])
+
+    #Dois workers reservando ao mesmo tempo, cada um com a sua sessão
+    primeiro = com_sessao(tarefas.reservar, 3)
+    segundo = com_sessao(tarefas.reservar, 3)
+
+    assert len(primeiro) == 3
+    assert len(segundo) == 2
+    assert not {tarefa.id_tarefa for tarefa in primeiro} & {tarefa.id_tarefa for tarefa in segundo}
+    assert com_sessao(tarefas.reservar, 3) == []
+
+def test_reserva_vencida_volta_para_a_fila():
+    limpar_fila()
+    enfileirar(('teste', {'nome': 'retomada'}, {}))
+
+    #Um worker reservou a tarefa e parou sem concluir
+    abandonada, = com_sessao(tarefas.reservar, 10)
+    assert com_sessao(tarefas.reservar, 10) == []
+    with TestingSessionLocal() as db:
+        db.execute(update(Tarefas).values(reservada_ate=datetime.now() - timedelta(seconds=1)))
+        db.commit()
+
+    retomada, = com_sessao(tarefas.reservar, 10)
+    assert retomada.id_tarefa == abandonada.id_tarefa
+    assert retomada.tentativas == 2
+
+    #Se o worker antigo terminar depois, ele não apaga a tarefa reservada pelo outro
+    com_sessao(tarefas.executar, abandonada)
+    tarefa_db, = buscar_fila()
+    assert (tarefa_db.estado, tarefa_db.reserva) == (tarefas.EXECUTANDO, retomada.reserva)
+
+    assert com_sessao(tarefas.executar, retomada) is True
+    assert executadas == ['retomada', 'retomada']
+    assert buscar_fila() == []
+
+def test_estatisticas():
+    limpar_fila()
+    enfileirar(
+        ('teste', {'nome': 'a'}, {'atraso': -30}),
+        ('teste', {'nome': 'b'}, {'atraso': 3600}),
+        ('inexistente', {}, {}),
+    )
+    with TestingSessionLocal() as db:
+        db.execute(update(Tarefas).where(Tarefas.tipo == 'inexistente').values(estado=tarefas.FALHOU))
+        db.commit()
+
+    response = client.post("/auth/cadastro", json={"nome": faker.name(), "email": faker.unique.email(), "senha": faker.password()})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/tarefas/estatisticas").status_code == 401
+
+    data = client.get("/tarefas/estatisticas", headers=headers).json()
+    assert data['pendente'] == 2
+    assert data['falhou'] == 1
+    assert data['executando'] == 0
+    assert data['disponiveis'] == 1
+    assert 30 <= data['espera_maxima'] < 60
+    assert data['tipos'] == {'teste': {'pendente': 2}, 'inexistente': {'falhou': 1}}
+
+def test_recriar_resumo_pela_fila():
+    limpar_fila()
+    response = client.post("/auth/cadastro", json={"nome": faker.name(), "email": faker.unique.email(), "senha": faker.password()})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    id_usuario = client.get("/conta/", headers=headers).json()["id_usuario"]
+    cadastrar_despesa(headers, 25.5, datetime(2024, 3, 10), despesa="Mercado")
+
+    with TestingSessionLocal() as db:
+        db.execute(delete(ResumoMensal).where(ResumoMensal.id_usuario == id_usuario))
+        db.commit()
+    enfileirar(('recriar_resumo', {'id_usuario': id_usuario}, {}))
+
+    assert com_sessao(tarefas.processar, 10) == 1
+    assert buscar_fila() == []
+    with TestingSessionLocal() as db:
+        resumo, = db.scalars(select(ResumoMensal).where(ResumoMensal.id_usuario == id_usuario)).all()
+    assert (resumo.mes, resumo.quantidade, float(resumo.valor)) == (datetime(2024, 3, 1), 1, 25.5)
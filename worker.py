@@ -0,0 +1,84 @@
+"""
+Worker da fila de tarefas (app/tarefas.py), executado ao lado do gunicorn:
+
+    python worker.py                  # executa as tarefas até receber SIGTERM ou SIGINT
+    python worker.py --uma-vez        # executa as tarefas disponíveis e sai
+    python worker.py --estatisticas   # mostra a profundidade da fila
+
+Vários workers podem rodar ao mesmo tempo, em uma ou mais máquinas.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from sqlalchemy.exc import SQLAlchemyError
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import tarefas
+from app.database import AsyncSessionLocal, SessionLocal, SyncSessionAdapter
+from app.cliente_http import fechar_cliente_http
+# Módulos que registram tipos de tarefa
+from app.send_email import fechar_email
+import app.resumo
+
+logger = logging.getLogger('worker')
+
+def nova_sessao():
+    # Mesma escolha de sessão de get_async_db
+    if AsyncSessionLocal is None:
+        return SyncSessionAdapter(SessionLocal())
+    return AsyncSessionLocal()
+
+async def esperar(parar):
+    try:
+        await asyncio.wait_for(parar.wait(), tarefas.TAREFAS_INTERVALO)
+    except asyncio.TimeoutError:
+        pass
+
+async def trabalhar(uma_vez: bool):
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sinal, parar.set)
+
+    try:
+        while not parar.is_set():
+            db = nova_sessao()
+            try:
+                executadas = await tarefas.processar(db)
+            except SQLAlchemyError:
+                # Banco indisponível: tenta de novo depois do intervalo
+                logger.exception('Erro ao acessar a fila de tarefas')
+                executadas = 0
+            finally:
+                await db.close()
+
+            if not executadas:
+                if uma_vez:
+                    break
+                await esperar(parar)
+    finally:
+        await fechar_email()
+        await fechar_cliente_http()
+
+async def mostrar_estatisticas():
+    db = nova_sessao()
+    try:
+        print(json.dumps(await tarefas.estatisticas(db), indent=2))
+    finally:
+        await db.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    parser = argparse.ArgumentParser(description='Executa as tarefas da fila.')
+    parser.add_argument('--uma-vez', action='store_true', help='Sai quando não houver tarefas disponíveis.')
+    parser.add_argument('--estatisticas', action='store_true', help='Mostra a profundidade da fila e sai.')
+    args = parser.parse_args()
+
+    if args.estatisticas:
+        asyncio.run(mostrar_estatisticas())
+    else:
+        asyncio.run(trabalhar(args.uma_vez))